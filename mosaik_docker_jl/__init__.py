@@ -11,6 +11,7 @@ except ImportError:
 
 from .handlers import setup_handlers
 from .execute import Execute
+from .deadlines import DEFAULT_WORKERS
 
 
 def _jupyter_labextension_paths():
@@ -34,9 +35,20 @@ def _load_jupyter_server_extension(server_app):
     server_app: jupyterlab.labapp.LabApp
         JupyterLab application instance
     """
+    # Optional settings, e.g., `c.MosaikDockerJL.warm_pool_size = 2` in `jupyter_server_config.py`.
+    config = server_app.config.get( 'MosaikDockerJL', {} )
+
     exe = Execute(
         contents_manager = server_app.web_app.settings[ 'contents_manager' ],
-        use_rootless_docker = True
+        use_rootless_docker = True,
+        warm_pool_size = config.get( 'warm_pool_size', 0 ),
+        warm_pool_max_idle = config.get( 'warm_pool_max_idle', 600. ),
+        build_context_warn_size = config.get( 'build_context_warn_size', 100 * 1024 * 1024 ),
+        image_cache_max_size = config.get( 'image_cache_max_size', 0 ),
+        deadlines = config.get( 'deadlines', None ),
+        status_max_age = config.get( 'status_max_age', 2. ),
+        workers = config.get( 'workers', DEFAULT_WORKERS ),
+        default_ignore_rules = config.get( 'default_ignore_rules', False )
     )
 
     server_app.web_app.settings[ 'exe' ] = exe
@@ -44,3 +56,16 @@ def _load_jupyter_server_extension(server_app):
 
     setup_handlers(server_app.web_app)
     server_app.log.info(f'Registered {__module_name__} (version {__version__}) server extension')
+
+
+def _unload_jupyter_server_extension(server_app):
+    """Finishes pending background tasks of the server extension (e.g., writing the run history).
+
+    Parameters
+    ----------
+    server_app: jupyterlab.labapp.LabApp
+        JupyterLab application instance
+    """
+    exe = server_app.web_app.settings.get( 'exe' )
+    if exe is not None:
+        exe.close()
@@ -0,0 +1,580 @@
+'''
+Module for computing and streaming the build context of the mosaik orchestrator image
+'''
+import collections
+import concurrent.futures
+import io
+import os
+import pathlib
+import posixpath
+import re
+import subprocess
+import tarfile
+import threading
+
+from mosaik_docker.util.config_data import ConfigData as MDConfigData
+from mosaik_docker._config import ORCH_CONTEXT_DIR_NAME as MD_ORCH_CONTEXT_DIR_NAME
+from mosaik_docker._config import ORCH_CONTEXT_EXTRA_DIR_NAME as MD_ORCH_CONTEXT_EXTRA_DIR_NAME
+from mosaik_docker._config import ORCH_IMAGE_NAME_TEMPLATE as MD_ORCH_IMAGE_NAME_TEMPLATE
+
+
+# Ignore rules for caches and version control, only applied if enabled in the configuration
+# (`c.MosaikDockerJL.default_ignore_rules = True`).
+DEFAULT_IGNORE_RULES = (
+    '**/__pycache__',
+    '**/*.pyc',
+    '**/.ipynb_checkpoints',
+    '**/.git',
+    '**/.DS_Store',
+)
+
+# Ignore rules that are always applied (files created by mosaik-docker).
+REQUIRED_IGNORE_RULES = (
+    MD_ORCH_CONTEXT_DIR_NAME,
+)
+
+# Name of the file in the simulation setup directory with additional ignore rules.
+IGNORE_FILE_NAME = '.dockerignore'
+
+# Name of the Dockerfile within the build context.
+CONTEXT_DOCKER_FILE_NAME = '.mosaik-docker-jl.Dockerfile'
+
+# Ignore file within the build context. It excludes the Dockerfile and itself from instructions
+# like `COPY . ...` (Docker still reads both), such that the image is the same as one built by mosaik-docker.
+CONTEXT_IGNORE_FILE_NAME = '.dockerignore'
+
+# Maximum number of ignored paths listed in the build output.
+MAX_REPORTED_IGNORED_PATHS = 50
+
+# Files up to this size are read in parallel ahead of being added to the build context.
+PREFETCH_MAX_FILE_SIZE = 4 * 1024 * 1024
+
+# Maximum amount of data read ahead of being added to the build context.
+PREFETCH_MAX_BUFFER_SIZE = 64 * 1024 * 1024
+
+
+class IgnoreRules:
+    '''
+    Ignore rules for the build context, following the rules of `.dockerignore` files:
+    one pattern per line, empty lines and lines starting with '#' are skipped, patterns
+    starting with '!' re-include previously ignored paths and the last matching pattern wins.
+
+    Like Docker, patterns are cleaned (e.g., './data/' becomes 'data'), a leading slash is
+    removed and patterns are matched against complete paths relative to the simulation setup
+    directory (i.e., '*.log' only matches files at the top level, use '**/*.log' to match
+    files at any depth). Besides the wildcards of Go's `filepath.Match` ('*', '?' and
+    character classes), '**' matches any number of directories, including none. A path is
+    also ignored if one of its parent directories matches a pattern.
+    '''
+
+    def __init__( self, rules ):
+        '''
+        :param rules: ignore patterns (list of strings)
+        '''
+        self.rules = []
+        for rule in rules:
+            rule = rule.strip()
+            if not rule or rule.startswith( '#' ):
+                continue
+            negate = rule.startswith( '!' )
+            pattern = posixpath.normpath( rule[1:].strip() if negate else rule ).lstrip( '/' )
+            if pattern and pattern != '.':
+                self.rules.append( ( _compile_pattern( pattern ), negate ) )
+
+
+    @property
+    def has_exceptions( self ):
+        '''
+        True if there are patterns re-including previously ignored paths.
+        '''
+        return any( negate for _, negate in self.rules )
+
+
+    def ignored( self, rel_path ):
+        '''
+        Check if a path is ignored.
+
+        :param rel_path: path relative to the simulation setup directory, using '/' as separator (string)
+        :return: True if the path is ignored (boolean)
+        '''
+        parts = rel_path.split( '/' )
+        paths = [ '/'.join( parts[:i] ) for i in range( len( parts ), 0, -1 ) ]
+        ignored = False
+        for regex, negate in self.rules:
+            # The pattern matches the path itself or one of its parent directories.
+            if any( regex.fullmatch( p ) is not None for p in paths ):
+                ignored = not negate
+        return ignored
+
+
+def _compile_pattern( pattern ):
+    '''
+    Translate an ignore pattern into a regular expression (same as Docker's pattern matcher).
+    '''
+    regex = ''
+    i = 0
+    while i < len( pattern ):
+        c = pattern[i]
+        if '*' == c:
+            if pattern[i + 1:i + 2] == '*':
+                # Pattern '**' (optionally followed by a slash) matches any number of directories.
+                i += 1
+                if pattern[i + 1:i + 2] == '/':
+                    i += 1
+                regex += '.*' if i + 1 == len( pattern ) else '(.*/)?'
+            else:
+                regex += '[^/]*'
+        elif '?' == c:
+            regex += '[^/]'
+        elif '[' == c:
+            end = pattern.find( ']', i + 2 )
+            if end < 0:
+                regex += re.escape( c )
+            else:
+                cls = pattern[i + 1:end]
+                regex += '[' + ( '^' + cls[1:] if cls.startswith( ( '!', '^' ) ) else cls ).replace( '\\', '\\\\' ) + ']'
+                i = end
+        elif '\\' == c and i + 1 < len( pattern ):
+            i += 1
+            regex += re.escape( pattern[i] )
+        else:
+            regex += re.escape( c )
+        i += 1
+
+    return re.compile( regex, re.DOTALL )
+
+
+def read_ignore_rules( setup_dir, sim_ids = (), default_rules = False ):
+    '''
+    Retrieve the ignore rules of a simulation setup: the required rules, the default rules (if enabled),
+    the directories with simulation results and the rules from the setup's `.dockerignore` file (if any).
+
+    :param setup_dir: path to simulation setup (string)
+    :param sim_ids: IDs of the setup's simulations, whose result directories are ignored (list of strings)
+    :param default_rules: apply the default rules for caches and version control (boolean)
+    :return: ignore rules (list of strings)
+    '''
+    rules = list( REQUIRED_IGNORE_RULES )
+    if default_rules:
+        rules.extend( DEFAULT_IGNORE_RULES )
+    rules.extend( '/{}'.format( id ) for id in sim_ids )
+
+    ignore_file = os.path.join( setup_dir, IGNORE_FILE_NAME )
+    if os.path.isfile( ignore_file ):
+        with open( ignore_file, 'r' ) as f:
+            rules.extend( f.read().splitlines() )
+
+    return rules
+
+
+class BuildContext:
+    '''
+    The effective build context of a simulation setup's orchestrator image.
+
+    The layout of the build context is the same as the one created by mosaik-docker
+    (the scenario file at the top level and all extra files and directories in
+    sub-directory 'extra'), but files matching the ignore rules are left out and the
+    context is streamed directly to the Docker daemon instead of being copied first.
+    '''
+
+    def __init__( self, setup_dir, default_rules = False ):
+        '''
+        Compute the build context from the simulation setup configuration.
+
+        :param setup_dir: path to simulation setup (string)
+        :param default_rules: apply the default ignore rules for caches and version control (boolean)
+        '''
+        config_data = MDConfigData( setup_dir )
+        self.setup_dir = pathlib.Path( setup_dir ).resolve( strict = True )
+
+        # Retrieve data from config file.
+        self.sim_setup_id = config_data['id'].strip()
+        config_data_orch = config_data['orchestrator']
+        self.scenario_file = config_data_orch['scenario_file'].strip()
+        self.docker_file = config_data_orch['docker_file'].strip()
+        extra_files = [ f.strip() for f in config_data_orch['extra_files'] ]
+        extra_dirs = [ d.strip() for d in config_data_orch['extra_dirs'] ]
+
+        self.docker_file_path = pathlib.Path( self.setup_dir, self.docker_file ).resolve( strict = True )
+
+        self.rules = read_ignore_rules( self.setup_dir, config_data['sim_ids_up'] + config_data['sim_ids_down'], default_rules )
+        self._ignore_rules = IgnoreRules( self.rules )
+
+        self.files = [] # Tuples (source path, path within build context, size).
+        self.dirs = [] # Tuples (source path, path within build context).
+        self.entries = []
+        self.ignored_files = 0
+        self.ignored_size = 0
+
+        self._add_file( 'scenario_file', self.scenario_file, '' )
+        for f in extra_files:
+            self._add_file( 'extra_file', f, MD_ORCH_CONTEXT_EXTRA_DIR_NAME )
+        for d in extra_dirs:
+            self._add_dir( d )
+
+        self.size = sum( e[ 'size' ] for e in self.entries )
+
+
+    def summary( self, max_files = 20 ):
+        '''
+        Summary of the build context.
+
+        :param max_files: number of largest files listed per entry (int)
+        :return: summary in the following format:
+            {
+              'size': total size of all files in the build context (int, bytes)
+              'files': number of files in the build context (int)
+              'ignored_size': total size of all ignored files (int, bytes)
+              'ignored_files': number of ignored files (int)
+              'rules': effective ignore rules (list of strings)
+              'entries': [ {
+                  'type': 'scenario_file', 'extra_file' or 'extra_dir' (string)
+                  'path': path as specified in the simulation setup configuration (string)
+                  'size': total size of all files of this entry (int, bytes)
+                  'files': number of files of this entry (int)
+                  'ignored_size': total size of all ignored files of this entry (int, bytes)
+                  'ignored_files': number of ignored files of this entry (int)
+                  'largest': [ { 'path': string, 'size': int } ] largest files of this entry
+                  'ignored': [ string ] ignored paths of this entry, relative to the simulation setup directory
+                    (ignored directories end with a slash, at most `max_files` paths)
+                } ]
+            }
+        '''
+        entries = []
+        for e in self.entries:
+            entry = { k: v for k, v in e.items() if k not in ( 'largest', 'ignored' ) }
+            entry[ 'largest' ] = [
+                dict( path = p, size = s ) for s, p in sorted( e[ 'largest' ], reverse = True )[:max_files]
+            ]
+            entry[ 'ignored' ] = e[ 'ignored' ][:max_files]
+            entries.append( entry )
+
+        return dict(
+            size = self.size,
+            files = len( self.files ),
+            ignored_size = self.ignored_size,
+            ignored_files = self.ignored_files,
+            rules = self.rules,
+            entries = entries
+        )
+
+
+    def ignored_paths( self ):
+        '''
+        :return: all ignored paths, relative to the simulation setup directory (list of strings, ignored directories end with a slash)
+        '''
+        return [ path for e in self.entries for path in e[ 'ignored' ] ]
+
+
+    def write( self, fileobj, max_workers = 8 ):
+        '''
+        Write the build context as tar archive to a stream. Small files are read in parallel
+        ahead of being written, large files are streamed directly from disk.
+
+        :param fileobj: writable binary stream
+        :param max_workers: maximum number of files read in parallel (int)
+        '''
+        with tarfile.open( fileobj = fileobj, mode = 'w|', format = tarfile.PAX_FORMAT ) as tar:
+            _add_to_tar( tar, str( self.docker_file_path ), CONTEXT_DOCKER_FILE_NAME )
+
+            ignore = '{}\n{}\n'.format( CONTEXT_DOCKER_FILE_NAME, CONTEXT_IGNORE_FILE_NAME ).encode( 'utf-8' )
+            _add_data_to_tar( tar, CONTEXT_IGNORE_FILE_NAME, ignore, os.stat( self.docker_file_path ).st_mtime )
+
+            for path, arcname in self.dirs:
+                _add_dir_to_tar( tar, path, arcname )
+
+            for path, arcname, data in _prefetch( self.files, max_workers ):
+                _add_to_tar( tar, path, arcname, data )
+
+
+    def _add_file( self, type, file, arc_dir ):
+        '''
+        Add a single file to the build context.
+        '''
+        path = pathlib.Path( self.setup_dir, file ).resolve( strict = True )
+        if not path.is_file():
+            raise Exception( 'not a file: {}'.format( file ) )
+
+        size = path.stat().st_size
+        arcname = '/'.join( p for p in ( arc_dir, path.name ) if p )
+        self.files.append( ( str( path ), arcname, size ) )
+        self.entries.append( dict(
+            type = type, path = file, size = size, files = 1,
+            ignored_size = 0, ignored_files = 0, largest = [ ( size, arcname ) ], ignored = []
+        ) )
+
+
+    def _add_dir( self, dir ):
+        '''
+        Add all files of a directory to the build context, except for ignored ones.
+        '''
+        path = pathlib.Path( self.setup_dir, dir ).resolve( strict = True )
+        if not path.is_dir():
+            raise Exception( 'not a directory: {}'.format( dir ) )
+
+        entry = dict(
+            type = 'extra_dir', path = dir, size = 0, files = 0,
+            ignored_size = 0, ignored_files = 0, largest = [], ignored = []
+        )
+        arc_dir = '{}/{}'.format( MD_ORCH_CONTEXT_EXTRA_DIR_NAME, path.name )
+
+        # Ignore rules refer to paths relative to the simulation setup directory (if possible).
+        try:
+            rel_dir = path.relative_to( self.setup_dir ).as_posix()
+        except ValueError:
+            rel_dir = path.name
+
+        # Directories are added as well, such that empty directories are part of the build context.
+        self.dirs.append( ( str( path ), arc_dir ) )
+
+        # Ignored directories are only searched if files within them may be re-included.
+        search_ignored = self._ignore_rules.has_exceptions
+
+        # Like mosaik-docker, symbolic links are followed.
+        for root, dirs, files in os.walk( path, followlinks = True ):
+            rel_root = os.path.relpath( root, path ).replace( os.sep, '/' )
+            rel_root = '' if rel_root == '.' else rel_root + '/'
+
+            kept = []
+            for d in sorted( dirs ):
+                if not self._ignore_rules.ignored( _join( rel_dir, rel_root + d ) ):
+                    self.dirs.append( ( os.path.join( root, d ), arc_dir + '/' + rel_root + d ) )
+                    kept.append( d )
+                elif search_ignored:
+                    kept.append( d )
+                else:
+                    ignored = _dir_size( os.path.join( root, d ) )
+                    entry[ 'ignored_files' ] += ignored[0]
+                    entry[ 'ignored_size' ] += ignored[1]
+                    entry[ 'ignored' ].append( _join( rel_dir, rel_root + d ) + '/' )
+            dirs[:] = kept
+
+            for f in sorted( files ):
+                file_path = os.path.join( root, f )
+                try:
+                    size = os.stat( file_path ).st_size
+                except OSError:
+                    continue # Broken symbolic link.
+
+                if self._ignore_rules.ignored( _join( rel_dir, rel_root + f ) ):
+                    entry[ 'ignored_files' ] += 1
+                    entry[ 'ignored_size' ] += size
+                    entry[ 'ignored' ].append( _join( rel_dir, rel_root + f ) )
+                    continue
+
+                arcname = arc_dir + '/' + rel_root + f
+                self.files.append( ( file_path, arcname, size ) )
+                entry[ 'files' ] += 1
+                entry[ 'size' ] += size
+                entry[ 'largest' ].append( ( size, arcname ) )
+
+        self.ignored_files += entry[ 'ignored_files' ]
+        self.ignored_size += entry[ 'ignored_size' ]
+        self.entries.append( entry )
+
+
+def build_sim_setup( setup_dir, out_stream, docker_host, max_workers = 8, default_rules = False ):
+    '''
+    Build simulation setup as preparation for running the simulation.
+    Same as command `build_sim_setup` of mosaik-docker, but the minimal build context
+    is streamed to the Docker daemon instead of copying all resources beforehand.
+
+    :param setup_dir: path to simulation setup (string)
+    :param out_stream: output from the build process to stderr will be piped to this stream (callable)
+    :param docker_host: URL to the daemon socket to connect to when running docker
+    :param max_workers: maximum number of files read in parallel (int)
+    :param default_rules: apply the default ignore rules for caches and version control (boolean)
+    :return: return dict with status of build process:
+        {
+            'valid': flag indicating if build succeded (boolean)
+            'status': detailed status message (string)
+        }
+    '''
+    if not callable( out_stream ):
+        raise TypeError( 'Parameter \'out_stream\' must be callable' )
+
+    try:
+        context = BuildContext( setup_dir, default_rules )
+
+        out_stream( 'build context: {} in {} files ({} in {} files ignored)\n'.format(
+            format_size( context.size ), len( context.files ),
+            format_size( context.ignored_size ), context.ignored_files
+        ) )
+        ignored = context.ignored_paths()
+        for path in ignored[:MAX_REPORTED_IGNORED_PATHS]:
+            out_stream( 'ignored: {}\n'.format( path ) )
+        if len( ignored ) > MAX_REPORTED_IGNORED_PATHS:
+            out_stream( 'ignored: ... ({} more)\n'.format( len( ignored ) - MAX_REPORTED_IGNORED_PATHS ) )
+
+        # Define Docker image name.
+        docker_image_name = MD_ORCH_IMAGE_NAME_TEMPLATE.format( context.sim_setup_id.lower() )
+
+        cmd = [
+            'docker', 'build', # Docker build command.
+            '--progress', 'plain', # Set type of progress output to show container output.
+            '-t', docker_image_name, # Specify image name.
+            '--build-arg', 'SCENARIO_FILE={}'.format( context.scenario_file ), # Specify scenario file.
+            '--build-arg', 'EXTRA={}'.format( MD_ORCH_CONTEXT_EXTRA_DIR_NAME ), # Specify directory with extra files and directories.
+            '-f', CONTEXT_DOCKER_FILE_NAME, # Specify the Dockerfile (within the build context).
+            '-' # Read the build context from stdin.
+        ]
+
+        p = subprocess.Popen(
+            cmd,
+            env = dict( DOCKER_HOST = docker_host ),
+            stdin = subprocess.PIPE,
+            stdout = subprocess.DEVNULL,
+            stderr = subprocess.PIPE
+        )
+
+        # Write the build context from a separate thread, the build output is streamed meanwhile.
+        write_error = []
+        def write_context():
+            try:
+                context.write( p.stdin, max_workers )
+            except BrokenPipeError:
+                pass # The build process has terminated, its output tells why.
+            except Exception as err:
+                write_error.append( err )
+                p.kill()
+            finally:
+                try:
+                    p.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        writer = threading.Thread( target = write_context, daemon = True )
+        writer.start()
+
+        err_lines = collections.deque( maxlen = 20 )
+        for line in p.stderr:
+            line = line.decode( 'utf-8', errors = 'replace' )
+            err_lines.append( line )
+            out_stream( line )
+
+        return_code = p.wait()
+        writer.join()
+
+        if write_error:
+            raise write_error[0]
+        if 0 != return_code:
+            raise Exception( ''.join( err_lines ).strip() )
+
+    except Exception as err:
+        return dict(
+            valid = False,
+            status = 'building simulation setup failed:\n{}\nrun "check_sim_setup" for details'.format( err )
+        )
+
+    return dict(
+        valid = True,
+        status = 'building simulation setup succeeded: {}'.format( context.setup_dir )
+    )
+
+
+def format_size( size ):
+    '''
+    Format a size in bytes for display.
+    '''
+    for unit in ( 'B', 'KiB', 'MiB', 'GiB' ):
+        if size < 1024 or unit == 'GiB':
+            return '{:.0f} {}'.format( size, unit ) if unit == 'B' else '{:.1f} {}'.format( size, unit )
+        size /= 1024
+
+
+def _join( rel_dir, rel_path ):
+    '''
+    Join relative paths, using '/' as separator.
+    '''
+    return rel_path if rel_dir in ( '', '.' ) else rel_dir + '/' + rel_path
+
+
+def _dir_size( path ):
+    '''
+    Number of files and total size of a directory.
+    '''
+    files = 0
+    size = 0
+    for root, _, names in os.walk( path, followlinks = True ):
+        for name in names:
+            try:
+                size += os.stat( os.path.join( root, name ) ).st_size
+                files += 1
+            except OSError:
+                pass
+    return ( files, size )
+
+
+def _read_file( path ):
+    with open( path, 'rb' ) as f:
+        return f.read()
+
+
+def _prefetch( files, max_workers ):
+    '''
+    Iterate over files in order, reading small files in parallel ahead of time
+    (bounded by the maximum buffer size). Large files are not read ahead.
+
+    :return: generator of tuples (source path, path within build context, file content or None)
+    '''
+    with concurrent.futures.ThreadPoolExecutor( max_workers = max_workers ) as pool:
+        pending = collections.deque()
+        buffered = 0
+        next_index = 0
+
+        for path, arcname, size in files:
+            # Schedule reads of upcoming small files.
+            while next_index < len( files ) and buffered < PREFETCH_MAX_BUFFER_SIZE:
+                p, _, s = files[ next_index ]
+                future = pool.submit( _read_file, p ) if s <= PREFETCH_MAX_FILE_SIZE else None
+                pending.append( ( future, s if future is not None else 0 ) )
+                buffered += pending[-1][1]
+                next_index += 1
+
+            future, buffered_size = pending.popleft()
+            buffered -= buffered_size
+            yield ( path, arcname, future.result() if future is not None else None )
+
+
+def _add_dir_to_tar( tar, path, arcname ):
+    '''
+    Add a directory entry (without contents) to a tar archive (symbolic links are followed, ownership is reset).
+    '''
+    st = os.stat( path )
+
+    info = tarfile.TarInfo( arcname )
+    info.type = tarfile.DIRTYPE
+    info.mode = st.st_mode & 0o7777
+    info.mtime = st.st_mtime
+    tar.addfile( info )
+
+
+def _add_data_to_tar( tar, arcname, data, mtime ):
+    '''
+    Add a file that does not exist on disk to a tar archive.
+    '''
+    info = tarfile.TarInfo( arcname )
+    info.mode = 0o644
+    info.mtime = mtime
+    info.size = len( data )
+    tar.addfile( info, io.BytesIO( data ) )
+
+
+def _add_to_tar( tar, path, arcname, data = None ):
+    '''
+    Add a file to a tar archive (symbolic links are followed, ownership is reset).
+    '''
+    st = os.stat( path )
+
+    info = tarfile.TarInfo( arcname )
+    info.mode = st.st_mode & 0o7777
+    info.mtime = st.st_mtime
+
+    if data is not None:
+        info.size = len( data )
+        tar.addfile( info, io.BytesIO( data ) )
+    else:
+        with open( path, 'rb' ) as f:
+            info.size = os.fstat( f.fileno() ).st_size
+            tar.addfile( info, f )
+
@@ -0,0 +1,455 @@
+'''
+Module for multiplexing commands and event streams over a single connection
+'''
+import asyncio
+import collections
+import json
+import threading
+
+from .deadlines import run_command, get_deadline, aborted_response, CommandAborted
+
+
+# Number of events a subscriber may receive without acknowledging them, unless specified otherwise.
+DEFAULT_CREDIT = 64
+
+# Maximum number of events buffered per subscription before the producer is paused.
+MAX_BUFFERED_EVENTS = 256
+
+# Default and minimum interval for polling the simulation status (seconds).
+DEFAULT_STATUS_INTERVAL = 2.
+MIN_STATUS_INTERVAL = 0.5
+
+
+class Channel:
+    '''
+    Protocol for carrying commands and event streams over a single message-based connection.
+    All messages are JSON objects with a 'type' and an 'id' chosen by the client, which
+    associates responses and events with the request or subscription they belong to.
+
+    Client messages:
+        { 'type': 'request', 'id': id, 'command': command name, 'data': command input (see handlers), 'deadline': seconds (optional) }
+        { 'type': 'cancel', 'id': id } (cancel a request)
+        { 'type': 'subscribe', 'id': id, 'stream': 'build', 'status' or 'logs', 'data': stream input, 'credit': int }
+        { 'type': 'ack', 'id': id, 'credit': number of further events the client is ready to receive }
+        { 'type': 'unsubscribe', 'id': id }
+
+    Server messages:
+        { 'type': 'response', 'id': id, 'response': command response }
+        { 'type': 'event', 'id': id, 'data': event data }
+        { 'type': 'end', 'id': id, 'response': final response of the stream (if any) }
+        { 'type': 'error', 'id': id, 'error': error message } (invalid client message)
+
+    IDs are strings or integers. Messages that are not JSON objects or have an invalid ID, requests
+    and subscriptions with data that is not a JSON object, and requests reusing the ID of a pending
+    request are rejected with an error message.
+
+    Subscriptions with invalid credit (in the subscription or an acknowledgement) are ended with
+    a response with code 1.
+
+    Commands are subject to deadlines (see module `deadlines`). A client may request a shorter deadline
+    than the configured one. Commands that exceed their deadline or are cancelled are aborted and
+    answered with code 3 (deadline exceeded) or 4 (cancelled).
+
+    Flow control is applied per subscription: the server only sends as many events as the client
+    has granted credit for (initially with the subscription, later with acknowledgements).
+    Events that cannot be sent are buffered. If the buffer is full, the stream's producer is
+    paused (build and log output) or intermediate updates are skipped (status changes).
+    '''
+
+    def __init__( self, exe, commands, streams, send ):
+        '''
+        :param exe: instance of class `Execute`
+        :param commands: dict mapping command names to tuples (function( exe, data ), setup dir key or None)
+        :param streams: dict mapping stream names to stream classes (see class `Subscription`)
+        :param send: coroutine function for sending a message (dict) to the client
+        '''
+        self.exe = exe
+        self._commands = commands
+        self._streams = streams
+        self._send = send
+        self._subscriptions = {}
+        self._pending = {}
+        self._tasks = set()
+
+
+    def on_message( self, message ):
+        '''
+        Handle a message from the client (returns immediately, commands and streams run in the background).
+
+        :param message: client message (decoded JSON)
+        '''
+        if not isinstance( message, dict ):
+            return self._spawn( self._error( None, 'invalid message: expected an object' ) )
+
+        type = message.get( 'type' )
+        id = message.get( 'id' )
+        if isinstance( id, bool ) or not isinstance( id, ( str, int ) ):
+            return self._spawn( self._error( None, 'invalid message ID: {}'.format( json.dumps( id ) ) ) )
+
+        data = message.get( 'data' )
+        if data is None:
+            data = {}
+        if type in ( 'request', 'subscribe' ) and not isinstance( data, dict ):
+            return self._spawn( self._error( id, 'invalid message data: expected an object' ) )
+
+        if 'request' == type:
+            if id in self._pending:
+                return self._spawn( self._error( id, 'duplicate request ID: {}'.format( id ) ) )
+            cancelled = self._pending[ id ] = asyncio.Event()
+            self._spawn( self._request( id, message.get( 'command' ), data, message.get( 'deadline' ), cancelled ) )
+
+        elif 'cancel' == type:
+            cancelled = self._pending.get( id )
+            if cancelled is not None:
+                cancelled.set()
+
+        elif 'subscribe' == type:
+            stream = self._streams.get( message.get( 'stream' ) )
+            if stream is None or id in self._subscriptions:
+                return self._spawn( self._error( id, 'invalid subscription: {}'.format( message.get( 'stream' ) ) ) )
+
+            credit = _get_credit( message, DEFAULT_CREDIT )
+            if credit is None:
+                return self._spawn( self._end( id, dict( code = 1, error = 'invalid credit: {}'.format( message.get( 'credit' ) ) ) ) )
+
+            sub = stream( self, id, data, credit )
+            self._subscriptions[ id ] = sub
+            self._spawn( self._run_subscription( sub ) )
+
+        elif 'ack' == type:
+            sub = self._subscriptions.get( id )
+            if sub is not None:
+                credit = _get_credit( message, 0 )
+                if credit is None:
+                    sub.fail( dict( code = 1, error = 'invalid credit: {}'.format( message.get( 'credit' ) ) ) )
+                else:
+                    sub.grant( credit )
+
+        elif 'unsubscribe' == type:
+            sub = self._subscriptions.get( id )
+            if sub is not None:
+                sub.cancel()
+
+        else:
+            self._spawn( self._error( id, 'invalid message type: {}'.format( type ) ) )
+
+
+    def close( self ):
+        '''
+        Cancel all requests and subscriptions (e.g., because the connection has been closed).
+        '''
+        for cancelled in list( self._pending.values() ):
+            cancelled.set()
+        for sub in list( self._subscriptions.values() ):
+            sub.cancel()
+
+
+    async def run( self, command, fn, dir = None, deadline = None, cancelled = None ):
+        '''
+        Run a blocking function in a worker thread, subject to the deadline of a command.
+
+        :param command: command name, determines the deadline (string)
+        :param fn: function to be executed (callable without arguments)
+        :param dir: path to the simulation setup affected by the command, see `run_command` (string)
+        :param deadline: deadline requested by the client (float, seconds)
+        :param cancelled: the function is aborted as soon as this event is set (asyncio.Event)
+        :raises CommandAborted: if the deadline has expired or the command has been cancelled
+        '''
+        return await run_command(
+            fn, get_deadline( self.exe.deadlines, command, deadline ), cancelled, dir, command, self.exe.executor
+        )
+
+
+    async def send( self, message ):
+        '''
+        Send a message to the client (errors due to a closed connection are ignored).
+        '''
+        try:
+            await self._send( message )
+        except Exception:
+            self.close()
+
+
+    def _spawn( self, coro ):
+        task = asyncio.ensure_future( coro )
+        self._tasks.add( task )
+        task.add_done_callback( self._tasks.discard )
+
+
+    async def _error( self, id, error ):
+        await self.send( dict( type = 'error', id = id, error = error ) )
+
+
+    async def _end( self, id, response ):
+        await self.send( dict( type = 'end', id = id, response = response ) )
+
+
+    async def _request( self, id, command, data, deadline, cancelled ):
+        '''
+        Execute a command and send back its response.
+        '''
+        try:
+            if command not in self._commands:
+                return await self._error( id, 'unknown command: {}'.format( command ) )
+
+            fn, dir_key = self._commands[ command ]
+
+            try:
+                dir = ( data.get( dir_key ) or '.' ) if dir_key is not None else None
+                response = await self.run( command, lambda: fn( self.exe, data ), dir, deadline, cancelled )
+            except CommandAborted as err:
+                response = aborted_response( err )
+            except Exception as err:
+                response = dict( code = 2, error = str( err ) )
+
+            await self.send( dict( type = 'response', id = id, response = response ) )
+
+        finally:
+            self._pending.pop( id, None )
+
+
+    async def _run_subscription( self, sub ):
+        '''
+        Run a subscription's producer and deliver its events until the stream ends or is cancelled.
+        '''
+        producer = asyncio.ensure_future( sub.produce() )
+        try:
+            await sub.deliver()
+            response = await producer
+        except Exception as err:
+            response = dict( code = 2, error = str( err ) )
+        finally:
+            sub.cancel()
+            if not producer.done():
+                await asyncio.wait( [ producer ] )
+            self._subscriptions.pop( sub.id, None )
+
+        await self._end( sub.id, sub.failure if sub.failure is not None else response )
+
+
+def _get_credit( message, default ):
+    '''
+    :return: credit of a client message (non-negative int) or None if it is invalid
+    '''
+    try:
+        credit = int( message.get( 'credit', default ) )
+    except ( TypeError, ValueError ):
+        return None
+    return credit if credit >= 0 else None
+
+
+class Subscription:
+    '''
+    Base class for event streams. Subclasses implement coroutine `produce`, which generates
+    events with `put` (from the event loop) or `put_threadsafe` (from worker threads) until
+    the stream ends or is cancelled, and returns the final response of the stream.
+    '''
+
+    def __init__( self, channel, id, data, credit ):
+        self.channel = channel
+        self.exe = channel.exe
+        self.id = id
+        self.data = data
+        self.credit = credit
+        self.cancelled = threading.Event()
+        self.aborted = asyncio.Event() # Same as `cancelled`, for aborting commands.
+        self.failure = None # Final response if the subscription has failed due to an invalid client message.
+        self._loop = asyncio.get_running_loop()
+        self._buffer = collections.deque()
+        self._finished = False
+        self._changed = asyncio.Event()
+
+
+    async def produce( self ):
+        raise NotImplementedError
+
+
+    def grant( self, credit ):
+        '''
+        Grant further credit (number of events the client is ready to receive).
+        '''
+        self.credit += credit
+        self._changed.set()
+
+
+    def cancel( self ):
+        '''
+        Cancel the subscription (buffered events are discarded).
+        '''
+        self.cancelled.set()
+        self.aborted.set()
+        self._buffer.clear()
+        self._changed.set()
+
+
+    def fail( self, response ):
+        '''
+        End the subscription due to an invalid client message.
+
+        :param response: final response of the stream (dict)
+        '''
+        self.failure = response
+        self.cancel()
+
+
+    async def put( self, event ):
+        '''
+        Add an event to the stream. Waits while the buffer is full.
+
+        :return: False if the subscription has been cancelled, True otherwise
+        '''
+        while len( self._buffer ) >= MAX_BUFFERED_EVENTS and not self.cancelled.is_set():
+            self._changed.clear()
+            await self._changed.wait()
+
+        if self.cancelled.is_set():
+            return False
+
+        self._buffer.append( event )
+        self._changed.set()
+        return True
+
+
+    def put_threadsafe( self, event ):
+        '''
+        Add an event to the stream from a worker thread. Blocks while the buffer is full.
+
+        :return: False if the subscription has been cancelled, True otherwise
+        '''
+        if self.cancelled.is_set():
+            return False
+        return asyncio.run_coroutine_threadsafe( self.put( event ), self._loop ).result()
+
+
+    def replace( self, event ):
+        '''
+        Replace all undelivered events with a new one (for streams of which only the latest state matters).
+        '''
+        self._buffer.clear()
+        self._buffer.append( event )
+        self._changed.set()
+
+
+    def finish( self ):
+        '''
+        Mark the end of the stream (buffered events are still delivered).
+        '''
+        self._finished = True
+        self._changed.set()
+
+
+    @property
+    def pending( self ):
+        '''
+        True if there are undelivered events.
+        '''
+        return len( self._buffer ) > 0
+
+
+    async def deliver( self ):
+        '''
+        Send buffered events to the client as long as there is credit.
+        '''
+        while not self.cancelled.is_set():
+            if self._buffer and self.credit > 0:
+                event = self._buffer.popleft()
+                self.credit -= 1
+                self._changed.set()
+                await self.channel.send( dict( type = 'event', id = self.id, data = event ) )
+            elif self._finished and not self._buffer:
+                return
+            else:
+                self._changed.clear()
+                await self._changed.wait()
+
+
+class BuildStream( Subscription ):
+    '''
+    Stream of the output of command `build_sim_setup`. Unsubscribing aborts the build.
+
+    Input format:
+        {
+          'dir': 'directory of the simulation setup'
+        }
+    '''
+
+    async def produce( self ):
+        dir = self.data.get( 'dir' ) or '.'
+
+        try:
+            return await self.channel.run(
+                'build_sim_setup', lambda: self.exe.build_sim_setup( dir, self.put_threadsafe ), dir, cancelled = self.aborted
+            )
+        except CommandAborted as err:
+            return aborted_response( err )
+        finally:
+            self.finish()
+
+
+class StatusStream( Subscription ):
+    '''
+    Stream of changes of the simulation status (see command `get_sim_status` in delta mode).
+    The first event contains the complete status, subsequent events only the changes since
+    the previous event. Changes are accumulated while the client has no credit left.
+
+    Input format:
+        {
+          'dir': 'directory of the simulation setup',
+          'interval': polling interval (seconds)
+        }
+    '''
+
+    async def produce( self ):
+        dir = self.data.get( 'dir' ) or '.'
+        interval = max( MIN_STATUS_INTERVAL, float( self.data.get( 'interval', DEFAULT_STATUS_INTERVAL ) ) )
+        version = None
+
+        try:
+            while not self.cancelled.is_set():
+                # Only poll if the client can receive the next update.
+                if not self.pending:
+                    response = await self.channel.run(
+                        'get_sim_status', lambda: self.exe.get_sim_status( dir, since_version = version ), dir, cancelled = self.aborted
+                    )
+                    if 0 != response[ 'code' ]:
+                        return response
+
+                    # Send only the changes since the version of the previous event.
+                    if response[ 'version' ] != version:
+                        event = dict( response[ 'message' ], version = response[ 'version' ] )
+                        version = response[ 'version' ]
+                        self.replace( event )
+
+                await asyncio.sleep( interval )
+
+            return None
+        except CommandAborted as err:
+            return aborted_response( err ) if not self.cancelled.is_set() else None
+        finally:
+            self.finish()
+
+
+class LogsStream( Subscription ):
+    '''
+    Stream of the output of a simulation (see command `follow_sim_logs`).
+
+    Input format:
+        {
+          'dir': 'directory of the simulation setup',
+          'id': 'ID of the simulation',
+          'tail': number of previous lines to include (optional)
+        }
+    '''
+
+    async def produce( self ):
+        dir = self.data.get( 'dir' ) or '.'
+        id = self.data[ 'id' ]
+        tail = self.data.get( 'tail' )
+
+        try:
+            # Following the output is not subject to a deadline, it stops when the subscription is cancelled.
+            return await run_command(
+                lambda: self.exe.follow_sim_logs( dir, id, self.put_threadsafe, self.cancelled, tail ), name = 'follow_sim_logs'
+            )
+        finally:
+            self.finish()
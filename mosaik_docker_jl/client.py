@@ -0,0 +1,527 @@
+'''
+Module providing an asyncio client for the commands of the server extension
+'''
+import asyncio
+import itertools
+import json
+import os
+import urllib.parse
+
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.websocket import websocket_connect, WebSocketClosedError
+
+from ._module_name import __module_name__
+from .channel import DEFAULT_CREDIT
+from .result_index import decode_series
+
+
+# Keys of query parameters expected by the server (see handlers).
+_QUERY_KEYS = {
+    'id_prefix': 'idPrefix',
+    'created_after': 'createdAfter',
+    'created_before': 'createdBefore',
+    'started_after': 'startedAfter',
+    'started_before': 'startedBefore',
+}
+
+
+class MosaikDockerClient:
+    '''
+    Asyncio client for driving the server extension from notebooks and scripts.
+
+    All commands and event streams are carried by a single connection to the server's channel
+    (see class `Channel`), which is opened on first use. Commands return awaitables, hence many
+    commands can be executed concurrently (e.g., with `asyncio.gather`). Responses have the same
+    format as the responses of the corresponding methods of class `Execute`.
+
+    Example (in a notebook cell):
+
+        client = MosaikDockerClient( 'http://localhost:8888', token = '...' )
+        await client.build_sim_setup( 'my_setup' )
+        responses = await asyncio.gather( *[ client.start_sim( 'my_setup' ) for _ in range( 100 ) ] )
+        async for event in client.status_changes( 'my_setup' ):
+            print( event )
+    '''
+
+    def __init__( self, url = 'http://localhost:8888', token = None ):
+        '''
+        :param url: URL of the Jupyter server, including its base URL (string)
+        :param token: authentication token of the Jupyter server (string, default: environment variable `JUPYTER_TOKEN`)
+        '''
+        parts = urllib.parse.urlsplit( url )
+        scheme = 'wss' if 'https' == parts.scheme else 'ws'
+        path = '{}/{}/channel'.format( parts.path.rstrip( '/' ), __module_name__ )
+        self.url = urllib.parse.urlunsplit( ( scheme, parts.netloc, path, '', '' ) )
+        self.api_url = urllib.parse.urlunsplit( ( parts.scheme, parts.netloc, '{}/{}'.format( parts.path.rstrip( '/' ), __module_name__ ), '', '' ) )
+        self.token = token if token is not None else os.environ.get( 'JUPYTER_TOKEN' )
+
+        self._ws = None
+        self._connecting = None
+        self._reader = None
+        self._ids = itertools.count( 1 )
+        self._requests = {}
+        self._subscriptions = {}
+
+
+    async def __aenter__( self ):
+        await self.connect()
+        return self
+
+
+    async def __aexit__( self, *exc_info ):
+        await self.close()
+
+
+    async def connect( self ):
+        '''
+        Open the connection to the server (if it is not open yet).
+        '''
+        if self._ws is not None:
+            return
+
+        # Concurrent callers wait for the same connection attempt.
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future( self._open() )
+        try:
+            await asyncio.shield( self._connecting )
+        finally:
+            if self._connecting is not None and self._connecting.done():
+                self._connecting = None
+
+
+    async def close( self ):
+        '''
+        Close the connection to the server (pending commands and streams fail).
+        '''
+        if self._ws is not None:
+            self._ws.close()
+            await self._reader
+
+
+    async def request( self, command, deadline = None, **data ):
+        '''
+        Execute a command on the server. Cancelling the awaiting task (e.g., with `asyncio.wait_for`)
+        also cancels the command on the server.
+
+        :param command: command name (string)
+        :param deadline: maximum execution time (float, seconds), can only shorten the deadline configured on the server
+        :param data: command input (keyword arguments, same format as for the corresponding handler)
+        :return: command response (dict), with code 3 if the deadline has been exceeded
+        :raises ConnectionError: if the connection is closed before the response has been received
+        '''
+        await self.connect()
+
+        id = next( self._ids )
+        future = asyncio.get_running_loop().create_future()
+        self._requests[ id ] = future
+        message = dict( type = 'request', id = id, command = command, data = data )
+        if deadline is not None:
+            message[ 'deadline' ] = deadline
+        try:
+            await self._write( message )
+            return await future
+        except asyncio.CancelledError:
+            self._write_nowait( dict( type = 'cancel', id = id ) )
+            raise
+        finally:
+            self._requests.pop( id, None )
+
+
+    async def subscribe( self, stream, credit = DEFAULT_CREDIT, **data ):
+        '''
+        Subscribe to an event stream on the server.
+
+        :param stream: stream name ('build', 'status' or 'logs')
+        :param credit: number of events the server may send ahead (int)
+        :param data: stream input (keyword arguments)
+        :return: subscription (class `Subscription`)
+        '''
+        await self.connect()
+
+        id = next( self._ids )
+        sub = Subscription( self, id, credit )
+        self._subscriptions[ id ] = sub
+        try:
+            await self._write( dict( type = 'subscribe', id = id, stream = stream, data = data, credit = credit ) )
+        except ConnectionError:
+            self._subscriptions.pop( id, None )
+            raise
+        return sub
+
+
+    def version( self ):
+        return self.request( 'version' )
+
+
+    def get_user_home_dir( self ):
+        return self.request( 'get_user_home_dir' )
+
+
+    def get_sim_setup_root( self, dir ):
+        return self.request( 'get_sim_setup_root', dir = dir )
+
+
+    def create_sim_setup( self, name, dir ):
+        return self.request( 'create_sim_setup', name = name, dir = dir )
+
+
+    def configure_sim_setup( self, dir, docker_file, scenario_file, extra_files, extra_dirs, results ):
+        return self.request(
+            'configure_sim_setup', dir = dir, dockerFile = docker_file, scenarioFile = scenario_file,
+            extraFiles = extra_files, extraDirs = extra_dirs, results = results
+        )
+
+
+    def check_sim_setup( self, dir ):
+        return self.request( 'check_sim_setup', dir = dir )
+
+
+    def delete_sim_setup( self, dir ):
+        return self.request( 'delete_sim_setup', dir = dir )
+
+
+    def start_sim( self, dir ):
+        return self.request( 'start_sim', dir = dir )
+
+
+    def cancel_sim( self, dir, id ):
+        return self.request( 'cancel_sim', dir = dir, id = id )
+
+
+    def clear_sim( self, dir, id ):
+        return self.request( 'clear_sim', dir = dir, id = id )
+
+
+    def get_sim_status( self, dir, query = None, since_version = None ):
+        data = dict( dir = dir )
+        if query is not None:
+            data[ 'query' ] = _query( query )
+        if since_version is not None:
+            data[ 'sinceVersion' ] = since_version
+        return self.request( 'get_sim_status', **data )
+
+
+    def get_sim_results( self, dir, id ):
+        return self.request( 'get_sim_results', dir = dir, id = id )
+
+
+    def get_sim_ids( self, dir, query = None ):
+        data = dict( dir = dir )
+        if query is not None:
+            data[ 'query' ] = _query( query )
+        return self.request( 'get_sim_ids', **data )
+
+
+    def get_sim_history( self, dir, query = None ):
+        return self.request( 'get_sim_history', dir = dir, query = _query( query or {} ) )
+
+
+    def get_build_context( self, dir ):
+        return self.request( 'get_build_context', dir = dir )
+
+
+    def get_image_cache( self ):
+        return self.request( 'get_image_cache' )
+
+
+    def get_result_index( self, dir, sim_ids = None ):
+        data = dict( dir = dir )
+        if sim_ids is not None:
+            data[ 'simIds' ] = sim_ids
+        return self.request( 'get_result_index', **data )
+
+
+    def export_sim_setup( self, dir, archive, sim_ids = None, include_image = True ):
+        data = dict( dir = dir, archive = archive, includeImage = include_image )
+        if sim_ids is not None:
+            data[ 'simIds' ] = sim_ids
+        return self.request( 'export_sim_setup', **data )
+
+
+    def import_sim_setup( self, archive, dir, overwrite_image = False ):
+        return self.request( 'import_sim_setup', archive = archive, dir = dir, overwriteImage = overwrite_image )
+
+
+    async def query_sim_results( self, dir, sim_ids = None, entities = None, attrs = None, start = None, end = None, offset = 0 ):
+        '''
+        Select time series from the retrieved results of many simulations at once. The time series
+        are transferred in binary format with a separate HTTP request (not via the channel).
+        Large selections are split into pages, further pages are retrieved by passing the returned offset.
+
+        :param dir: path to simulation setup (string)
+        :param sim_ids: only include the results of these simulations (list of strings, default: all)
+        :param entities: only include entities matching one of these patterns (list of strings, glob syntax)
+        :param attrs: only include attributes matching one of these patterns (list of strings, glob syntax)
+        :param start: only include rows at or after this time (number or ISO 8601 string)
+        :param end: only include rows at or before this time (number or ISO 8601 string)
+        :param offset: offset of the page, as returned with the previous page (int)
+        :return: tuple of the time series (list of dicts) and the offset of the next page (int or None), see `ResultIndex.query`
+        :raises Exception: if the command has failed
+        '''
+        data = dict( dir = dir, simIds = sim_ids, entities = entities, attrs = attrs, start = start, end = end, offset = offset )
+        headers = { 'Authorization': 'token {}'.format( self.token ) } if self.token else {}
+
+        response = await AsyncHTTPClient().fetch( HTTPRequest(
+            self.api_url + '/query_sim_results', method = 'POST', headers = headers,
+            body = json.dumps( { k: v for k, v in data.items() if v is not None } ),
+            decompress_response = True, request_timeout = 0
+        ) )
+
+        if not response.headers.get( 'Content-Type', '' ).startswith( 'application/octet-stream' ):
+            raise Exception( json.loads( response.body ).get( 'error' ) )
+        return decode_series( response.body )
+
+
+    async def build_sim_setup( self, dir, out_stream = None ):
+        '''
+        Build a simulation setup and wait until the build has finished.
+
+        :param dir: path to simulation setup (string)
+        :param out_stream: output from the build process is passed to this callable (optional)
+        :return: response of command `build_sim_setup` (dict)
+        '''
+        sub = self.build_logs( dir )
+        async for line in sub:
+            if out_stream is not None:
+                out_stream( line )
+        return sub.response
+
+
+    def build_logs( self, dir ):
+        '''
+        Start building a simulation setup and stream the output of the build process.
+        After iterating over the output, the build response is available as attribute `response`.
+
+        Usage: `async for line in client.build_logs( dir ): ...`
+
+        :param dir: path to simulation setup (string)
+        :return: async iterator over output lines
+        '''
+        return _SubscriptionIterator( lambda: self.subscribe( 'build', dir = dir ) )
+
+
+    def status_changes( self, dir, interval = None ):
+        '''
+        Stream the changes of the simulation status of a simulation setup. The first event contains
+        the complete status, subsequent events only the changes (see command `get_sim_status`).
+
+        Usage: `async for event in client.status_changes( dir ): ...`
+
+        :param dir: path to simulation setup (string)
+        :param interval: polling interval on the server (float, seconds)
+        :return: async iterator over status events
+        '''
+        data = dict( dir = dir )
+        if interval is not None:
+            data[ 'interval' ] = interval
+        return _SubscriptionIterator( lambda: self.subscribe( 'status', **data ) )
+
+
+    def sim_logs( self, dir, id, tail = None ):
+        '''
+        Stream the output of a simulation until it has finished.
+
+        Usage: `async for line in client.sim_logs( dir, id ): ...`
+
+        :param dir: path to simulation setup (string)
+        :param id: simulation ID (string)
+        :param tail: number of previous output lines to include (int, default: all)
+        :return: async iterator over output lines
+        '''
+        data = dict( dir = dir, id = id )
+        if tail is not None:
+            data[ 'tail' ] = tail
+        return _SubscriptionIterator( lambda: self.subscribe( 'logs', **data ) )
+
+
+    async def _write( self, message ):
+        '''
+        Send a message to the server.
+
+        :param message: message (dict)
+        :raises ConnectionError: if the connection is closed
+        '''
+        ws = self._ws
+        if ws is None:
+            raise ConnectionError( 'connection closed' )
+        try:
+            await ws.write_message( json.dumps( message ) )
+        except WebSocketClosedError as err:
+            raise ConnectionError( 'connection closed' ) from err
+
+
+    def _write_nowait( self, message ):
+        '''
+        Send a message to the server without waiting for it to be written (e.g., while being cancelled).
+        Errors are ignored, the server cancels everything anyway when the connection is closed.
+
+        :param message: message (dict)
+        '''
+        ws = self._ws
+        if ws is None:
+            return
+        try:
+            future = ws.write_message( json.dumps( message ) )
+        except WebSocketClosedError:
+            return
+        future.add_done_callback( lambda f: f.cancelled() or f.exception() )
+
+
+    async def _open( self ):
+        headers = { 'Authorization': 'token {}'.format( self.token ) } if self.token else {}
+        self._ws = await websocket_connect( HTTPRequest( self.url, headers = headers ) )
+        self._reader = asyncio.ensure_future( self._read( self._ws ) )
+
+
+    async def _read( self, ws ):
+        '''
+        Dispatch messages from the server until the connection is closed. Unexpected messages
+        close the connection, such that no request or subscription waits forever.
+        '''
+        try:
+            while True:
+                message = await ws.read_message()
+                if message is None:
+                    break
+
+                message = json.loads( message )
+                type = message.get( 'type' )
+                id = message.get( 'id' )
+
+                if id in self._requests:
+                    future = self._requests[ id ]
+                    if not future.done():
+                        if 'response' == type:
+                            future.set_result( message[ 'response' ] )
+                        else:
+                            future.set_exception( Exception( message.get( 'error' ) ) )
+
+                elif id in self._subscriptions:
+                    sub = self._subscriptions[ id ]
+                    if 'event' == type:
+                        sub._queue.put_nowait( ( 'event', message[ 'data' ] ) )
+                    else:
+                        del self._subscriptions[ id ]
+                        response = message.get( 'response' ) if 'end' == type else dict( code = 2, error = message.get( 'error' ) )
+                        sub._queue.put_nowait( ( 'end', response ) )
+
+        finally:
+            # The connection has been closed (or is closed due to an unexpected message).
+            if self._ws is ws:
+                self._ws = None
+            ws.close()
+            for future in self._requests.values():
+                if not future.done():
+                    future.set_exception( ConnectionError( 'connection closed' ) )
+            for sub in self._subscriptions.values():
+                sub._queue.put_nowait( ( 'end', dict( code = 2, error = 'connection closed' ) ) )
+            self._subscriptions.clear()
+
+
+class Subscription:
+    '''
+    Async iterator over the events of a stream. Credit for further events is granted
+    to the server as the events are consumed (flow control). After the iteration has
+    ended, the final response of the stream is available as attribute `response`.
+    '''
+
+    def __init__( self, client, id, credit ):
+        self.client = client
+        self.id = id
+        self.response = None
+        self._credit = credit
+        self._consumed = 0
+        self._queue = asyncio.Queue()
+        self._done = False
+
+
+    def __aiter__( self ):
+        return self
+
+
+    async def __anext__( self ):
+        if self._done:
+            raise StopAsyncIteration
+
+        kind, data = await self._queue.get()
+        if 'end' == kind:
+            self._done = True
+            self.response = data
+            raise StopAsyncIteration
+
+        # Renew the credit once half of it has been consumed.
+        self._consumed += 1
+        if self._consumed >= max( 1, self._credit // 2 ) and self.client._ws is not None:
+            try:
+                await self.client._write( dict( type = 'ack', id = self.id, credit = self._consumed ) )
+            except ConnectionError:
+                pass # The end of the stream is reported by the reader.
+            self._consumed = 0
+
+        return data
+
+
+    async def aclose( self ):
+        '''
+        Unsubscribe from the stream.
+        '''
+        if not self._done and self.id in self.client._subscriptions:
+            try:
+                await self.client._write( dict( type = 'unsubscribe', id = self.id ) )
+            except ConnectionError:
+                pass # Subscriptions end with the connection.
+
+
+class _SubscriptionIterator:
+    '''
+    Async iterator subscribing to a stream on first use (allows `async for` without awaiting the subscription first).
+    Can also be used as async context manager, which subscribes on entry and unsubscribes on exit.
+    '''
+
+    def __init__( self, subscribe ):
+        '''
+        :param subscribe: coroutine function subscribing to the stream (callable without arguments)
+        '''
+        self._subscribe = subscribe
+        self._sub = None
+
+
+    def __aiter__( self ):
+        return self
+
+
+    async def __anext__( self ):
+        await self._ensure_subscribed()
+        return await self._sub.__anext__()
+
+
+    async def __aenter__( self ):
+        await self._ensure_subscribed()
+        return self
+
+
+    async def __aexit__( self, *exc_info ):
+        await self.aclose()
+
+
+    @property
+    def response( self ):
+        return self._sub.response if self._sub is not None else None
+
+
+    async def aclose( self ):
+        if self._sub is not None:
+            await self._sub.aclose()
+
+
+    async def _ensure_subscribed( self ):
+        # The subscription is only created when needed, such that no coroutine is left un-awaited.
+        if self._sub is None:
+            self._sub = await self._subscribe()
+
+
+def _query( query ):
+    '''
+    Convert query parameters to the format expected by the server.
+    '''
+    return { _QUERY_KEYS.get( k, k ): v for k, v in query.items() }
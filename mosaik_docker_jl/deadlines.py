@@ -0,0 +1,380 @@
+'''
+Module for executing commands in worker threads with deadlines and cancellation
+'''
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import logging
+import os
+import signal
+import threading
+import time
+import weakref
+
+from ._module_name import __module_name__
+
+
+# Response code for commands that have exceeded their deadline.
+CODE_DEADLINE_EXCEEDED = 3
+
+# Response code for commands that have been cancelled by the client.
+CODE_CANCELLED = 4
+
+# Default deadlines per command (seconds), commands not listed here use the default deadline.
+DEFAULT_DEADLINES = {
+    'build_sim_setup': 3600.,
+    'delete_sim_setup': 600.,
+    'get_sim_results': 600.,
+    'get_result_index': 600.,
+    'query_sim_results': 600.,
+    'export_sim_setup': 3600.,
+    'import_sim_setup': 3600.,
+    'start_sim': 120.,
+}
+
+# Default deadline for all other commands (seconds).
+DEFAULT_DEADLINE = 60.
+
+# Interval for terminating processes started by aborted commands (seconds).
+_KILL_INTERVAL = 0.1
+
+# Commands that may run for a long time (and event streams without a deadline). Each of them is
+# executed in a dedicated thread, such that they cannot exhaust the worker threads for short commands.
+LONG_RUNNING_COMMANDS = {
+    'build_sim_setup',
+    'delete_sim_setup',
+    'get_sim_results',
+    'get_result_index',
+    'query_sim_results',
+    'export_sim_setup',
+    'import_sim_setup',
+    'follow_sim_logs',
+}
+
+# Default number of worker threads for executing short commands (see class `Execute`).
+DEFAULT_WORKERS = 8
+
+# Call executed by the current thread (see class `_Call`).
+_current = threading.local()
+
+_log = logging.getLogger( __name__ )
+
+# Commands rewriting the configuration file of a simulation setup. Commands in this set that affect
+# the same setup are executed one after the other, all other commands are not serialized.
+SERIALIZED_COMMANDS = {
+    'configure_sim_setup',
+    'delete_sim_setup',
+    'start_sim',
+    'cancel_sim',
+    'clear_sim',
+    'get_sim_status',
+}
+
+# Locks per event loop and simulation setup (see function `setup_lock`).
+_setup_locks = weakref.WeakKeyDictionary()
+
+
+class CommandAborted( Exception ):
+    '''
+    Raised when a command has exceeded its deadline or has been cancelled.
+    '''
+
+    def __init__( self, code, message ):
+        super().__init__( message )
+        self.code = code
+
+
+class WorkerThreads( concurrent.futures.ThreadPoolExecutor ):
+    '''
+    Pool of worker threads for executing short commands. In contrast to its base class, it keeps
+    track of the submitted functions, such that those that have not started yet can be cancelled
+    on shutdown (`shutdown( cancel_futures = True )` is not available before Python 3.9).
+    '''
+
+    def __init__( self, *args, **kwargs ):
+        super().__init__( *args, **kwargs )
+        self._submitted = weakref.WeakSet()
+        self._submitted_lock = threading.Lock()
+
+
+    def submit( self, *args, **kwargs ):
+        future = super().submit( *args, **kwargs )
+        with self._submitted_lock:
+            self._submitted.add( future )
+        return future
+
+
+    def cancel_pending( self ):
+        '''
+        Cancel all submitted functions that have not started yet.
+        '''
+        with self._submitted_lock:
+            futures = list( self._submitted )
+        for future in futures:
+            future.cancel()
+
+
+def setup_lock( dir ):
+    '''
+    Lock serializing the commands that rewrite the configuration file of a simulation setup
+    (see `SERIALIZED_COMMANDS`). Must be called from the event loop.
+
+    :param dir: path to simulation setup (string)
+    :return: lock (asyncio.Lock)
+    '''
+    locks = _setup_locks.setdefault( asyncio.get_running_loop(), collections.defaultdict( asyncio.Lock ) )
+    return locks[ os.path.realpath( dir ) ]
+
+
+def get_deadline( deadlines, command, requested = None ):
+    '''
+    Determine the deadline of a command.
+
+    :param deadlines: configured deadlines per command (dict, command name mapped to seconds or None for no deadline)
+    :param command: command name (string)
+    :param requested: deadline requested by the client (float, seconds), can only shorten the configured deadline
+    :return: deadline (float, seconds) or None
+    '''
+    deadline = deadlines.get( command, deadlines.get( '*', DEFAULT_DEADLINE ) )
+    if requested is not None and float( requested ) > 0:
+        deadline = min( deadline, float( requested ) ) if deadline is not None else float( requested )
+    return deadline
+
+
+async def run_command( fn, deadline = None, cancelled = None, dir = None, name = 'command', executor = None ):
+    '''
+    Execute a blocking function in a worker thread, with an optional deadline and cancellation.
+    Long-running commands (see `LONG_RUNNING_COMMANDS`) and functions without a deadline are
+    executed in a dedicated thread instead of the pool of worker threads.
+
+    Commands that rewrite the configuration file of a simulation setup (see `SERIALIZED_COMMANDS`)
+    wait for other such commands affecting the same setup before they are handed to a thread. The
+    time spent waiting counts towards the deadline, but does not occupy a worker thread.
+
+    When the deadline expires or the command is cancelled, the caller is released immediately and
+    all processes started by the worker thread (e.g., Docker CLI calls) are killed until the function
+    returns, such that the worker thread becomes available again as soon as possible. Killing these
+    processes is only supported on Linux (see class `_Call`).
+
+    :param fn: function to be executed (callable without arguments)
+    :param deadline: maximum execution time (float, seconds) or None
+    :param cancelled: the command is cancelled as soon as this event is set (asyncio.Event)
+    :param dir: path to the simulation setup affected by the command (string)
+    :param name: command name, used for serialization and in error messages (string)
+    :param executor: worker threads for short commands (concurrent.futures.Executor, default: the event loop's default executor)
+    :return: return value of the function
+    :raises CommandAborted: if the deadline has expired or the command has been cancelled
+    '''
+    expires = time.monotonic() + deadline if deadline is not None else None
+
+    lock = setup_lock( dir ) if dir is not None and name in SERIALIZED_COMMANDS else None
+    if lock is not None:
+        acquiring = asyncio.ensure_future( lock.acquire() )
+        acquired = False
+        try:
+            acquired = await _wait( acquiring, deadline, cancelled )
+        finally:
+            if not acquired:
+                if acquiring.done() and not acquiring.cancelled():
+                    lock.release()
+                else:
+                    acquiring.cancel()
+        if not acquired:
+            raise _aborted( name, deadline, cancelled )
+
+    try:
+        if ( cancelled is not None and cancelled.is_set() ) or ( expires is not None and time.monotonic() >= expires ):
+            raise _aborted( name, deadline, cancelled )
+
+        call = _Call( fn )
+        if deadline is None or name in LONG_RUNNING_COMMANDS:
+            future = _run_in_thread( call.run, name )
+        else:
+            future = asyncio.get_running_loop().run_in_executor( executor, call.run )
+    except BaseException:
+        if lock is not None:
+            lock.release()
+        raise
+
+    # The lock is held until the function has returned, even if the caller is released before.
+    if lock is not None:
+        future.add_done_callback( lambda f: lock.release() )
+
+    if await _wait( future, expires - time.monotonic() if expires is not None else None, cancelled ):
+        return future.result()
+
+    # Abort the command in the background (exceptions of the worker thread are ignored).
+    call.abort()
+    future.add_done_callback( lambda f: f.exception() )
+    raise _aborted( name, deadline, cancelled )
+
+
+def aborted_response( err ):
+    '''
+    :return: response for an aborted command (dict)
+    '''
+    return dict( code = err.code, error = str( err ) )
+
+
+async def _wait( future, timeout, cancelled ):
+    '''
+    Wait for a future, but not beyond a timeout or the cancellation of the command.
+
+    :return: True if the future is done, False otherwise
+    '''
+    waiters = [ future ]
+    if cancelled is not None:
+        waiters.append( asyncio.ensure_future( cancelled.wait() ) )
+
+    try:
+        await asyncio.wait( waiters, timeout = timeout, return_when = asyncio.FIRST_COMPLETED )
+    finally:
+        for w in waiters[1:]:
+            w.cancel()
+
+    return future.done()
+
+
+def _aborted( name, deadline, cancelled ):
+    '''
+    :return: exception for an aborted command (CommandAborted)
+    '''
+    if cancelled is not None and cancelled.is_set():
+        return CommandAborted( CODE_CANCELLED, '{} cancelled'.format( name ) )
+    return CommandAborted( CODE_DEADLINE_EXCEEDED, '{} exceeded its deadline of {:g} s'.format( name, deadline ) )
+
+
+def _run_in_thread( fn, name ):
+    '''
+    Execute a function in a new thread.
+
+    :return: future resolved with the function's result (asyncio.Future)
+    '''
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def resolve( set, value ):
+        if not future.done():
+            set( value )
+
+    def run():
+        try:
+            result = fn()
+        except BaseException as err:
+            done = ( resolve, future.set_exception, err )
+        else:
+            done = ( resolve, future.set_result, result )
+        try:
+            loop.call_soon_threadsafe( *done )
+        except RuntimeError:
+            pass # The event loop has been closed in the meantime.
+
+    threading.Thread( target = run, name = '{}-{}'.format( __module_name__, name ), daemon = True ).start()
+    return future
+
+
+class _Call:
+    '''
+    A single function call in a worker thread, which can be aborted.
+
+    Aborting a call kills the processes started by the worker thread and by helper threads that
+    have been attached to the call (see function `attach_thread`). Processes are found via
+    `/proc/self/task/<thread ID>/children`, hence this is only supported on Linux (with
+    CONFIG_PROC_CHILDREN). On other platforms, aborted commands are released immediately but
+    their processes keep running until they finish on their own.
+    '''
+
+    def __init__( self, fn ):
+        self._fn = fn
+        self._thread_ids = set()
+        self._aborted = threading.Event()
+        self._lock = threading.Lock()
+
+
+    def run( self ):
+        with self.attached():
+            return self._fn()
+
+
+    @contextlib.contextmanager
+    def attached( self ):
+        '''
+        Context manager attaching the current thread to the call: processes it starts
+        are killed when the call is aborted.
+        '''
+        thread_id = threading.get_native_id()
+        previous = getattr( _current, 'call', None )
+
+        with self._lock:
+            if self._aborted.is_set():
+                raise CommandAborted( CODE_CANCELLED, 'aborted before start' )
+            self._thread_ids.add( thread_id )
+        _current.call = self
+
+        try:
+            yield
+        finally:
+            _current.call = previous
+            with self._lock:
+                self._thread_ids.discard( thread_id )
+
+
+    def abort( self ):
+        '''
+        Abort the call: kill all processes started by the attached threads until the call has returned.
+        '''
+        self._aborted.set()
+        if not _CAN_KILL_CHILDREN:
+            _log.warning( 'processes started by aborted commands cannot be terminated on this platform' )
+            return
+        threading.Thread( target = self._kill_children, daemon = True ).start()
+
+
+    def _kill_children( self ):
+        while True:
+            with self._lock:
+                if not self._thread_ids:
+                    return
+                for thread_id in self._thread_ids:
+                    for pid in _child_processes( thread_id ):
+                        try:
+                            os.kill( pid, signal.SIGKILL )
+                        except OSError:
+                            pass
+            time.sleep( _KILL_INTERVAL )
+
+
+def attach_thread( fn ):
+    '''
+    Wrap a function that is executed in a helper thread on behalf of the current command, such that
+    the processes it starts are killed together with those of the command when the command is aborted.
+    Outside of commands, the function is returned unchanged.
+
+    :param fn: function to be executed in a helper thread (callable)
+    :return: wrapped function (callable)
+    '''
+    call = getattr( _current, 'call', None )
+    if call is None:
+        return fn
+
+    def wrapper( *args, **kwargs ):
+        with call.attached():
+            return fn( *args, **kwargs )
+
+    return wrapper
+
+
+def _child_processes( thread_id ):
+    '''
+    :return: IDs of the processes started by a thread of this process (list of ints, empty if not supported by the OS)
+    '''
+    try:
+        with open( '/proc/self/task/{}/children'.format( thread_id ), 'r' ) as f:
+            return [ int( pid ) for pid in f.read().split() ]
+    except OSError:
+        return []
+
+
+# Killing the processes started by a thread is only supported on Linux.
+_CAN_KILL_CHILDREN = os.path.exists( '/proc/self/task/{}/children'.format( threading.get_native_id() ) )
@@ -1,14 +1,31 @@
 '''
 Module for executing commands, sending results back to the handlers
 '''
+import concurrent.futures
+import datetime
+import hashlib
 import os
 import subprocess
+import threading
+import time
+from jupyter_core.paths import jupyter_data_dir
+from ._module_name import __module_name__
 from ._version import __version__
+from .build_context import BuildContext, build_sim_setup
+from .deadlines import DEFAULT_DEADLINES, DEFAULT_WORKERS, WorkerThreads
+from .image_cache import ImageCache
+from .result_index import ResultIndex, encode_series
+from .run_history import RunHistory, parse_docker_time
+from .setup_archive import export_sim_setup, import_sim_setup, format_summary
+from .setup_check import SetupChecker
+from .sim_progress import ProgressTracker
+from .sim_query import SimQuery, format_time
+from .status_snapshots import StatusSnapshots
+from .warm_pool import WarmPool, WARM_CONTAINER_OWNER_LABEL
 
 from mosaik_docker.cli.create_sim_setup import create_sim_setup as md_create_sim_setup
 from mosaik_docker.cli.get_sim_setup_root import get_sim_setup_root as md_get_sim_setup_root
 from mosaik_docker.cli.configure_sim_setup import configure_sim_setup as md_configure_sim_setup
-from mosaik_docker.cli.check_sim_setup import check_sim_setup as md_check_sim_setup
 from mosaik_docker.cli.delete_sim_setup import delete_sim_setup as md_delete_sim_setup
 from mosaik_docker.cli.start_sim import start_sim as md_start_sim
 from mosaik_docker.cli.cancel_sim import cancel_sim as md_cancel_sim
@@ -16,8 +33,11 @@ from mosaik_docker.cli.clear_sim import clear_sim as md_clear_sim
 from mosaik_docker.cli.get_sim_status import get_sim_status as md_get_sim_status
 from mosaik_docker.cli.get_sim_results import get_sim_results as md_get_sim_results
 from mosaik_docker.cli.get_sim_ids import get_sim_ids as md_get_sim_ids
-from mosaik_docker.cli.build_sim_setup import build_sim_setup as md_build_sim_setup
+from mosaik_docker.util.create_unique_id import create_unique_id
 from mosaik_docker.util.get_default_docker_host import get_default_docker_host as md_get_default_docker_host
+from mosaik_docker.util.execute import execute_and_capture_output as md_execute_and_capture_output
+from mosaik_docker.util.config_data import ConfigData as MDConfigData
+from mosaik_docker._config import CONFIG_FILE_NAME as MD_CONFIG_FILE_NAME
 
 
 class Execute:
@@ -25,10 +45,62 @@ class Execute:
     A single class to execute commands on the backend.
     '''
 
-    def __init__( self, contents_manager, use_rootless_docker = False ):
+    def __init__( self, contents_manager, use_rootless_docker = False, history_path = None, warm_pool_size = 0, warm_pool_max_idle = 600.,
+            build_context_warn_size = 100 * 1024 * 1024, image_cache_max_size = 0, deadlines = None, status_max_age = 2.,
+            workers = DEFAULT_WORKERS, default_ignore_rules = False ):
         self.contents_manager = contents_manager
+        self.build_context_warn_size = build_context_warn_size
+        self.default_ignore_rules = default_ignore_rules
+        self.setup_checker = SetupChecker( build_context_warn_size, default_ignore_rules )
         self.root_dir = os.path.expanduser( contents_manager.root_dir )
         self.docker_host = self._get_rootless_docker_host() if use_rootless_docker else md_get_default_docker_host()
+        self.status_snapshots = StatusSnapshots( max_age = status_max_age )
+        self.progress_tracker = ProgressTracker( self.docker_host )
+
+        # Persistent index of all simulation runs.
+        if history_path is None:
+            history_path = os.path.join( jupyter_data_dir(), __module_name__, 'run_history.sqlite' )
+        self.run_history = RunHistory( history_path )
+
+        # Persistent index of the retrieved result files of all simulation setups.
+        self.result_index = ResultIndex( os.path.join( os.path.dirname( history_path ), 'result_index.sqlite' ) )
+
+        # Worker threads for tasks that should not delay the response to a request.
+        self._background = concurrent.futures.ThreadPoolExecutor( max_workers = 2, thread_name_prefix = __module_name__ )
+
+        # Optional pool of pre-created orchestrator containers (disabled if the pool size is zero).
+        self.warm_pool = WarmPool( self.docker_host, warm_pool_size, warm_pool_max_idle ) if warm_pool_size > 0 else None
+
+        # Optional on-disk cache of base images shared by all simulation setups (disabled if the maximum size is zero).
+        # Saving images may take long, hence the cache has its own worker thread.
+        self.image_cache = None
+        if image_cache_max_size > 0:
+            self.image_cache = ImageCache(
+                os.path.join( jupyter_data_dir(), __module_name__, 'image_cache' ), self.docker_host, image_cache_max_size
+            )
+            self._image_cache_worker = concurrent.futures.ThreadPoolExecutor( max_workers = 1, thread_name_prefix = __module_name__ + '-image-cache' )
+
+        # Deadlines per command (seconds), key '*' sets the deadline for all commands not listed (see module `deadlines`).
+        self.deadlines = dict( DEFAULT_DEADLINES, **( deadlines or {} ) )
+
+        # Worker threads for executing short commands (long-running commands have dedicated threads, see module `deadlines`).
+        self.executor = WorkerThreads( max_workers = workers, thread_name_prefix = __module_name__ + '-worker' )
+
+
+    def close( self ):
+        '''
+        Finish all background tasks and release resources.
+        '''
+        # Commands still running have been aborted or will be answered to closed connections.
+        self.executor.cancel_pending()
+        self.executor.shutdown( wait = False )
+        self._background.shutdown( wait = True )
+        self.progress_tracker.close()
+        if self.image_cache is not None:
+            self._image_cache_worker.shutdown( wait = True )
+        self.run_history.close()
+        if self.warm_pool is not None:
+            self.warm_pool.close()
 
 
     def _get_rootless_docker_host(self):
@@ -39,6 +111,154 @@ class Execute:
         return f'unix:///run/user/{ int( res.stdout ) }/docker.sock'
 
 
+    def _add_created_times( self, records, sim_query ):
+        '''
+        Add the creation times of the simulation containers to simulation records, if they are required by a query.
+        Containers taken from the warm pool have been created before the simulation was started, their start
+        time is used instead.
+
+        :param records: simulation records (list of dicts)
+        :param sim_query: query to be applied to the records (SimQuery)
+        :return: simulation records
+        '''
+        if not sim_query.needs_created or 0 == len( records ):
+            return records
+
+        # Retrieve the creation times of all containers with a single call (instead of one filter per ID).
+        out = md_execute_and_capture_output(
+            [
+                'docker', 'ps', # List containers.
+                '--no-trunc', # Do not truncate output.
+                '--all', # Show all containers (default shows just running).
+                '--format', '{{{{.Names}}}}\t{{{{.CreatedAt}}}}\t{{{{.Label "{}"}}}}'.format( WARM_CONTAINER_OWNER_LABEL ) # Only output container name, creation time and pool label.
+            ],
+            env = dict( DOCKER_HOST = self.docker_host )
+        )
+
+        ids = set( record[ 'id' ] for record in records )
+        created = {}
+        pooled = []
+        for line in out.split( '\n' ):
+            if '\t' not in line:
+                continue
+            name, created_at, owner = ( line.split( '\t' ) + [ '' ] )[:3]
+            if owner and name in ids:
+                pooled.append( name )
+            try:
+                # Docker's format is '2006-01-02 15:04:05 -0700 MST', the timezone name is omitted.
+                timestamp = datetime.datetime.strptime( created_at[:25], '%Y-%m-%d %H:%M:%S %z' )
+                created[ name ] = format_time( timestamp )
+            except ValueError:
+                continue
+
+        for line in self._inspect_containers( pooled, '{{.Name}}\t{{.State.StartedAt}}' ):
+            name, started_at = line.split( '\t' )
+            started = parse_docker_time( started_at )
+            if started is not None:
+                created[ name.lstrip( '/' ) ] = format_time( datetime.datetime.fromtimestamp( started, datetime.timezone.utc ) )
+
+        for record in records:
+            record[ 'created' ] = created.get( record[ 'id' ] )
+
+        return records
+
+
+    def _inspect_containers( self, ids, format ):
+        '''
+        Retrieve low-level information about Docker containers. Containers that do not exist (anymore) are ignored.
+
+        :param ids: simulation IDs (Docker container names)
+        :param format: Go template for formatting the output for each container (string)
+        :return: one line of output per container (list of strings)
+        '''
+        lines = []
+
+        # Split long lists of IDs into chunks, to keep the length of the command line within limits.
+        for i in range( 0, len( ids ), 200 ):
+            res = subprocess.run(
+                [ 'docker', 'inspect', '--type', 'container', '--format', format, *ids[ i:i + 200 ] ],
+                env = dict( DOCKER_HOST = self.docker_host ),
+                capture_output = True
+            )
+            lines.extend( l for l in res.stdout.decode( 'utf-8' ).split( '\n' ) if l )
+
+        return lines
+
+
+    def _remove_unregistered_container( self, dir, sim_id ):
+        '''
+        Remove the container of a simulation that failed to start, unless it has been added to the
+        configuration of the simulation setup.
+        '''
+        try:
+            ids = md_get_sim_ids( dir )
+            if sim_id in ids[ 'up' ] or sim_id in ids[ 'down' ]:
+                return
+        except Exception:
+            return
+
+        subprocess.run(
+            [ 'docker', 'rm', '--force', sim_id ],
+            env = dict( DOCKER_HOST = self.docker_host ),
+            capture_output = True
+        )
+
+
+    def _record_build_fingerprint( self, dir, sim_id ):
+        '''
+        Record the ID of the image a simulation has been started from in the run history.
+        '''
+        for image_id in self._inspect_containers( [ sim_id ], '{{.Image}}' ):
+            self.run_history.record( 'fingerprint', dir, sim_id, build_fingerprint = image_id )
+
+
+    def _record_finished( self, dir, ids ):
+        '''
+        Record start and finish times and exit status of finished simulations in the run history.
+        '''
+        format = '{{.Name}}\t{{.State.StartedAt}}\t{{.State.FinishedAt}}\t{{.State.ExitCode}}'
+
+        for line in self._inspect_containers( list( ids ), format ):
+            name, started_at, finished_at, exit_code = line.split( '\t' )
+            finished = parse_docker_time( finished_at )
+            if finished is None:
+                continue
+            self.run_history.record( 'finish', dir, name.lstrip( '/' ), timestamp = finished,
+                started = parse_docker_time( started_at ), exit_status = int( exit_code ) )
+
+
+    def _record_result_sizes( self, dir, ids ):
+        '''
+        Record the total size of the retrieved results of simulations in the run history.
+        '''
+        for id in ids:
+            size = 0
+            for root, _, files in os.walk( os.path.join( dir, id ) ):
+                for f in files:
+                    try:
+                        size += os.lstat( os.path.join( root, f ) ).st_size
+                    except OSError:
+                        pass
+            self.run_history.record( 'result', dir, id, result_size = size )
+
+
+    def _update_result_index( self, dir, sim_ids = None ):
+        '''
+        Update the result index for the given simulations or, by default, for finished simulations
+        whose retrieved results have not been indexed yet (e.g., results retrieved before the index
+        existed). Results of indexed simulations are updated in the background whenever they are
+        retrieved (see method `get_sim_results`), hence they are not checked again here.
+        '''
+        if sim_ids is None:
+            indexed = set( self.result_index.get_sim_ids( dir ) )
+            sim_ids = [
+                id for id in MDConfigData( dir )[ 'sim_ids_down' ]
+                if id not in indexed and os.path.isdir( os.path.join( dir, id ) )
+            ]
+        if sim_ids:
+            self.result_index.update( dir, sim_ids )
+
+
     def version( self ):
         '''
         :return: the version of this extension
@@ -139,18 +359,25 @@ class Execute:
 
     def check_sim_setup( self, dir ):
         '''
-        Check an existing mosaik-docker simulation setup.
+        Check an existing mosaik-docker simulation setup. Only the parts of the setup
+        that have changed since the previous check are checked again (see class `SetupChecker`).
 
         :param dir: directory of the simulation setup (string)
-        :return: response with status code and error message.
+        :return: response with status code and error message, and a report for each item of the setup.
         '''
 
         response = {}
 
         try:
-            check = md_check_sim_setup( dir )
+            check = self.setup_checker.check( dir )
             response[ 'code' ] = 0 if check[ 'valid' ] else 1
             response[ 'message' ] = check[ 'status' ]
+            response[ 'items' ] = check[ 'items' ]
+
+            # Warn about large build contexts (the setup is still valid).
+            if 'warning' in check:
+                response[ 'warning' ] = check[ 'warning' ]
+                response[ 'message' ] += '\nwarning: {}'.format( response[ 'warning' ] )
 
         except Exception as err:
 
@@ -171,10 +398,22 @@ class Execute:
         response = {}
 
         try:
+            # Pooled containers would prevent the removal of the orchestrator image.
+            if self.warm_pool is not None:
+                self.warm_pool.drain( dir )
+
             delete = md_delete_sim_setup( dir, docker_host = self.docker_host )
             response[ 'code' ] = 0 if delete[ 'valid' ] else 1
             response[ 'message' ] = delete[ 'status' ]
 
+            if delete[ 'valid' ]:
+                self.run_history.record( 'delete_setup', dir )
+                self.setup_checker.forget( dir )
+                self.result_index.forget( dir )
+                self.progress_tracker.retain( dir, [] )
+                if self.image_cache is not None:
+                    self._image_cache_worker.submit( self.image_cache.release, dir )
+
         except Exception as err:
 
             response[ 'code' ] = 2
@@ -194,7 +433,30 @@ class Execute:
         response = {}
 
         try:
-            sim_id = md_start_sim( dir, docker_host = self.docker_host )
+            started = time.time()
+
+            # Use a pre-created container if available, otherwise create a new one.
+            sim_id = None
+            if self.warm_pool is not None:
+                try:
+                    sim_id = self.warm_pool.start_sim( dir )
+                except Exception:
+                    # The pool is an optimization only, fall back to creating a new container.
+                    sim_id = None
+            if sim_id is None:
+                sim_id = create_unique_id()
+                try:
+                    md_start_sim( dir, id = sim_id, docker_host = self.docker_host )
+                except BaseException:
+                    # The container may have been created before the command failed or was aborted.
+                    self._background.submit( self._remove_unregistered_container, dir, sim_id )
+                    raise
+
+            if self.warm_pool is not None:
+                self._background.submit( self.warm_pool.refill, dir )
+
+            self.run_history.record( 'start', dir, sim_id, timestamp = started )
+            self._background.submit( self._record_build_fingerprint, dir, sim_id )
 
             response[ 'code' ] = 0
             response[ 'message' ] = 'started new simulation with ID = {}'.format( sim_id )
@@ -221,6 +483,10 @@ class Execute:
         try:
             sim_id = md_cancel_sim( dir, id, docker_host = self.docker_host )
 
+            for cancelled_id in sim_id:
+                self.run_history.record( 'cancel', dir, cancelled_id )
+            self._background.submit( self._record_finished, dir, sim_id )
+
             response[ 'code' ] = 0
             response[ 'message' ] = 'cancelled simulation with ID = {}'.format( sim_id )
 
@@ -246,6 +512,9 @@ class Execute:
         try:
             sim_id = md_clear_sim( dir, id, docker_host = self.docker_host )
 
+            for cleared_id in sim_id:
+                self.run_history.record( 'clear', dir, cleared_id )
+
             response[ 'code' ] = 0
             response[ 'message' ] = 'cleared simulation with ID = {}'.format( sim_id )
 
@@ -257,21 +526,67 @@ class Execute:
         return response
 
 
-    def get_sim_status( self, dir ):
+    def get_sim_status( self, dir, query = None, since_version = None ):
         '''
         Get status of all simulations of a mosaik-docker setup.
+        The response contains the version of the status snapshot (see class `StatusSnapshots`).
 
         :param dir: path to simulation setup (string)
-        :return: response with status code and error message.
+        :param query: filter, sort and pagination parameters (dict, see class `SimQuery`); if not specified, the status of all simulations is returned
+        :param since_version: only return the changes since this version (int); cannot be combined with parameter `query`
+        :return: response with status code and error message. In delta mode (parameter `since_version` specified), the message has the following format:
+            {
+                'full': flag indicating that the changes are not available and the complete status is returned instead (boolean)
+                'status': complete status, only if flag 'full' is set (dict)
+                'changes': changes since the specified version, only if flag 'full' is not set (dict, see method `StatusSnapshots.changes_since`)
+            }
         '''
 
         response = {}
 
         try:
+            if query is not None and since_version is not None:
+                raise ValueError( 'parameters \'query\' and \'since_version\' cannot be combined' )
+
+            sim_query = SimQuery( **query ) if query is not None else None
+
             status = md_get_sim_status( dir, docker_host = self.docker_host )
+            sims_up = set( status[ 'up' ] )
+            version, finished = self.status_snapshots.update_with_finished( dir, status )
+
+            # Record simulations that have finished since the last status update in the run history
+            # (after a server restart, all finished simulations are checked once).
+            if finished:
+                self._background.submit( self._record_finished, dir, finished )
+
+            # Only the progress of running simulations is tracked.
+            self.progress_tracker.retain( dir, sims_up )
+
+            if since_version is not None:
+                changes = self.status_snapshots.changes_since( dir, int( since_version ) )
+                if changes is None:
+                    status = dict( full = True, status = status )
+                else:
+                    status = dict( full = False, changes = changes )
+
+            if sim_query is not None:
+                records = [
+                    dict( id = id, state = state, status = info )
+                    for state in ( 'up', 'down' ) for id, info in status[ state ].items()
+                ]
+                status = sim_query.apply( self._add_created_times( records, sim_query ) )
+
+                # Only retrieve the progress of the running simulations on the requested page
+                # (their logs are polled in the background, see class `ProgressTracker`).
+                if sim_query.needs_progress:
+                    running = [ item[ 'id' ] for item in status[ 'items' ] if item[ 'id' ] in sims_up ]
+                    progress = self.progress_tracker.get_progress( dir, running )
+                    for item in status[ 'items' ]:
+                        item[ 'progress' ] = progress.get( item[ 'id' ] )
 
             response[ 'code' ] = 0
             response[ 'message' ] = status
+            response[ 'version' ] = version
 
         except Exception as err:
 
@@ -281,6 +596,36 @@ class Execute:
         return response
 
 
+    def get_sim_status_version( self, dir ):
+        '''
+        Get the version of the status snapshot of a simulation setup without querying Docker.
+        Only recent snapshots are considered, hence the status is retrieved from Docker again
+        at the latest when the snapshot's maximum age (parameter `status_max_age`) has passed.
+
+        :param dir: path to simulation setup (string)
+        :return: version of the snapshot (int) or None if there is no recent snapshot
+        '''
+        return self.status_snapshots.current_version( dir )
+
+
+    def get_sim_ids_version( self, dir ):
+        '''
+        Get a version stamp for the simulation IDs of a mosaik-docker simulation setup.
+        The simulation IDs are stored in the setup's configuration file, hence the version
+        stamp is derived from the file's contents. The modification time and size are not
+        sufficient: cancelling a simulation moves its ID from one list to the other without
+        changing the size, and the modification time may be too coarse to tell updates apart.
+
+        :param dir: path to simulation setup (string)
+        :return: version stamp (string) or None if the configuration file is not accessible
+        '''
+        try:
+            with open( os.path.join( dir, MD_CONFIG_FILE_NAME ), 'rb' ) as f:
+                return hashlib.sha1( f.read() ).hexdigest()
+        except OSError:
+            return None
+
+
     def get_sim_results( self, dir, id ):
         '''
         Get status of all simulations of a mosaik-docker setup.
@@ -295,6 +640,9 @@ class Execute:
         try:
             sim_id = md_get_sim_results( dir, id, docker_host = self.docker_host )
 
+            self._background.submit( self._record_result_sizes, dir, sim_id )
+            self._background.submit( self.result_index.update, dir, sim_id )
+
             response[ 'code' ] = 0
             response[ 'message' ] = 'retrieved results from simulation with ID = {}'.format( sim_id )
 
@@ -306,19 +654,33 @@ class Execute:
         return response
 
 
-    def get_sim_ids( self, dir ):
+    def get_sim_ids( self, dir, query = None ):
         '''
         Get IDs all running (status 'UP') and finished (status 'DOWN') simulations of a mosaik-docker simulation setup.
 
         :param dir: path to simulation setup (string)
+        :param query: filter, sort and pagination parameters (dict, see class `SimQuery`); if not specified, all IDs are returned
         :return: response with status code and list of IDs.
         '''
 
         response = {}
 
         try:
+            sim_query = SimQuery( **query ) if query is not None else None
+
             sim_ids = md_get_sim_ids( dir )
 
+            if sim_query is not None:
+                for field in ( 'status', 'progress' ):
+                    if sim_query.fields is not None and field in sim_query.fields:
+                        raise ValueError( 'field \'{}\' is not available, use command \'get_sim_status\' instead'.format( field ) )
+
+                records = [
+                    dict( id = id, state = state )
+                    for state in ( 'up', 'down' ) for id in sim_ids[ state ]
+                ]
+                sim_ids = sim_query.apply( self._add_created_times( records, sim_query ) )
+
             response[ 'code' ] = 0
             response[ 'message' ] = sim_ids
 
@@ -330,6 +692,267 @@ class Execute:
         return response
 
 
+    def get_sim_history( self, dir, query = None ):
+        '''
+        Get the history of all simulation runs of a mosaik-docker setup from the persistent run history,
+        including runs whose containers have already been cleared.
+
+        :param dir: path to simulation setup (string)
+        :param query: filter, sort and pagination parameters (dict, see method `RunHistory.get_runs`)
+        :return: response with status code and requested page of simulation runs.
+        '''
+
+        response = {}
+
+        try:
+            # Make sure that all events recorded so far are included.
+            self.run_history.flush()
+
+            runs = self.run_history.get_runs( dir, **( query or {} ) )
+
+            response[ 'code' ] = 0
+            response[ 'message' ] = runs
+
+        except Exception as err:
+
+            response[ 'code' ] = 2
+            response[ 'error' ] = str( err )
+
+        return response
+
+
+    def follow_sim_logs( self, dir, id, out_stream, stop, tail = None ):
+        '''
+        Follow the output of a simulation (blocks until the simulation has finished or `stop` is set).
+
+        :param dir: path to simulation setup (string)
+        :param id: simulation ID (string)
+        :param out_stream: output lines of the simulation are passed to this callable; following stops if it returns False (callable)
+        :param stop: following stops as soon as this event is set (threading.Event)
+        :param tail: number of previous output lines to include (int, default: all)
+        :return: response with status code and message or error message.
+        '''
+
+        response = {}
+
+        try:
+            ids = md_get_sim_ids( dir )
+            if id not in ids[ 'up' ] and id not in ids[ 'down' ]:
+                raise Exception( 'unknown simulation ID: {}'.format( id ) )
+
+            cmd = [ 'docker', 'logs', '--follow' ]
+            if tail is not None:
+                cmd.extend( [ '--tail', str( int( tail ) ) ] )
+            cmd.append( id )
+
+            p = subprocess.Popen(
+                cmd,
+                env = dict( DOCKER_HOST = self.docker_host ),
+                stdout = subprocess.PIPE,
+                stderr = subprocess.STDOUT
+            )
+
+            # Stop the process when following is stopped (the output may be idle for a long time).
+            def watch():
+                while not stop.wait( 0.5 ):
+                    if p.poll() is not None:
+                        return
+                p.kill()
+            threading.Thread( target = watch, daemon = True ).start()
+
+            for line in p.stdout:
+                if False == out_stream( line.decode( 'utf-8', errors = 'replace' ) ):
+                    stop.set()
+                    break
+
+            p.wait()
+
+            response[ 'code' ] = 0
+            response[ 'message' ] = 'output of simulation {} {}'.format( id, 'no longer followed' if stop.is_set() else 'ended' )
+
+        except Exception as err:
+
+            response[ 'code' ] = 2
+            response[ 'error' ] = str( err )
+
+        return response
+
+
+    def get_build_context( self, dir ):
+        '''
+        Compute the build context of a simulation setup's orchestrator image, without building it.
+
+        :param dir: path to simulation setup (string)
+        :return: response with status code and build context summary (see `BuildContext.summary`) or error message.
+        '''
+
+        response = {}
+
+        try:
+            context = BuildContext( dir, self.default_ignore_rules )
+            response[ 'code' ] = 0
+            response[ 'message' ] = context.summary()
+            response[ 'message' ][ 'warn_size' ] = self.build_context_warn_size
+
+        except Exception as err:
+
+            response[ 'code' ] = 2
+            response[ 'error' ] = str( err )
+
+        return response
+
+
+    def get_image_cache( self ):
+        '''
+        Retrieve information about the cached base images.
+
+        :return: response with status code and cache information (see `ImageCache.get_info`) or error message.
+        '''
+
+        response = {}
+
+        try:
+            if self.image_cache is None:
+                raise Exception( 'image cache is disabled' )
+
+            response[ 'code' ] = 0
+            response[ 'message' ] = self.image_cache.get_info()
+
+        except Exception as err:
+
+            response[ 'code' ] = 2
+            response[ 'error' ] = str( err )
+
+        return response
+
+
+    def get_result_index( self, dir, sim_ids = None ):
+        '''
+        Retrieve the index of the retrieved result files of a simulation setup (see class `ResultIndex`).
+        The index is updated for the files of the selected simulations that have changed since they
+        were last indexed or, if no simulations are selected, for results that have not been indexed yet.
+
+        :param dir: path to simulation setup (string)
+        :param sim_ids: only include the results of these simulations (list of strings, default: all)
+        :return: response with status code and list of result files (see `ResultIndex.get_info`) or error message.
+        '''
+
+        response = {}
+
+        try:
+            self._update_result_index( dir, sim_ids )
+
+            response[ 'code' ] = 0
+            response[ 'message' ] = self.result_index.get_info( dir, sim_ids )
+
+        except Exception as err:
+
+            response[ 'code' ] = 2
+            response[ 'error' ] = str( err )
+
+        return response
+
+
+    def query_sim_results( self, dir, sim_ids = None, entities = None, attrs = None, start = None, end = None, offset = 0 ):
+        '''
+        Select time series from the retrieved results of many simulations at once (see `ResultIndex.query`).
+        Large selections are split into pages, the response contains the offset of the next page.
+
+        :param dir: path to simulation setup (string)
+        :param sim_ids: only include the results of these simulations (list of strings, default: all)
+        :param entities: only include entities matching one of these patterns (list of strings, glob syntax, default: all)
+        :param attrs: only include attributes matching one of these patterns (list of strings, glob syntax, default: all)
+        :param start: only include rows at or after this time (number or ISO 8601 string)
+        :param end: only include rows at or before this time (number or ISO 8601 string)
+        :param offset: offset of the page, as returned with the previous page (int)
+        :return: response with status code and time series in binary format (see function `encode_series`) or error message.
+        '''
+
+        response = {}
+
+        try:
+            self._update_result_index( dir, sim_ids )
+            series, next_offset = self.result_index.query( dir, sim_ids, entities, attrs, start, end, offset )
+
+            response[ 'code' ] = 0
+            response[ 'message' ] = encode_series( series, next_offset )
+
+        except Exception as err:
+
+            response[ 'code' ] = 2
+            response[ 'error' ] = str( err )
+
+        return response
+
+
+    def export_sim_setup( self, dir, archive, sim_ids = None, include_image = True ):
+        '''
+        Export a simulation setup to an archive, together with its orchestrator image and the
+        retrieved results of selected simulations (see function `export_sim_setup` of module `setup_archive`).
+
+        :param dir: path to simulation setup (string)
+        :param archive: path to the archive, must not exist yet (string)
+        :param sim_ids: IDs of the simulations whose retrieved results are included (list of strings or 'all', default: none)
+        :param include_image: include the orchestrator image, such that the setup does not have to be rebuilt (boolean)
+        :return: response with status code and summary of the archive contents or error message.
+        '''
+
+        response = {}
+
+        try:
+            if 'all' == sim_ids:
+                sim_ids = sorted( set( MDConfigData( dir )[ 'sim_ids_down' ] ) | set( self.result_index.get_sim_ids( dir ) ) )
+                sim_ids = [ id for id in sim_ids if os.path.isdir( os.path.join( dir, id ) ) ]
+
+            summary = export_sim_setup( dir, archive, self.docker_host, sim_ids or [], include_image )
+
+            response[ 'code' ] = 0
+            response[ 'message' ] = format_summary( summary )
+            response[ 'summary' ] = summary
+
+        except Exception as err:
+
+            response[ 'code' ] = 2
+            response[ 'error' ] = str( err )
+
+        return response
+
+
+    def import_sim_setup( self, archive, dir, overwrite_image = False ):
+        '''
+        Import a simulation setup from an archive created with command `export_sim_setup`. The archive
+        is verified before anything is restored. The orchestrator image (if included) is loaded, hence
+        the simulation setup does not have to be rebuilt.
+
+        :param archive: path to the archive (string)
+        :param dir: path to the restored simulation setup, must not exist yet (string)
+        :param overwrite_image: replace an existing, different image with the name of the included orchestrator image (boolean)
+        :return: response with status code and message or error message.
+        '''
+
+        response = {}
+
+        try:
+            summary = import_sim_setup( archive, dir, self.docker_host, overwrite_image = overwrite_image )
+
+            # Included results are indexed right away.
+            self._background.submit( self.result_index.update, dir, summary[ 'results' ] )
+
+            response[ 'code' ] = 0
+            response[ 'message' ] = 'imported simulation setup {} ({} files{}{})'.format(
+                summary[ 'setup_dir' ], summary[ 'files' ],
+                ', results of {} simulations'.format( len( summary[ 'results' ] ) ) if summary[ 'results' ] else '',
+                ', image {}'.format( summary[ 'image' ] ) if summary[ 'image' ] else ''
+            )
+
+        except Exception as err:
+
+            response[ 'code' ] = 2
+            response[ 'error' ] = str( err )
+
+        return response
+
+
     def build_sim_setup( self, dir, out_stream ):
         '''
         Build simulation setup as preparation for running the simulation.
@@ -349,11 +972,27 @@ class Execute:
 
         try:
 
-            build_status = md_build_sim_setup( dir, out_stream, docker_host = self.docker_host )
+            # Restore base images that have been removed from the Docker daemon (failures are not critical).
+            if self.image_cache is not None:
+                try:
+                    self.image_cache.restore( dir, out_stream )
+                except Exception as err:
+                    out_stream( 'restoring base images from cache failed: {}\n'.format( err ) )
+
+            build_status = build_sim_setup( dir, out_stream, docker_host = self.docker_host, default_rules = self.default_ignore_rules )
 
             response[ 'code' ] = 0 if build_status['valid'] else 1
             response[ 'message' ] = build_status['status']
 
+            if build_status['valid']:
+                # Replace pooled containers created from the previous build.
+                if self.warm_pool is not None:
+                    self._background.submit( self.warm_pool.refill, dir )
+
+                # Add the base images to the cache.
+                if self.image_cache is not None:
+                    self._image_cache_worker.submit( self.image_cache.store, dir )
+
         except Exception as err:
 
             response[ 'code' ] = 2
@@ -1,14 +1,26 @@
 from ._module_name import __module_name__
 
+import asyncio
+import gzip
+import hashlib
 import json
 
 from jupyter_server.base.handlers import APIHandler, JupyterHandler
 from jupyter_server.base.zmqhandlers import WebSocketMixin
 from jupyter_server.utils import url_path_join as ujoin
+from .channel import Channel, BuildStream, StatusStream, LogsStream
+from .deadlines import run_command, get_deadline, aborted_response, CommandAborted
 from tornado.websocket import WebSocketHandler
 import tornado
 
 
+# Responses larger than this (in bytes) are compressed.
+COMPRESSION_MIN_SIZE = 8192
+
+# Compression level for responses (trade-off between CPU and bandwidth).
+COMPRESSION_LEVEL = 5
+
+
 class ExeHandler:
     '''
     Parent class for execution handlers.
@@ -22,6 +34,132 @@ class ExeHandler:
     def log( self ):
         return self.settings['log']
 
+    def finish_json( self, response, etag = None ):
+        '''
+        Finish the request with a JSON response.
+
+        If an entity tag is specified and matches the request's `If-None-Match` header, only status 304
+        (not modified) is sent back. Large responses are compressed if the client accepts it.
+
+        :param response: response (dict)
+        :param etag: entity tag identifying the response (string)
+        '''
+        if etag is not None:
+            self.set_header( 'ETag', etag )
+            if self.check_etag_header():
+                self.set_status( 304 )
+                return self.finish()
+
+        return self.finish_bytes( json.dumps( response ).encode( 'utf-8' ) )
+
+    def finish_bytes( self, body, content_type = None ):
+        '''
+        Finish the request with a response body, which is compressed if it is large and the client accepts it.
+
+        :param body: response body (bytes)
+        :param content_type: content type of the response body (string, default: same as for JSON responses)
+        '''
+        if len( body ) >= COMPRESSION_MIN_SIZE:
+            self.set_header( 'Vary', 'Accept-Encoding' )
+            if 'gzip' in self.request.headers.get( 'Accept-Encoding', '' ):
+                self.set_header( 'Content-Encoding', 'gzip' )
+                body = gzip.compress( body, compresslevel = COMPRESSION_LEVEL )
+
+        if content_type is not None:
+            return self.finish( body, set_content_type = content_type )
+        return self.finish( body )
+
+    async def execute( self, command, fn, dir = None ):
+        '''
+        Execute a command in a worker thread, subject to the command's deadline. The command
+        is cancelled if the client closes the connection before the command has finished.
+
+        :param command: command name, determines the deadline (string)
+        :param fn: function executing the command (callable without arguments)
+        :param dir: path to the simulation setup affected by the command, see `run_command` (string)
+        :return: command response (dict), with code 3 (deadline exceeded) or 4 (cancelled) if the command has been aborted
+        '''
+        self._cancelled = asyncio.Event()
+        try:
+            return await run_command( fn, get_deadline( self.exe.deadlines, command ), self._cancelled, dir, command, self.exe.executor )
+        except CommandAborted as err:
+            return aborted_response( err )
+
+    def on_connection_close( self ):
+        cancelled = getattr( self, '_cancelled', None )
+        if cancelled is not None:
+            cancelled.set()
+        super().on_connection_close()
+
+
+def _make_etag( *args ):
+    '''
+    Create an entity tag from the version of a resource and the request parameters.
+    '''
+    digest = hashlib.sha1( json.dumps( args, sort_keys = True ).encode( 'utf-8' ) ).hexdigest()
+    return '"{}"'.format( digest )
+
+
+def _get_sim_query( data ):
+    '''
+    Retrieve optional filter, sort and pagination parameters from request data.
+
+    Input format (all items optional):
+        {
+          'query': {
+            'states': list of simulation states to include ('up' and/or 'down'),
+            'idPrefix': only include simulations whose ID starts with this prefix,
+            'createdAfter': only include simulations created at or after this time (ISO 8601),
+            'createdBefore': only include simulations created before this time (ISO 8601),
+            'sort': sort key ('id', 'state' or 'created'),
+            'descending': sort in descending order (boolean),
+            'limit': maximum number of items per page,
+            'cursor': cursor returned with the previous page,
+            'fields': list of fields to include for each item
+          }
+        }
+
+    :return: query parameters (dict) or None if no query has been specified
+    '''
+    query = data.get( 'query' )
+    if query is None:
+        return None
+
+    keys = {
+        'states': 'states',
+        'idPrefix': 'id_prefix',
+        'createdAfter': 'created_after',
+        'createdBefore': 'created_before',
+        'sort': 'sort',
+        'descending': 'descending',
+        'limit': 'limit',
+        'cursor': 'cursor',
+        'fields': 'fields',
+    }
+
+    return { keys[k]: v for k, v in query.items() if k in keys }
+
+
+def _get_history_query( data ):
+    '''
+    Retrieve optional filter, sort and pagination parameters for the run history from request data
+    (see handler for command `get_sim_history`).
+
+    :return: query parameters (dict)
+    '''
+    keys = {
+        'states': 'states',
+        'idPrefix': 'id_prefix',
+        'startedAfter': 'started_after',
+        'startedBefore': 'started_before',
+        'sort': 'sort',
+        'descending': 'descending',
+        'limit': 'limit',
+        'cursor': 'cursor',
+    }
+
+    return { keys[k]: v for k, v in ( data.get( 'query' ) or {} ).items() if k in keys }
+
 
 class VersionHandler( ExeHandler, APIHandler ):
 
@@ -48,7 +186,7 @@ class GetUserHomeDirHandler( ExeHandler, APIHandler ):
 class GetSimSetupRootHandler( ExeHandler, APIHandler ):
 
     @tornado.web.authenticated
-    def post( self ):
+    async def post( self ):
         '''
         Handler for `get_sim_setup_root` command
 
@@ -62,7 +200,7 @@ class GetSimSetupRootHandler( ExeHandler, APIHandler ):
         dir = data['dir'] if data['dir'] else '.'
 
         # Execute `get_sim_setup_root` command and retrieve response.
-        response = self.exe.get_sim_setup_root( dir )
+        response = await self.execute( 'get_sim_setup_root', lambda: self.exe.get_sim_setup_root( dir ) )
 
         # Return response.
         self.finish( json.dumps( response ) )
@@ -71,7 +209,7 @@ class GetSimSetupRootHandler( ExeHandler, APIHandler ):
 class CreateSimSetupHandler( ExeHandler, APIHandler ):
 
     @tornado.web.authenticated
-    def post( self ):
+    async def post( self ):
         '''
         Handler for `create_sim_setup` command
 
@@ -87,7 +225,7 @@ class CreateSimSetupHandler( ExeHandler, APIHandler ):
         dir = data['dir'] if data['dir'] else '.'
 
         # Execute `create_sim_setup` command and retrieve response.
-        response = self.exe.create_sim_setup( name, dir )
+        response = await self.execute( 'create_sim_setup', lambda: self.exe.create_sim_setup( name, dir ) )
 
         # Return response.
         self.finish( json.dumps( response ) )
@@ -96,7 +234,7 @@ class CreateSimSetupHandler( ExeHandler, APIHandler ):
 class ConfigureSimSetupHandler( ExeHandler, APIHandler ):
 
     @tornado.web.authenticated
-    def post( self ):
+    async def post( self ):
         '''
         Handler for `configure_sim_setup` command
 
@@ -120,7 +258,7 @@ class ConfigureSimSetupHandler( ExeHandler, APIHandler ):
         results = [ r.strip() for r in data['results'] ]
 
         # Execute `configure_sim_setup` command and retrieve response.
-        response = self.exe.configure_sim_setup( dir, docker_file, scenario_file, extra_files, extra_dirs, results )
+        response = await self.execute( 'configure_sim_setup', lambda: self.exe.configure_sim_setup( dir, docker_file, scenario_file, extra_files, extra_dirs, results ), dir )
 
         # Return response.
         self.finish( json.dumps( response ) )
@@ -129,7 +267,7 @@ class ConfigureSimSetupHandler( ExeHandler, APIHandler ):
 class CheckSimSetupHandler( ExeHandler, APIHandler ):
 
     @tornado.web.authenticated
-    def post( self ):
+    async def post( self ):
         '''
         Handler for `check_sim_setup` command
 
@@ -143,7 +281,7 @@ class CheckSimSetupHandler( ExeHandler, APIHandler ):
         dir = data['dir'] if data['dir'] else '.'
 
         # Execute `check_sim_setup` command and retrieve response.
-        response = self.exe.check_sim_setup( dir )
+        response = await self.execute( 'check_sim_setup', lambda: self.exe.check_sim_setup( dir ), dir )
 
         # Return response.
         self.finish( json.dumps( response ) )
@@ -152,7 +290,7 @@ class CheckSimSetupHandler( ExeHandler, APIHandler ):
 class DeleteSimSetupHandler( ExeHandler, APIHandler ):
 
     @tornado.web.authenticated
-    def post( self ):
+    async def post( self ):
         '''
         Handler for `delete_sim_setup` command
 
@@ -166,7 +304,7 @@ class DeleteSimSetupHandler( ExeHandler, APIHandler ):
         dir = data['dir'] if data['dir'] else '.'
 
         # Execute `check_sim_setup` command and retrieve response.
-        response = self.exe.delete_sim_setup( dir )
+        response = await self.execute( 'delete_sim_setup', lambda: self.exe.delete_sim_setup( dir ), dir )
 
         # Return response.
         self.finish( json.dumps( response ) )
@@ -175,7 +313,7 @@ class DeleteSimSetupHandler( ExeHandler, APIHandler ):
 class StartSimHandler( ExeHandler, APIHandler ):
 
     @tornado.web.authenticated
-    def post( self ):
+    async def post( self ):
         '''
         Handler for `start_sim` command
 
@@ -189,7 +327,7 @@ class StartSimHandler( ExeHandler, APIHandler ):
         dir = data['dir'] if data['dir'] else '.'
 
         # Execute `start_sim` command and retrieve response.
-        response = self.exe.start_sim( dir )
+        response = await self.execute( 'start_sim', lambda: self.exe.start_sim( dir ), dir )
 
         # Return response.
         self.finish( json.dumps( response ) )
@@ -198,7 +336,7 @@ class StartSimHandler( ExeHandler, APIHandler ):
 class CancelSimHandler( ExeHandler, APIHandler ):
 
     @tornado.web.authenticated
-    def post( self ):
+    async def post( self ):
         '''
         Handler for `cancel_sim` command
 
@@ -214,7 +352,7 @@ class CancelSimHandler( ExeHandler, APIHandler ):
         id = data['id']
 
         # Execute `cancel_sim` command and retrieve response.
-        response = self.exe.cancel_sim( dir, id )
+        response = await self.execute( 'cancel_sim', lambda: self.exe.cancel_sim( dir, id ), dir )
 
         # Return response.
         self.finish( json.dumps( response ) )
@@ -223,7 +361,7 @@ class CancelSimHandler( ExeHandler, APIHandler ):
 class ClearSimHandler( ExeHandler, APIHandler ):
 
     @tornado.web.authenticated
-    def post( self ):
+    async def post( self ):
         '''
         Handler for `clear_sim` command
 
@@ -239,7 +377,7 @@ class ClearSimHandler( ExeHandler, APIHandler ):
         id = data['id']
 
         # Execute `clear_sim` command and retrieve response.
-        response = self.exe.clear_sim( dir, id )
+        response = await self.execute( 'clear_sim', lambda: self.exe.clear_sim( dir, id ), dir )
 
         # Return response.
         self.finish( json.dumps( response ) )
@@ -248,30 +386,57 @@ class ClearSimHandler( ExeHandler, APIHandler ):
 class GetSimStatusHandler( ExeHandler, APIHandler ):
 
     @tornado.web.authenticated
-    def post( self ):
+    async def post( self ):
         '''
         Handler for `get_sim_status` command
 
+        Supports conditional requests: the response's entity tag is derived from the version
+        of the status snapshot (and the progress information, if a query is specified), hence
+        status 304 (not modified) is returned if nothing changed. If the snapshot has been updated
+        recently, status 304 is returned without executing the command.
+
         Input format:
             {
-              'dir': 'directory of the simulation setup'
+              'dir': 'directory of the simulation setup',
+              'query': optional filter, sort and pagination parameters (see function `_get_sim_query`),
+              'sinceVersion': optional version, only return the changes since this version
             }
         '''
         # Retrieve data.
         data = json.loads( self.request.body.decode( 'utf-8' ) )
         dir = data['dir'] if data['dir'] else '.'
+        query = _get_sim_query( data )
+        since_version = data.get( 'sinceVersion' )
+
+        # The progress of running simulations is not covered by the snapshot version, hence the revision
+        # of the progress information is part of the entity tag. It is retrieved before executing the
+        # command: if the progress changes meanwhile, the entity tag is outdated and the next request
+        # receives the complete response again (instead of status 304 for outdated progress).
+        progress = self.exe.progress_tracker.revision if query is not None else None
+
+        # Check if the client's version is still up to date.
+        version = self.exe.get_sim_status_version( dir )
+        if version is not None and self.request.headers.get( 'If-None-Match' ):
+            self.set_header( 'ETag', _make_etag( 'get_sim_status', dir, version, query, since_version, progress ) )
+            if self.check_etag_header():
+                self.set_status( 304 )
+                return self.finish()
+            self.clear_header( 'ETag' )
 
         # Execute `get_sim_status` command and retrieve response.
-        response = self.exe.get_sim_status( dir )
+        response = await self.execute( 'get_sim_status', lambda: self.exe.get_sim_status( dir, query, since_version ), dir )
 
         # Return response.
-        self.finish( json.dumps( response ) )
+        etag = None
+        if 'version' in response:
+            etag = _make_etag( 'get_sim_status', dir, response['version'], query, since_version, progress )
+        self.finish_json( response, etag )
 
 
 class GetSimResultsHandler( ExeHandler, APIHandler ):
 
     @tornado.web.authenticated
-    def post( self ):
+    async def post( self ):
         '''
         Handler for `get_sim_results` command
 
@@ -287,7 +452,7 @@ class GetSimResultsHandler( ExeHandler, APIHandler ):
         id = data['id']
 
         # Execute `get_sim_results` command and retrieve response.
-        response = self.exe.get_sim_results( dir, id )
+        response = await self.execute( 'get_sim_results', lambda: self.exe.get_sim_results( dir, id ), dir )
 
         # Return response.
         self.finish( json.dumps( response ) )
@@ -296,21 +461,235 @@ class GetSimResultsHandler( ExeHandler, APIHandler ):
 class GetSimIdsHandler( ExeHandler, APIHandler ):
 
     @tornado.web.authenticated
-    def post( self ):
+    async def post( self ):
         '''
         Handler for `get_sim_ids` command
 
+        Supports conditional requests: the response's entity tag is derived from the version
+        of the simulation setup configuration, hence status 304 (not modified) is returned
+        without executing the command if nothing changed.
+
         Input format:
             {
-              'dir': 'directory of the simulation setup'
+              'dir': 'directory of the simulation setup',
+              'query': optional filter, sort and pagination parameters (see function `_get_sim_query`)
             }
         '''
         # Retrieve data.
         data = json.loads( self.request.body.decode( 'utf-8' ) )
         dir = data['dir'] if data['dir'] else '.'
+        query = _get_sim_query( data )
+
+        # Check if the client's version is still up to date.
+        version = self.exe.get_sim_ids_version( dir )
+        etag = _make_etag( 'get_sim_ids', dir, version, query ) if version is not None else None
+        if etag is not None:
+            self.set_header( 'ETag', etag )
+            if self.check_etag_header():
+                self.set_status( 304 )
+                return self.finish()
 
         # Execute `get_sim_ids` command and retrieve response.
-        response = self.exe.get_sim_ids( dir )
+        response = await self.execute( 'get_sim_ids', lambda: self.exe.get_sim_ids( dir, query ), dir )
+        if 0 != response['code']:
+            self.clear_header( 'ETag' )
+
+        # Return response.
+        self.finish_json( response )
+
+
+class GetSimHistoryHandler( ExeHandler, APIHandler ):
+
+    @tornado.web.authenticated
+    async def post( self ):
+        '''
+        Handler for `get_sim_history` command
+
+        Input format:
+            {
+              'dir': 'directory of the simulation setup',
+              'query': {
+                'states': list of run states to include ('up', 'down' and/or 'cleared'),
+                'idPrefix': only include runs whose simulation ID starts with this prefix,
+                'startedAfter': only include runs started at or after this time (ISO 8601),
+                'startedBefore': only include runs started before this time (ISO 8601),
+                'sort': sort key ('started' or 'id'),
+                'descending': sort in descending order (boolean),
+                'limit': maximum number of items per page,
+                'cursor': cursor returned with the previous page
+              }
+            }
+        '''
+        # Retrieve data.
+        data = json.loads( self.request.body.decode( 'utf-8' ) )
+        dir = data['dir'] if data['dir'] else '.'
+        query = _get_history_query( data )
+
+        # Execute `get_sim_history` command and retrieve response.
+        response = await self.execute( 'get_sim_history', lambda: self.exe.get_sim_history( dir, query ) )
+
+        # Return response.
+        self.finish_json( response )
+
+
+class GetBuildContextHandler( ExeHandler, APIHandler ):
+
+    @tornado.web.authenticated
+    async def post( self ):
+        '''
+        Handler for `get_build_context` command
+
+        Input format:
+            {
+              'dir': 'directory of the simulation setup'
+            }
+        '''
+        # Retrieve data.
+        data = json.loads( self.request.body.decode( 'utf-8' ) )
+        dir = data['dir'] if data['dir'] else '.'
+
+        # Execute `get_build_context` command and retrieve response.
+        response = await self.execute( 'get_build_context', lambda: self.exe.get_build_context( dir ) )
+
+        # Return response.
+        self.finish_json( response )
+
+
+class GetImageCacheHandler( ExeHandler, APIHandler ):
+
+    @tornado.web.authenticated
+    async def get( self ):
+        '''
+        Handler for `get_image_cache` command
+        '''
+        # Execute `get_image_cache` command and retrieve response.
+        response = await self.execute( 'get_image_cache', lambda: self.exe.get_image_cache() )
+
+        # Return response.
+        self.finish_json( response )
+
+
+class GetResultIndexHandler( ExeHandler, APIHandler ):
+
+    @tornado.web.authenticated
+    async def post( self ):
+        '''
+        Handler for `get_result_index` command
+
+        Input format:
+            {
+              'dir': 'directory of the simulation setup',
+              'simIds': only include the results of these simulations (optional)
+            }
+        '''
+        # Retrieve data.
+        data = json.loads( self.request.body.decode( 'utf-8' ) )
+        dir = data['dir'] if data['dir'] else '.'
+        sim_ids = data.get( 'simIds' )
+
+        # Execute `get_result_index` command and retrieve response.
+        response = await self.execute( 'get_result_index', lambda: self.exe.get_result_index( dir, sim_ids ), dir )
+
+        # Return response.
+        self.finish_json( response )
+
+
+class QuerySimResultsHandler( ExeHandler, APIHandler ):
+
+    @tornado.web.authenticated
+    async def post( self ):
+        '''
+        Handler for `query_sim_results` command
+
+        On success, the selected time series are returned in binary format with content type
+        'application/octet-stream' (see function `encode_series`), otherwise a JSON response
+        with the error is returned.
+
+        Input format:
+            {
+              'dir': 'directory of the simulation setup',
+              'simIds': only include the results of these simulations (optional),
+              'entities': only include entities matching one of these patterns (optional, glob syntax),
+              'attrs': only include attributes matching one of these patterns (optional, glob syntax),
+              'start': only include rows at or after this time (optional, number or ISO 8601),
+              'end': only include rows at or before this time (optional, number or ISO 8601),
+              'offset': offset of the page, as returned with the previous page (optional)
+            }
+        '''
+        # Retrieve data.
+        data = json.loads( self.request.body.decode( 'utf-8' ) )
+        dir = data['dir'] if data['dir'] else '.'
+        sim_ids = data.get( 'simIds' )
+        entities = data.get( 'entities' )
+        attrs = data.get( 'attrs' )
+        start = data.get( 'start' )
+        end = data.get( 'end' )
+        offset = data.get( 'offset', 0 )
+
+        # Execute `query_sim_results` command and retrieve response.
+        response = await self.execute(
+            'query_sim_results', lambda: self.exe.query_sim_results( dir, sim_ids, entities, attrs, start, end, offset ), dir
+        )
+
+        # Return response.
+        if 0 != response['code']:
+            return self.finish_json( response )
+        self.finish_bytes( response['message'], 'application/octet-stream' )
+
+
+class ExportSimSetupHandler( ExeHandler, APIHandler ):
+
+    @tornado.web.authenticated
+    async def post( self ):
+        '''
+        Handler for `export_sim_setup` command
+
+        Input format:
+            {
+              'dir': 'directory of the simulation setup',
+              'archive': 'path to the archive',
+              'simIds': IDs of the simulations whose results are included (optional, list of strings or 'all'),
+              'includeImage': include the orchestrator image (optional, default: true)
+            }
+        '''
+        # Retrieve data.
+        data = json.loads( self.request.body.decode( 'utf-8' ) )
+        dir = data['dir'] if data['dir'] else '.'
+        archive = data['archive']
+        sim_ids = data.get( 'simIds' )
+        include_image = data.get( 'includeImage', True )
+
+        # Execute `export_sim_setup` command and retrieve response.
+        response = await self.execute(
+            'export_sim_setup', lambda: self.exe.export_sim_setup( dir, archive, sim_ids, include_image ), dir
+        )
+
+        # Return response.
+        self.finish( json.dumps( response ) )
+
+
+class ImportSimSetupHandler( ExeHandler, APIHandler ):
+
+    @tornado.web.authenticated
+    async def post( self ):
+        '''
+        Handler for `import_sim_setup` command
+
+        Input format:
+            {
+              'archive': 'path to the archive',
+              'dir': 'directory of the restored simulation setup (must not exist yet)',
+              'overwriteImage': replace an existing, different orchestrator image with the same name (optional, default: false)
+            }
+        '''
+        # Retrieve data.
+        data = json.loads( self.request.body.decode( 'utf-8' ) )
+        archive = data['archive']
+        dir = data['dir']
+        overwrite_image = data.get( 'overwriteImage', False )
+
+        # Execute `import_sim_setup` command and retrieve response.
+        response = await self.execute( 'import_sim_setup', lambda: self.exe.import_sim_setup( archive, dir, overwrite_image ), dir )
 
         # Return response.
         self.finish( json.dumps( response ) )
@@ -326,9 +705,14 @@ class BuildSimSetupHandler( WebSocketMixin, WebSocketHandler, ExeHandler, Jupyte
         data = json.loads( message )
         sim_setup_dir = data['dir']
 
-        # Execute `build_sim_setup` command and retrieve response.
-        response = self.exe.build_sim_setup( sim_setup_dir, self.write_message )
-        self.write_message( response['message'] )
+        # Execute `build_sim_setup` command and retrieve response (the build output is
+        # sent from the worker thread, the build is aborted if the web socket is closed).
+        loop = asyncio.get_running_loop()
+        out_stream = lambda line: loop.call_soon_threadsafe( self._write_output, line )
+        response = await self.execute( 'build_sim_setup', lambda: self.exe.build_sim_setup( sim_setup_dir, out_stream ), sim_setup_dir )
+        if self.ws_connection is None:
+            return
+        self.write_message( response['message'] if 'message' in response else response['error'] )
 
         # Close the web socket.
         exit_code = response['code']
@@ -336,6 +720,93 @@ class BuildSimSetupHandler( WebSocketMixin, WebSocketHandler, ExeHandler, Jupyte
 
     def on_close(self):
         self.log.info( f'WebSocket closed: { self.close_reason }' )
+        cancelled = getattr( self, '_cancelled', None )
+        if cancelled is not None:
+            cancelled.set()
+
+    def _write_output( self, line ):
+        if self.ws_connection is not None:
+            self.write_message( line )
+
+
+def _dir( data ):
+    return data['dir'] if data.get( 'dir' ) else '.'
+
+
+# Commands available via the channel: functions mapping the request data (same format as for the
+# corresponding handlers) to the command, and the key of the simulation setup directory (if any).
+# Command `query_sim_results` returns binary data and is only available as separate HTTP request.
+CHANNEL_COMMANDS = {
+    'version': ( lambda exe, data: exe.version(), None ),
+    'get_user_home_dir': ( lambda exe, data: exe.get_user_home_dir(), None ),
+    'get_sim_setup_root': ( lambda exe, data: exe.get_sim_setup_root( _dir( data ) ), None ),
+    'create_sim_setup': ( lambda exe, data: exe.create_sim_setup( data['name'], _dir( data ) ), None ),
+    'configure_sim_setup': ( lambda exe, data: exe.configure_sim_setup(
+        _dir( data ),
+        data['dockerFile'].strip(),
+        data['scenarioFile'].strip(),
+        [ f.strip() for f in data['extraFiles'] ],
+        [ d.strip() for d in data['extraDirs'] ],
+        [ r.strip() for r in data['results'] ]
+    ), 'dir' ),
+    'check_sim_setup': ( lambda exe, data: exe.check_sim_setup( _dir( data ) ), 'dir' ),
+    'delete_sim_setup': ( lambda exe, data: exe.delete_sim_setup( _dir( data ) ), 'dir' ),
+    'start_sim': ( lambda exe, data: exe.start_sim( _dir( data ) ), 'dir' ),
+    'cancel_sim': ( lambda exe, data: exe.cancel_sim( _dir( data ), data['id'] ), 'dir' ),
+    'clear_sim': ( lambda exe, data: exe.clear_sim( _dir( data ), data['id'] ), 'dir' ),
+    'get_sim_status': ( lambda exe, data: exe.get_sim_status( _dir( data ), _get_sim_query( data ), data.get( 'sinceVersion' ) ), 'dir' ),
+    'get_sim_results': ( lambda exe, data: exe.get_sim_results( _dir( data ), data['id'] ), 'dir' ),
+    'get_sim_ids': ( lambda exe, data: exe.get_sim_ids( _dir( data ), _get_sim_query( data ) ), 'dir' ),
+    'get_sim_history': ( lambda exe, data: exe.get_sim_history( _dir( data ), _get_history_query( data ) ), None ),
+    'get_build_context': ( lambda exe, data: exe.get_build_context( _dir( data ) ), None ),
+    'get_image_cache': ( lambda exe, data: exe.get_image_cache(), None ),
+    'get_result_index': ( lambda exe, data: exe.get_result_index( _dir( data ), data.get( 'simIds' ) ), 'dir' ),
+    'export_sim_setup': ( lambda exe, data: exe.export_sim_setup(
+        _dir( data ), data['archive'], data.get( 'simIds' ), data.get( 'includeImage', True )
+    ), 'dir' ),
+    'import_sim_setup': ( lambda exe, data: exe.import_sim_setup(
+        data['archive'], data['dir'], data.get( 'overwriteImage', False )
+    ), 'dir' ),
+}
+
+# Event streams available via the channel.
+CHANNEL_STREAMS = {
+    'build': BuildStream,
+    'status': StatusStream,
+    'logs': LogsStream,
+}
+
+
+class ChannelHandler( WebSocketMixin, WebSocketHandler, ExeHandler, JupyterHandler ):
+    '''
+    Handler for a persistent connection carrying all commands and event streams of a client
+    (see class `Channel` for the message format). The connection is authenticated once when
+    it is opened.
+    '''
+
+    async def get( self, *args, **kwargs ):
+        if self.current_user is None:
+            self.log.warning( 'Could not authenticate channel connection' )
+            raise tornado.web.HTTPError( 403 )
+        return await super().get( *args, **kwargs )
+
+    def open( self, *args, **kwargs ):
+        super().open( *args, **kwargs )
+        self.channel = Channel( self.exe, CHANNEL_COMMANDS, CHANNEL_STREAMS, self._send )
+
+    def on_message( self, message ):
+        try:
+            data = json.loads( message )
+        except ValueError:
+            self.log.warning( 'Invalid channel message: {}'.format( message[:100] ) )
+            return
+        self.channel.on_message( data )
+
+    def on_close( self ):
+        self.channel.close()
+
+    async def _send( self, message ):
+        await self.write_message( json.dumps( message ) )
 
 
 def setup_handlers( web_app ):
@@ -358,7 +829,15 @@ def setup_handlers( web_app ):
         ( 'get_sim_status', GetSimStatusHandler ),
         ( 'get_sim_results', GetSimResultsHandler ),
         ( 'get_sim_ids', GetSimIdsHandler ),
+        ( 'get_sim_history', GetSimHistoryHandler ),
+        ( 'get_build_context', GetBuildContextHandler ),
+        ( 'get_image_cache', GetImageCacheHandler ),
+        ( 'get_result_index', GetResultIndexHandler ),
+        ( 'query_sim_results', QuerySimResultsHandler ),
+        ( 'export_sim_setup', ExportSimSetupHandler ),
+        ( 'import_sim_setup', ImportSimSetupHandler ),
         ( 'build_sim_setup/(.*)$', BuildSimSetupHandler ),
+        ( 'channel', ChannelHandler ),
     ]
 
     # Retrieve the base URL.
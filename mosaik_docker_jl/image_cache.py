@@ -0,0 +1,336 @@
+'''
+Module for caching the base images of simulation setups on disk
+'''
+import contextlib
+import hashlib
+import os
+import re
+import sqlite3
+import subprocess
+import threading
+import time
+import uuid
+
+from mosaik_docker.util.config_data import ConfigData as MDConfigData
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS images (
+    image TEXT PRIMARY KEY,
+    image_id TEXT NOT NULL,
+    file TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_last_used ON images ( last_used );
+CREATE TABLE IF NOT EXISTS refs (
+    setup_dir TEXT NOT NULL,
+    image TEXT NOT NULL,
+    PRIMARY KEY ( setup_dir, image )
+);
+CREATE INDEX IF NOT EXISTS refs_image ON refs ( image );
+'''
+
+# Instruction `FROM [--platform=<platform>] <image> [AS <name>]` of a Dockerfile.
+_FROM_INSTRUCTION = re.compile( r'^FROM\s+(?:--\S+\s+)*(\S+)(?:\s+AS\s+(\S+))?\s*$', re.IGNORECASE )
+
+# Instruction `ARG <name>[=<default value>]` of a Dockerfile.
+_ARG_INSTRUCTION = re.compile( r'^ARG\s+([A-Za-z_][A-Za-z0-9_]*)(?:=(\S*))?\s*$', re.IGNORECASE )
+
+# Variable reference (`$NAME` or `${NAME}`).
+_VARIABLE = re.compile( r'\$(?:\{([A-Za-z_][A-Za-z0-9_]*)\}|([A-Za-z_][A-Za-z0-9_]*))' )
+
+
+class ImageCache:
+    '''
+    Cache for the base images of the orchestrator images of simulation setups, stored
+    on disk as archives created with `docker save`.
+
+    Simulation setups using the same base images share the same cache entries. For each
+    cache entry, the simulation setups that refer to it are recorded (reference counting).
+    After an image has been built, its base images are added to the cache. Before an
+    image is built, base images missing from the Docker daemon (e.g., because they have
+    been removed or pruned) are restored from the cache, such that the layers of the base
+    images do not have to be pulled or built again.
+
+    The disk space used by the cache is bounded by a soft limit. If the limit is exceeded, the
+    least recently used entries that are not referred to by any simulation setup are evicted.
+    Entries that are still referred to are never evicted, hence the cache may exceed its limit
+    if the base images of all simulation setups together are larger than the limit.
+    '''
+
+    def __init__( self, cache_dir, docker_host, max_size = 5 * 1024 ** 3 ):
+        '''
+        :param cache_dir: directory for storing the cached images and the cache index, created if it does not exist (string)
+        :param docker_host: URL to the daemon socket to connect to when running docker (string)
+        :param max_size: soft limit for the disk space used by the cache (int, bytes)
+        '''
+        self.cache_dir = cache_dir
+        self.docker_host = docker_host
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+        os.makedirs( cache_dir, exist_ok = True )
+
+        with contextlib.closing( self._connect() ) as conn:
+            conn.execute( 'PRAGMA journal_mode = WAL' )
+            conn.executescript( _SCHEMA )
+
+
+    def restore( self, setup_dir, out_stream = None ):
+        '''
+        Load the base images of a simulation setup that are missing from the Docker daemon from the cache.
+
+        :param setup_dir: path to simulation setup (string)
+        :param out_stream: progress messages are sent to this stream (callable)
+        :return: restored base images (list of strings)
+        '''
+        restored = []
+
+        for image in get_base_images( _docker_file_path( setup_dir ) ):
+            if self._image_id( image ) is not None:
+                continue
+
+            # The cached file is opened while holding the lock, such that it can be loaded without holding
+            # the lock, even if it is evicted or replaced in the meantime.
+            with self._lock, contextlib.closing( self._connect() ) as conn:
+                row = conn.execute( 'SELECT file FROM images WHERE image = ?', ( image, ) ).fetchone()
+                try:
+                    f = open( os.path.join( self.cache_dir, row[0] ), 'rb' ) if row is not None else None
+                except FileNotFoundError:
+                    f = None
+            if f is None:
+                continue
+
+            with f:
+                if out_stream is not None:
+                    out_stream( 'restoring base image {} from cache\n'.format( image ) )
+
+                self._docker( 'load', '--quiet', stdin = f )
+
+            with self._lock, contextlib.closing( self._connect() ) as conn:
+                with conn:
+                    conn.execute( 'UPDATE images SET last_used = ? WHERE image = ?', ( time.time(), image ) )
+
+            restored.append( image )
+
+        return restored
+
+
+    def store( self, setup_dir ):
+        '''
+        Add the base images of a simulation setup to the cache and record that the setup refers to them.
+        References to base images that the setup does not use anymore are removed.
+
+        :param setup_dir: path to simulation setup (string)
+        '''
+        key = os.path.realpath( setup_dir )
+        images = get_base_images( _docker_file_path( setup_dir ) )
+
+        with self._lock, contextlib.closing( self._connect() ) as conn:
+            with conn:
+                conn.execute(
+                    'DELETE FROM refs WHERE setup_dir = ? AND image NOT IN ( {} )'.format( ','.join( '?' * len( images ) ) ),
+                    ( key, *images )
+                )
+                conn.executemany(
+                    'INSERT OR IGNORE INTO refs ( setup_dir, image ) VALUES ( ?, ? )',
+                    [ ( key, image ) for image in images ]
+                )
+            cached = {
+                image: ( image_id, file ) for image, image_id, file in conn.execute(
+                    'SELECT image, image_id, file FROM images WHERE image IN ( {} )'.format( ','.join( '?' * len( images ) ) ),
+                    images
+                )
+            }
+
+        # Images are saved without holding the lock, other setups may use the cache in the meantime.
+        stored = []
+        for image in images:
+            image_id = self._image_id( image )
+            if image_id is None:
+                continue
+
+            row = cached.get( image )
+            if row is not None and row[0] == image_id and os.path.isfile( os.path.join( self.cache_dir, row[1] ) ):
+                stored.append( ( image, image_id, row[1], None ) )
+                continue
+
+            # The image is not cached yet or has changed (e.g., a newer version has been pulled).
+            file = '{}.tar'.format( hashlib.sha1( image.encode( 'utf-8' ) ).hexdigest() )
+            path = os.path.join( self.cache_dir, file )
+            tmp_path = '{}.{}.tmp'.format( path, uuid.uuid4().hex )
+            try:
+                self._docker( 'save', '--output', tmp_path, image ) # Save by name to keep the tag.
+                os.replace( tmp_path, path )
+            finally:
+                if os.path.exists( tmp_path ):
+                    os.remove( tmp_path )
+            stored.append( ( image, image_id, file, os.path.getsize( path ) ) )
+
+        with self._lock, contextlib.closing( self._connect() ) as conn:
+            with conn:
+                for image, image_id, file, size in stored:
+                    if size is None:
+                        conn.execute( 'UPDATE images SET last_used = ? WHERE image = ?', ( time.time(), image ) )
+                    else:
+                        conn.execute(
+                            'INSERT OR REPLACE INTO images ( image, image_id, file, size, last_used ) VALUES ( ?, ?, ?, ?, ? )',
+                            ( image, image_id, file, size, time.time() )
+                        )
+
+            self._evict( conn )
+
+
+    def release( self, setup_dir ):
+        '''
+        Remove all references of a simulation setup (e.g., because it has been deleted).
+        Cached images that are not referred to anymore become subject to eviction.
+
+        :param setup_dir: path to simulation setup (string)
+        '''
+        with self._lock, contextlib.closing( self._connect() ) as conn:
+            with conn:
+                conn.execute( 'DELETE FROM refs WHERE setup_dir = ?', ( os.path.realpath( setup_dir ), ) )
+            self._evict( conn )
+
+
+    def get_info( self ):
+        '''
+        Retrieve information about the cache contents.
+
+        :return: dict in the following format:
+            {
+                'size': disk space used by the cache (int, bytes)
+                'max_size': soft limit for the disk space used by the cache (int, bytes)
+                'images': [ {
+                    'image': image name (string)
+                    'image_id': image ID (string)
+                    'size': size of the cached image (int, bytes)
+                    'last_used': time the image was last stored or restored (float, seconds since epoch)
+                    'refs': number of simulation setups referring to the image (int)
+                } ]
+            }
+        '''
+        with contextlib.closing( self._connect() ) as conn:
+            rows = conn.execute(
+                '''SELECT i.image, i.image_id, i.size, i.last_used, COUNT( r.setup_dir )
+                FROM images i LEFT JOIN refs r ON r.image = i.image
+                GROUP BY i.image ORDER BY i.last_used DESC'''
+            ).fetchall()
+
+        images = [
+            dict( image = r[0], image_id = r[1], size = r[2], last_used = r[3], refs = r[4] ) for r in rows
+        ]
+
+        return dict( size = sum( i[ 'size' ] for i in images ), max_size = self.max_size, images = images )
+
+
+    def _evict( self, conn ):
+        '''
+        Evict least recently used images that are not referred to by any simulation setup,
+        until the disk space used by the cache is within its bound (lock must be held).
+        '''
+        total = conn.execute( 'SELECT COALESCE( SUM( size ), 0 ) FROM images' ).fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        candidates = conn.execute(
+            '''SELECT image, file, size FROM images
+            WHERE image NOT IN ( SELECT image FROM refs )
+            ORDER BY last_used'''
+        ).fetchall()
+
+        for image, file, size in candidates:
+            if total <= self.max_size:
+                break
+
+            with conn:
+                conn.execute( 'DELETE FROM images WHERE image = ?', ( image, ) )
+            try:
+                os.remove( os.path.join( self.cache_dir, file ) )
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+    def _image_id( self, image ):
+        '''
+        :return: ID of an image or None if the image does not exist in the Docker daemon
+        '''
+        res = subprocess.run(
+            [ 'docker', 'image', 'inspect', '--format', '{{.Id}}', image ],
+            env = dict( DOCKER_HOST = self.docker_host ),
+            capture_output = True
+        )
+        return res.stdout.decode( 'utf-8' ).strip() if 0 == res.returncode else None
+
+
+    def _docker( self, *args, stdin = None ):
+        '''
+        Execute a docker command.
+
+        :param stdin: input of the command (file object)
+        '''
+        res = subprocess.run(
+            [ 'docker', *args ],
+            env = dict( DOCKER_HOST = self.docker_host ),
+            stdin = stdin,
+            capture_output = True
+        )
+        if 0 != res.returncode:
+            raise Exception( res.stderr.decode( 'utf-8' ).strip() )
+
+
+    def _connect( self ):
+        return sqlite3.connect( os.path.join( self.cache_dir, 'index.sqlite' ), timeout = 30 )
+
+
+def get_base_images( docker_file ):
+    '''
+    Retrieve the base images of all build stages of a Dockerfile. Images referred to
+    by build arguments are resolved with the arguments' default values, images that
+    cannot be resolved, references to previous build stages and 'scratch' are skipped.
+
+    :param docker_file: path to Dockerfile (string)
+    :return: base images (list of strings)
+    '''
+    with open( docker_file, 'r' ) as f:
+        # Join continuation lines.
+        content = re.sub( r'\\\s*\n', ' ', f.read() )
+
+    args = {}
+    stages = set()
+    images = []
+    first_stage = True
+
+    for line in content.splitlines():
+        line = line.strip()
+
+        # Only arguments declared before the first build stage can be used in `FROM` instructions.
+        match = _ARG_INSTRUCTION.match( line )
+        if match is not None and match.group( 2 ) is not None and first_stage:
+            args.setdefault( match.group( 1 ), match.group( 2 ).strip( '"\'' ) )
+            continue
+
+        match = _FROM_INSTRUCTION.match( line )
+        if match is None:
+            continue
+        first_stage = False
+
+        image = _VARIABLE.sub( lambda m: args.get( m.group( 1 ) or m.group( 2 ), '$' ), match.group( 1 ) )
+        if '$' not in image and image.lower() != 'scratch' and image not in stages and image not in images:
+            images.append( image )
+
+        if match.group( 2 ) is not None:
+            stages.add( match.group( 2 ) )
+
+    return images
+
+
+def _docker_file_path( setup_dir ):
+    '''
+    :return: path to the Dockerfile of a simulation setup's orchestrator image
+    '''
+    config_data = MDConfigData( setup_dir )
+    return os.path.join( setup_dir, config_data['orchestrator']['docker_file'].strip() )
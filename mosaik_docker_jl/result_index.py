@@ -0,0 +1,519 @@
+'''
+Module for indexing and querying the retrieved results of simulations
+'''
+import array
+import collections
+import contextlib
+import csv
+import math
+import os
+import sqlite3
+import struct
+import sys
+import threading
+
+from .sim_query import parse_time
+
+
+# Result files that are indexed (CSV files with the time in the first column, like those written by mosaik-csv).
+RESULT_FILE_EXTENSIONS = ( '.csv', )
+
+# Kinds of time columns: numbers (e.g., simulation time), ISO 8601 timestamps (stored as seconds
+# since epoch) or anything else (the row number is used instead).
+TIME_KINDS = ( 'number', 'date', 'row' )
+
+# Maximum number of values (time and data) returned by a single query, larger selections are split into pages.
+MAX_QUERY_VALUES = 1000 * 1000
+
+# Header of the binary format for query results.
+BINARY_MAGIC = b'MDJR'
+BINARY_VERSION = 2
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    setup_dir TEXT NOT NULL,
+    sim_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    time_kind TEXT NOT NULL,
+    time_start REAL,
+    time_end REAL,
+    PRIMARY KEY ( setup_dir, sim_id, path )
+);
+CREATE TABLE IF NOT EXISTS columns (
+    setup_dir TEXT NOT NULL,
+    sim_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    col INTEGER NOT NULL,
+    entity TEXT NOT NULL,
+    attr TEXT NOT NULL,
+    PRIMARY KEY ( setup_dir, sim_id, path, col )
+);
+CREATE INDEX IF NOT EXISTS columns_entity ON columns ( setup_dir, entity, attr );
+CREATE INDEX IF NOT EXISTS columns_attr ON columns ( setup_dir, attr );
+'''
+
+
+class ResultIndex:
+    '''
+    Persistent SQLite index of the result files retrieved from simulations (see command
+    `get_sim_results`), which are stored in sub-directories of the simulation setup named
+    after the simulation IDs.
+
+    For each result file, the index contains the entities and attributes of its columns, the
+    number of rows and the covered time range. The index is updated incrementally: only files
+    whose size or modification time has changed since they were indexed are read again, and
+    files that have been removed are dropped from the index.
+
+    Column names are expected in the format used by mosaik-csv, i.e., '<full entity ID>-<attribute>'.
+    Columns without '-' are indexed with an empty entity.
+    '''
+
+    def __init__( self, path ):
+        '''
+        :param path: path to the SQLite database file, created if it does not exist (string)
+        '''
+        self.path = path
+        self._lock = threading.Lock()
+
+        os.makedirs( os.path.dirname( os.path.abspath( path ) ), exist_ok = True )
+
+        with contextlib.closing( self._connect() ) as conn:
+            conn.execute( 'PRAGMA journal_mode = WAL' )
+            conn.executescript( _SCHEMA )
+
+
+    def update( self, setup_dir, sim_ids ):
+        '''
+        Update the index for the result directories of simulations. Result files are read without
+        holding the index's lock, which is only held while the entries of a single file are written.
+
+        :param setup_dir: path to simulation setup (string)
+        :param sim_ids: IDs of the simulations (list of strings)
+        :return: number of files that have been (re-)indexed (int)
+        '''
+        key = os.path.realpath( setup_dir )
+        indexed = 0
+
+        with contextlib.closing( self._connect() ) as conn:
+            for sim_id in sim_ids:
+                known = {
+                    r[0]: ( r[1], r[2] ) for r in conn.execute(
+                        'SELECT path, size, mtime_ns FROM files WHERE setup_dir = ? AND sim_id = ?', ( key, sim_id )
+                    )
+                }
+
+                found = set()
+                result_dir = os.path.join( key, sim_id )
+                for root, _, files in os.walk( result_dir ):
+                    for f in sorted( files ):
+                        if not f.lower().endswith( RESULT_FILE_EXTENSIONS ):
+                            continue
+
+                        file_path = os.path.join( root, f )
+                        path = os.path.relpath( file_path, result_dir ).replace( os.sep, '/' )
+                        try:
+                            stat = os.stat( file_path )
+                        except OSError:
+                            continue
+
+                        found.add( path )
+                        if known.get( path ) == ( stat.st_size, stat.st_mtime_ns ):
+                            continue
+
+                        info = _scan_file( file_path )
+                        with self._lock, conn:
+                            conn.execute( 'DELETE FROM columns WHERE setup_dir = ? AND sim_id = ? AND path = ?', ( key, sim_id, path ) )
+                            conn.execute(
+                                '''INSERT OR REPLACE INTO files ( setup_dir, sim_id, path, size, mtime_ns, rows, time_kind, time_start, time_end )
+                                VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ? )''',
+                                ( key, sim_id, path, stat.st_size, stat.st_mtime_ns, info[ 'rows' ], info[ 'time_kind' ], info[ 'time_start' ], info[ 'time_end' ] )
+                            )
+                            conn.executemany(
+                                'INSERT INTO columns ( setup_dir, sim_id, path, col, entity, attr ) VALUES ( ?, ?, ?, ?, ?, ? )',
+                                [ ( key, sim_id, path, col, entity, attr ) for col, entity, attr in info[ 'columns' ] ]
+                            )
+                        indexed += 1
+
+                removed = [ ( key, sim_id, path ) for path in known if path not in found ]
+                if removed:
+                    with self._lock, conn:
+                        conn.executemany( 'DELETE FROM files WHERE setup_dir = ? AND sim_id = ? AND path = ?', removed )
+                        conn.executemany( 'DELETE FROM columns WHERE setup_dir = ? AND sim_id = ? AND path = ?', removed )
+
+        return indexed
+
+
+    def get_sim_ids( self, setup_dir ):
+        '''
+        :param setup_dir: path to simulation setup (string)
+        :return: IDs of all simulations with indexed results (list of strings)
+        '''
+        with contextlib.closing( self._connect() ) as conn:
+            return [ r[0] for r in conn.execute(
+                'SELECT DISTINCT sim_id FROM files WHERE setup_dir = ? ORDER BY sim_id', ( os.path.realpath( setup_dir ), )
+            ) ]
+
+
+    def get_info( self, setup_dir, sim_ids = None ):
+        '''
+        Retrieve the indexed result files of a simulation setup.
+
+        :param setup_dir: path to simulation setup (string)
+        :param sim_ids: only include the results of these simulations (list of strings, default: all)
+        :return: list of result files in the following format:
+            [ {
+                'sim_id': simulation ID (string)
+                'path': path of the file within the result directory (string)
+                'size': file size (int, bytes)
+                'rows': number of rows (int)
+                'time_kind': 'number', 'date' (seconds since epoch) or 'row' (row number)
+                'time_start': time of the first row (float)
+                'time_end': time of the last row (float)
+                'entities': attributes of each entity (dict mapping entity IDs to lists of strings)
+            } ]
+        '''
+        key = os.path.realpath( setup_dir )
+        sim_filter, params = _in_filter( 'sim_id', sim_ids )
+
+        with contextlib.closing( self._connect() ) as conn:
+            files = conn.execute(
+                '''SELECT sim_id, path, size, rows, time_kind, time_start, time_end FROM files
+                WHERE setup_dir = ?{} ORDER BY sim_id, path'''.format( sim_filter ), ( key, *params )
+            ).fetchall()
+            columns = conn.execute(
+                'SELECT sim_id, path, entity, attr FROM columns WHERE setup_dir = ?{} ORDER BY col'.format( sim_filter ), ( key, *params )
+            ).fetchall()
+
+        entities = collections.defaultdict( lambda: collections.defaultdict( list ) )
+        for sim_id, path, entity, attr in columns:
+            entities[ ( sim_id, path ) ][ entity ].append( attr )
+
+        return [
+            dict(
+                sim_id = r[0], path = r[1], size = r[2], rows = r[3], time_kind = r[4], time_start = r[5], time_end = r[6],
+                entities = dict( entities.get( ( r[0], r[1] ), {} ) )
+            ) for r in files
+        ]
+
+
+    def query( self, setup_dir, sim_ids = None, entities = None, attrs = None, start = None, end = None, offset = 0 ):
+        '''
+        Select time series from the indexed result files. The result is split into pages of at most
+        `MAX_QUERY_VALUES` values (times and data, estimated from the number of rows and the covered
+        time range of the files), further pages are retrieved by passing the returned offset.
+
+        :param setup_dir: path to simulation setup (string)
+        :param sim_ids: only include the results of these simulations (list of strings, default: all)
+        :param entities: only include entities matching one of these patterns (list of strings, glob syntax, default: all)
+        :param attrs: only include attributes matching one of these patterns (list of strings, glob syntax, default: all)
+        :param start: only include rows at or after this time (number or ISO 8601 string)
+        :param end: only include rows at or before this time (number or ISO 8601 string)
+        :param offset: number of selected time series to skip, i.e., the offset returned with the previous page (int)
+        :return: tuple of the time series and the offset of the next page (int) or None if this is the last page;
+            the time series have the following format:
+            [ {
+                'sim_id': simulation ID (string)
+                'path': path of the file within the result directory (string)
+                'entity': entity ID (string)
+                'attr': attribute (string)
+                'time_kind': 'number', 'date' (seconds since epoch) or 'row' (row number)
+                'times': times of the rows (array.array of doubles)
+                'values': values of the rows, NaN for missing or non-numeric values (array.array of doubles)
+            } ]
+        '''
+        if isinstance( offset, bool ) or not isinstance( offset, int ) or offset < 0:
+            raise ValueError( 'invalid offset: {}'.format( offset ) )
+
+        key = os.path.realpath( setup_dir )
+        start = _time_value( start ) if start is not None else None
+        end = _time_value( end ) if end is not None else None
+
+        sql = '''SELECT c.sim_id, c.path, c.col, c.entity, c.attr, f.time_kind, f.rows, f.time_start, f.time_end
+            FROM columns c JOIN files f ON f.setup_dir = c.setup_dir AND f.sim_id = c.sim_id AND f.path = c.path
+            WHERE c.setup_dir = ?'''
+        params = [ key ]
+
+        sim_filter, sim_params = _in_filter( 'c.sim_id', sim_ids )
+        sql += sim_filter
+        params += sim_params
+        for column, patterns in ( ( 'c.entity', entities ), ( 'c.attr', attrs ) ):
+            if patterns:
+                sql += ' AND ( {} )'.format( ' OR '.join( '{} GLOB ?'.format( column ) for _ in patterns ) )
+                params += patterns
+        if start is not None:
+            sql += ' AND f.time_end >= ?'
+            params.append( start )
+        if end is not None:
+            sql += ' AND f.time_start <= ?'
+            params.append( end )
+        sql += ' ORDER BY c.sim_id, c.path, c.col LIMIT -1 OFFSET ?'
+        params.append( offset )
+
+        with contextlib.closing( self._connect() ) as conn:
+            rows = conn.execute( sql, params ).fetchall()
+
+        # Select the time series of this page and group them by file, such that each file is read only once.
+        selected = collections.OrderedDict()
+        total = 0
+        next_offset = None
+        for i, ( sim_id, path, col, entity, attr, time_kind, n_rows, time_start, time_end ) in enumerate( rows ):
+            n = 2 * _estimate_rows( n_rows, time_start, time_end, start, end )
+            if n > MAX_QUERY_VALUES:
+                raise ValueError( 'time series too large ({} values, maximum: {}), select a shorter time range: {}/{} {}-{}'.format(
+                    n, MAX_QUERY_VALUES, sim_id, path, entity, attr ) )
+            if total + n > MAX_QUERY_VALUES:
+                next_offset = offset + i
+                break
+            selected.setdefault( ( sim_id, path, time_kind ), [] ).append( ( col, entity, attr ) )
+            total += n
+
+        series = []
+        for ( sim_id, path, time_kind ), columns in selected.items():
+            file_path = os.path.join( key, sim_id, *path.split( '/' ) )
+            times, values = _read_columns( file_path, [ c[0] for c in columns ], time_kind, start, end )
+            for ( col, entity, attr ), v in zip( columns, values ):
+                series.append( dict(
+                    sim_id = sim_id, path = path, entity = entity, attr = attr,
+                    time_kind = time_kind, times = times, values = v
+                ) )
+
+        return series, next_offset
+
+
+    def forget( self, setup_dir ):
+        '''
+        Remove all entries of a simulation setup (e.g., because it has been deleted).
+
+        :param setup_dir: path to simulation setup (string)
+        '''
+        key = os.path.realpath( setup_dir )
+        with self._lock, contextlib.closing( self._connect() ) as conn:
+            with conn:
+                conn.execute( 'DELETE FROM files WHERE setup_dir = ?', ( key, ) )
+                conn.execute( 'DELETE FROM columns WHERE setup_dir = ?', ( key, ) )
+
+
+    def _connect( self ):
+        return sqlite3.connect( self.path, timeout = 30 )
+
+
+def encode_series( series, next_offset = None ):
+    '''
+    Encode time series (as returned by `ResultIndex.query`) in a compact binary format.
+
+    All numbers are little-endian. The data starts with the 4 bytes 'MDJR', followed by the format
+    version (uint8), 3 reserved bytes, the number of time series (uint32) and the offset of the next
+    page (uint32, zero if there are no further pages). Each time series consists of:
+        - simulation ID, file path, entity ID and attribute (each as uint32 length and UTF-8 bytes)
+        - time kind (uint8, index in `TIME_KINDS`)
+        - number of rows n (uint32)
+        - n times (float64)
+        - n values (float64, NaN for missing or non-numeric values)
+
+    :param series: time series (list of dicts)
+    :param next_offset: offset of the next page (int) or None if this is the last page
+    :return: encoded time series (bytes)
+    '''
+    parts = [ BINARY_MAGIC, struct.pack( '<B3xII', BINARY_VERSION, len( series ), next_offset or 0 ) ]
+
+    for s in series:
+        for text in ( s[ 'sim_id' ], s[ 'path' ], s[ 'entity' ], s[ 'attr' ] ):
+            data = text.encode( 'utf-8' )
+            parts.append( struct.pack( '<I', len( data ) ) )
+            parts.append( data )
+        parts.append( struct.pack( '<BI', TIME_KINDS.index( s[ 'time_kind' ] ), len( s[ 'times' ] ) ) )
+        parts.append( _to_little_endian( s[ 'times' ] ) )
+        parts.append( _to_little_endian( s[ 'values' ] ) )
+
+    return b''.join( parts )
+
+
+def decode_series( data ):
+    '''
+    Decode time series encoded with `encode_series`.
+
+    :param data: encoded time series (bytes)
+    :return: tuple of the time series in the format returned by `ResultIndex.query` (list of dicts)
+        and the offset of the next page (int) or None if this is the last page
+    '''
+    if BINARY_MAGIC != data[:4]:
+        raise ValueError( 'invalid result data' )
+    version, = struct.unpack_from( '<B', data, 4 )
+    if BINARY_VERSION != version:
+        raise ValueError( 'unsupported result data version: {}'.format( version ) )
+    count, next_offset = struct.unpack_from( '<II', data, 8 )
+
+    offset = 16
+    series = []
+    for _ in range( count ):
+        texts = []
+        for _ in range( 4 ):
+            length, = struct.unpack_from( '<I', data, offset )
+            texts.append( data[ offset + 4 : offset + 4 + length ].decode( 'utf-8' ) )
+            offset += 4 + length
+        kind, n = struct.unpack_from( '<BI', data, offset )
+        offset += 5
+
+        arrays = []
+        for _ in range( 2 ):
+            a = array.array( 'd', data[ offset : offset + 8 * n ] )
+            if 'big' == sys.byteorder:
+                a.byteswap()
+            arrays.append( a )
+            offset += 8 * n
+
+        series.append( dict(
+            sim_id = texts[0], path = texts[1], entity = texts[2], attr = texts[3],
+            time_kind = TIME_KINDS[ kind ], times = arrays[0], values = arrays[1]
+        ) )
+
+    return series, next_offset or None
+
+
+def _scan_file( path ):
+    '''
+    Read a result file and determine its columns, number of rows and time range.
+    '''
+    info = dict( columns = [], rows = 0, time_kind = 'row', time_start = None, time_end = None )
+
+    try:
+        with open( path, 'r', newline = '' ) as f:
+            reader = csv.reader( f )
+            header = next( reader, None )
+            if not header:
+                return info
+
+            time_kind = None
+            first = last = None
+            rows = 0
+            for row in reader:
+                if not row:
+                    continue
+                if 'row' != time_kind:
+                    kind, t = _parse_time_cell( row[0] )
+                    if time_kind is None or kind == time_kind:
+                        time_kind = kind
+                        first = t if first is None else first
+                        last = t
+                    else:
+                        time_kind = 'row'
+                rows += 1
+    except ( OSError, UnicodeDecodeError, csv.Error ):
+        return info
+
+    info[ 'columns' ] = [ ( col, *_split_column( name ) ) for col, name in enumerate( header ) if col > 0 ]
+    info[ 'rows' ] = rows
+    info[ 'time_kind' ] = time_kind if time_kind is not None else 'row'
+    if 'row' == info[ 'time_kind' ]:
+        first, last = ( 0., float( rows - 1 ) ) if rows > 0 else ( None, None )
+    info[ 'time_start' ] = first
+    info[ 'time_end' ] = last
+
+    return info
+
+
+def _read_columns( path, cols, time_kind, start, end ):
+    '''
+    Read the times and the values of selected columns of a result file.
+    '''
+    times = array.array( 'd' )
+    values = [ array.array( 'd' ) for _ in cols ]
+    nan = float( 'nan' )
+
+    with open( path, 'r', newline = '' ) as f:
+        reader = csv.reader( f )
+        next( reader, None )
+
+        index = 0
+        for row in reader:
+            if not row:
+                continue
+
+            if 'row' == time_kind:
+                t = float( index )
+            else:
+                kind, t = _parse_time_cell( row[0] )
+                t = t if kind == time_kind else nan
+            index += 1
+
+            if ( start is not None and not t >= start ) or ( end is not None and not t <= end ):
+                continue
+
+            times.append( t )
+            for col, v in zip( cols, values ):
+                try:
+                    v.append( float( row[ col ] ) )
+                except ( IndexError, ValueError ):
+                    v.append( nan )
+
+    return times, values
+
+
+def _parse_time_cell( cell ):
+    '''
+    :return: kind and value of a time cell (tuple)
+    '''
+    try:
+        value = float( cell )
+        if math.isfinite( value ):
+            return 'number', value
+    except ValueError:
+        pass
+    try:
+        return 'date', parse_time( cell ).timestamp()
+    except ValueError:
+        return 'row', None
+
+
+def _estimate_rows( rows, time_start, time_end, start, end ):
+    '''
+    Estimate the number of rows of a result file within a time range, assuming evenly spaced rows.
+    '''
+    if rows < 2 or time_start is None or time_end is None or time_end <= time_start:
+        return rows
+
+    lower = max( time_start, start ) if start is not None else time_start
+    upper = min( time_end, end ) if end is not None else time_end
+    if upper < lower:
+        return 0
+
+    return min( rows, int( math.ceil( ( upper - lower ) / ( time_end - time_start ) * ( rows - 1 ) ) ) + 1 )
+
+
+def _time_value( value ):
+    '''
+    Convert a time given by a client (number or ISO 8601 string) to a number.
+    '''
+    if isinstance( value, ( int, float ) ):
+        return float( value )
+    kind, t = _parse_time_cell( str( value ) )
+    if 'row' == kind:
+        raise ValueError( 'invalid time: {}'.format( value ) )
+    return t
+
+
+def _split_column( name ):
+    '''
+    Split a column name into entity ID and attribute.
+    '''
+    entity, sep, attr = name.rpartition( '-' )
+    return ( entity, attr ) if sep else ( '', name )
+
+
+def _in_filter( column, values ):
+    '''
+    :return: SQL condition restricting a column to a list of values and its parameters (tuple)
+    '''
+    if values is None:
+        return '', []
+    return ' AND {} IN ( {} )'.format( column, ','.join( '?' * len( values ) ) ), list( values )
+
+
+def _to_little_endian( values ):
+    if 'big' == sys.byteorder:
+        values = array.array( 'd', values )
+        values.byteswap()
+    return values.tobytes()
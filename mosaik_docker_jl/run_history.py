@@ -0,0 +1,355 @@
+'''
+Module for keeping a persistent index of all simulation runs
+'''
+import contextlib
+import datetime
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+from .sim_query import format_time, parse_time, encode_cursor, decode_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+
+# States of simulation runs stored in the index.
+RUN_STATES = ( 'up', 'down', 'cleared' )
+
+# Keys by which simulation runs may be sorted (mapped to the corresponding columns).
+RUN_SORT_KEYS = { 'started': 'started', 'id': 'sim_id' }
+
+# Maximum number of events kept in the database (older events are pruned, runs are kept).
+MAX_EVENTS = 100000
+
+_log = logging.getLogger( __name__ )
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    setup_dir TEXT NOT NULL,
+    sim_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL,
+    duration REAL,
+    exit_status INTEGER,
+    cleared REAL,
+    result_size INTEGER,
+    build_fingerprint TEXT,
+    PRIMARY KEY ( setup_dir, sim_id )
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs ( setup_dir, started, sim_id );
+CREATE INDEX IF NOT EXISTS runs_state ON runs ( setup_dir, state );
+CREATE TABLE IF NOT EXISTS events (
+    setup_dir TEXT NOT NULL,
+    sim_id TEXT,
+    event TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS events_sim ON events ( setup_dir, sim_id, timestamp );
+'''
+
+
+class RunHistory:
+    '''
+    Persistent SQLite index of simulation runs and the events that happened to them
+    (start, finish, cancel, clear, retrieval of results).
+
+    Events are recorded without blocking the caller: they are put in a queue and written
+    in batches (one transaction per batch) by a background thread. Queries read from the
+    database directly and are answered with the help of indices.
+
+    The event log is bounded: after each batch, the oldest events beyond the maximum number
+    of events are pruned. The index of simulation runs is not affected by this.
+    '''
+
+    def __init__( self, path, batch_size = 500, batch_wait = 0.2, max_events = MAX_EVENTS ):
+        '''
+        :param path: path to the SQLite database file, created if it does not exist (string)
+        :param batch_size: maximum number of events written in one transaction (int)
+        :param batch_wait: maximum time to wait for further events before writing a batch (float, seconds)
+        :param max_events: maximum number of events kept in the database (int)
+        '''
+        self.path = path
+        self._batch_size = batch_size
+        self._batch_wait = batch_wait
+        self._max_events = max_events
+        self._queue = queue.Queue()
+
+        os.makedirs( os.path.dirname( os.path.abspath( path ) ), exist_ok = True )
+
+        with contextlib.closing( self._connect() ) as conn:
+            conn.execute( 'PRAGMA journal_mode = WAL' )
+            conn.executescript( _SCHEMA )
+
+        self._writer = threading.Thread( target = self._write_events, name = 'mosaik-docker-jl-history', daemon = True )
+        self._writer.start()
+
+
+    def record( self, event, setup_dir, sim_id = None, timestamp = None, **details ):
+        '''
+        Record an event (non-blocking).
+
+        Supported events and their details:
+            'start': simulation started
+            'fingerprint': build fingerprint of a run is known (details: 'build_fingerprint')
+            'finish': simulation finished (details: 'started', 'exit_status')
+            'cancel': simulation cancelled
+            'clear': simulation container removed
+            'result': simulation results retrieved (details: 'result_size')
+            'delete_setup': simulation setup deleted (no simulation ID)
+
+        :param event: type of event (string)
+        :param setup_dir: path to simulation setup (string)
+        :param sim_id: simulation ID (string)
+        :param timestamp: time of the event (float, seconds since epoch, default: now)
+        :param details: event details (keyword arguments)
+        '''
+        timestamp = timestamp if timestamp is not None else time.time()
+        self._queue.put( ( event, os.path.realpath( setup_dir ), sim_id, timestamp, details ) )
+
+
+    def flush( self ):
+        '''
+        Wait until all recorded events have been written.
+        '''
+        self._queue.join()
+
+
+    def close( self ):
+        '''
+        Write all recorded events and stop the background thread.
+        '''
+        if self._writer.is_alive():
+            self._queue.put( None )
+            self._writer.join()
+
+
+    def get_runs( self, setup_dir, states = None, id_prefix = None, started_after = None, started_before = None,
+        sort = 'started', descending = False, limit = DEFAULT_PAGE_SIZE, cursor = None ):
+        '''
+        Query the simulation runs of a simulation setup.
+
+        :param setup_dir: path to simulation setup (string)
+        :param states: only include runs in one of these states (list of strings, default: all states)
+        :param id_prefix: only include runs whose simulation ID starts with this prefix (string)
+        :param started_after: only include runs started at or after this time (ISO 8601 string)
+        :param started_before: only include runs started before this time (ISO 8601 string)
+        :param sort: sort key, either 'started' or 'id' (string, default: 'started')
+        :param descending: sort in descending order (boolean, default: False)
+        :param limit: maximum number of items per page (int, default: 100)
+        :param cursor: cursor returned with the previous page (string)
+        :return: dict with the requested page in the following format:
+            {
+                'items': list of simulation runs (list of dicts)
+                'total': number of runs matching the filter criteria (int)
+                'next': cursor for retrieving the next page or None if this is the last page (string)
+            }
+        '''
+        if states is None:
+            states = list( RUN_STATES )
+        for state in states:
+            if state not in RUN_STATES:
+                raise ValueError( 'invalid run state: {}'.format( state ) )
+
+        if sort not in RUN_SORT_KEYS:
+            raise ValueError( 'invalid sort key: {}'.format( sort ) )
+
+        if isinstance( limit, bool ) or not isinstance( limit, int ) or limit < 1 or limit > MAX_PAGE_SIZE:
+            raise ValueError( 'page size must be an integer between 1 and {}'.format( MAX_PAGE_SIZE ) )
+
+        # Filter criteria.
+        where = [ 'setup_dir = ?', 'state IN ({})'.format( ', '.join( '?' * len( states ) ) ) ]
+        params = [ os.path.realpath( setup_dir ), *states ]
+
+        if id_prefix:
+            where.append( 'substr( sim_id, 1, ? ) = ?' )
+            params.extend( [ len( id_prefix ), id_prefix ] )
+        if started_after:
+            where.append( 'started >= ?' )
+            params.append( parse_time( started_after ).timestamp() )
+        if started_before:
+            where.append( 'started < ?' )
+            params.append( parse_time( started_before ).timestamp() )
+
+        column = RUN_SORT_KEYS[ sort ]
+        order = 'DESC' if descending else 'ASC'
+        key = decode_cursor( cursor, sort, descending ) if cursor else None
+
+        # Keyset pagination: continue after the last item of the previous page.
+        page_where = list( where )
+        page_params = list( params )
+        if key is not None:
+            page_where.append( '( {}, sim_id ) {} ( ?, ? )'.format( column, '<' if descending else '>' ) )
+            page_params.extend( key )
+
+        with contextlib.closing( self._connect() ) as conn:
+            total = conn.execute(
+                'SELECT COUNT(*) FROM runs WHERE {}'.format( ' AND '.join( where ) ), params
+            ).fetchone()[0]
+
+            rows = conn.execute(
+                'SELECT * FROM runs WHERE {} ORDER BY {} {}, sim_id {} LIMIT ?'.format(
+                    ' AND '.join( page_where ), column, order, order ),
+                [ *page_params, limit + 1 ]
+            ).fetchall()
+
+        has_next = len( rows ) > limit
+        rows = rows[:limit]
+
+        return dict(
+            items = [ _format_run( r ) for r in rows ],
+            total = total,
+            next = encode_cursor( [ rows[-1][ column ], rows[-1][ 'sim_id' ] ], sort, descending ) if has_next else None
+        )
+
+
+    def _connect( self ):
+        '''
+        Open a new connection to the database.
+        '''
+        conn = sqlite3.connect( self.path, timeout = 30 )
+        conn.row_factory = sqlite3.Row
+        return conn
+
+
+    def _write_events( self ):
+        '''
+        Background thread: write recorded events to the database in batches.
+        '''
+        conn = self._connect()
+        stop = False
+
+        while not stop:
+            batch = [ self._queue.get() ]
+
+            # Collect further events that arrive shortly after the first one.
+            while len( batch ) < self._batch_size and batch[-1] is not None:
+                try:
+                    batch.append( self._queue.get( timeout = self._batch_wait ) )
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is None
+            events = [ e for e in batch if e is not None ]
+
+            try:
+                with conn:
+                    for event in events:
+                        self._write_event( conn, *event )
+                    if events:
+                        # Event IDs (rowids) increase monotonically, hence the oldest events have the lowest IDs.
+                        conn.execute(
+                            'DELETE FROM events WHERE rowid <= ( SELECT MAX( rowid ) FROM events ) - ?',
+                            ( self._max_events, )
+                        )
+            except sqlite3.Error as err:
+                # The index is kept on a best-effort basis, a failing batch must not stop the writer.
+                _log.warning( 'failed to write {} events to run history {}: {}'.format( len( events ), self.path, err ) )
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+        conn.close()
+
+
+    def _write_event( self, conn, event, setup_dir, sim_id, timestamp, details ):
+        '''
+        Write a single event and update the corresponding simulation run.
+        '''
+        conn.execute(
+            'INSERT INTO events ( setup_dir, sim_id, event, timestamp, details ) VALUES ( ?, ?, ?, ?, ? )',
+            ( setup_dir, sim_id, event, timestamp, json.dumps( details ) if details else None )
+        )
+
+        if 'start' == event:
+            conn.execute(
+                '''INSERT INTO runs ( setup_dir, sim_id, state, started ) VALUES ( ?, ?, 'up', ? )
+                ON CONFLICT ( setup_dir, sim_id ) DO UPDATE SET state = 'up', started = excluded.started,
+                finished = NULL, duration = NULL, exit_status = NULL, cleared = NULL''',
+                ( setup_dir, sim_id, timestamp )
+            )
+        elif 'fingerprint' == event:
+            conn.execute(
+                'UPDATE runs SET build_fingerprint = ? WHERE setup_dir = ? AND sim_id = ?',
+                ( details.get( 'build_fingerprint' ), setup_dir, sim_id )
+            )
+        elif 'finish' == event:
+            # Runs started before the index existed are added when they are seen finished.
+            started = details.get( 'started' ) or timestamp
+            conn.execute(
+                '''INSERT INTO runs ( setup_dir, sim_id, state, started, finished, duration, exit_status )
+                VALUES ( ?, ?, 'down', ?, ?, ?, ? )
+                ON CONFLICT ( setup_dir, sim_id ) DO UPDATE SET
+                state = CASE WHEN state = 'cleared' THEN state ELSE 'down' END,
+                finished = excluded.finished, duration = excluded.finished - started,
+                exit_status = excluded.exit_status''',
+                ( setup_dir, sim_id, started, timestamp, timestamp - started, details.get( 'exit_status' ) )
+            )
+        elif 'cancel' == event:
+            conn.execute(
+                '''UPDATE runs SET state = 'down', finished = COALESCE( finished, ? ),
+                duration = COALESCE( finished, ? ) - started WHERE setup_dir = ? AND sim_id = ?''',
+                ( timestamp, timestamp, setup_dir, sim_id )
+            )
+        elif 'clear' == event:
+            conn.execute(
+                '''UPDATE runs SET state = 'cleared', cleared = ? WHERE setup_dir = ? AND sim_id = ?''',
+                ( timestamp, setup_dir, sim_id )
+            )
+        elif 'result' == event:
+            conn.execute(
+                'UPDATE runs SET result_size = ? WHERE setup_dir = ? AND sim_id = ?',
+                ( details.get( 'result_size' ), setup_dir, sim_id )
+            )
+        elif 'delete_setup' == event:
+            conn.execute(
+                '''UPDATE runs SET state = 'cleared', cleared = ? WHERE setup_dir = ? AND state != 'cleared' ''',
+                ( timestamp, setup_dir )
+            )
+
+
+def parse_docker_time( value ):
+    '''
+    Parse a timestamp in the format used by `docker inspect` (RFC 3339 with nanoseconds).
+
+    :param value: timestamp (string)
+    :return: seconds since epoch (float) or None if the timestamp is not set
+    '''
+    match = re.match( r'^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(\.\d+)?(Z|[+-]\d{2}:\d{2})$', value.strip() )
+    if match is None:
+        return None
+
+    date, fraction, zone = match.groups()
+    timestamp = parse_time( date + ( zone if 'Z' != zone else '+00:00' ) ).timestamp()
+
+    # Docker uses '0001-01-01T00:00:00Z' for timestamps that are not set.
+    if timestamp <= 0:
+        return None
+
+    return timestamp + ( float( fraction ) if fraction else 0. )
+
+
+def _format_run( row ):
+    '''
+    Convert a row of the runs table to a dict.
+    '''
+    def _time( value ):
+        if value is None:
+            return None
+        return format_time( datetime.datetime.fromtimestamp( value, datetime.timezone.utc ) )
+
+    return dict(
+        id = row[ 'sim_id' ],
+        state = row[ 'state' ],
+        started = _time( row[ 'started' ] ),
+        finished = _time( row[ 'finished' ] ),
+        duration = row[ 'duration' ],
+        exit_status = row[ 'exit_status' ],
+        cleared = _time( row[ 'cleared' ] ),
+        result_size = row[ 'result_size' ],
+        build_fingerprint = row[ 'build_fingerprint' ]
+    )
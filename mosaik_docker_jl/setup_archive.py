@@ -0,0 +1,477 @@
+'''
+Module for exporting simulation setups to archives and importing them on other hosts
+'''
+import collections
+import concurrent.futures
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import zlib
+
+from mosaik_docker.util.config_data import ConfigData as MDConfigData
+from mosaik_docker._config import ORCH_CONTEXT_DIR_NAME as MD_ORCH_CONTEXT_DIR_NAME
+from mosaik_docker._config import ORCH_IMAGE_NAME_TEMPLATE as MD_ORCH_IMAGE_NAME_TEMPLATE
+
+from .build_context import format_size
+
+
+# Identification of the archive format.
+ARCHIVE_FORMAT = 'mosaik-docker-jl-archive'
+ARCHIVE_VERSION = 1
+
+# Name of the manifest within the archive (written last, after all blobs).
+MANIFEST_NAME = 'manifest.json'
+
+# Directory of the blobs within the archive.
+BLOB_DIR_NAME = 'blobs'
+
+# Files and images are split into chunks of this size (bytes), each chunk is stored as blob.
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Compression level of the blobs (trade-off between CPU and archive size).
+COMPRESSION_LEVEL = 6
+
+
+class _BlobWriter:
+    '''
+    Write content-addressed blobs to a streaming tar archive. Chunks are hashed and compressed
+    in parallel by worker threads, but written in the order in which they have been added.
+    Chunks with the same content are written only once. Use as context manager, such that
+    the worker threads are stopped in any case.
+    '''
+
+    def __init__( self, tar, max_workers ):
+        self._tar = tar
+        self._executor = concurrent.futures.ThreadPoolExecutor( max_workers = max_workers )
+        self._window = 2 * max_workers
+        self._pending = collections.deque()
+        self._claimed = set()
+        self._lock = threading.Lock()
+        self.digests = []
+        self.chunks = 0
+        self.blobs = 0
+        self.size = 0
+        self.compressed_size = 0
+
+
+    def __enter__( self ):
+        return self
+
+
+    def __exit__( self, *exc_info ):
+        # Chunks that have not been written yet are discarded.
+        for future in self._pending:
+            future.cancel()
+        self._executor.shutdown( wait = True )
+
+
+    def add( self, data ):
+        '''
+        Add a chunk (blocks while too many chunks are being processed).
+
+        :param data: chunk (bytes)
+        :return: index of the chunk, its hash is available in `digests` after `flush` (int)
+        '''
+        while len( self._pending ) >= self._window:
+            self._write( self._pending.popleft() )
+
+        self._pending.append( self._executor.submit( self._compress, data ) )
+        self.chunks += 1
+        self.size += len( data )
+        return self.chunks - 1
+
+
+    def flush( self ):
+        '''
+        Write all pending chunks.
+        '''
+        while self._pending:
+            self._write( self._pending.popleft() )
+
+
+    def _compress( self, data ):
+        digest = hashlib.sha256( data ).hexdigest()
+        with self._lock:
+            if digest in self._claimed:
+                return digest, None
+            self._claimed.add( digest )
+        return digest, gzip.compress( data, compresslevel = COMPRESSION_LEVEL, mtime = 0 )
+
+
+    def _write( self, future ):
+        digest, compressed = future.result()
+        self.digests.append( digest )
+        if compressed is None:
+            return
+
+        info = tarfile.TarInfo( '{}/{}.gz'.format( BLOB_DIR_NAME, digest ) )
+        info.size = len( compressed )
+        info.mtime = int( time.time() )
+        self._tar.addfile( info, io.BytesIO( compressed ) )
+        self.blobs += 1
+        self.compressed_size += len( compressed )
+
+
+def export_sim_setup( setup_dir, archive, docker_host, sim_ids = (), include_image = True, max_workers = 8 ):
+    '''
+    Export a simulation setup, its orchestrator image and the retrieved results of selected
+    simulations to an archive.
+
+    The archive is an uncompressed tar file containing gzip-compressed blobs, named after
+    the SHA-256 hash of their content, followed by a manifest. Files and the image (as
+    created by `docker save`) are split into chunks, each chunk is stored as blob. Chunks
+    with the same content (e.g., identical input files or results) are stored only once.
+
+    :param setup_dir: path to simulation setup (string)
+    :param archive: path to the archive, must not exist yet (string)
+    :param docker_host: URL to the daemon socket to connect to when running docker (string)
+    :param sim_ids: IDs of the simulations whose retrieved results are included (list of strings)
+    :param include_image: include the orchestrator image, such that the setup does not have to be rebuilt (boolean)
+    :param max_workers: number of threads for compressing blobs (int)
+    :return: summary of the archive contents (dict)
+    '''
+    setup_dir = os.path.realpath( setup_dir )
+    config_data = MDConfigData( setup_dir )
+    setup_id = config_data['id'].strip()
+
+    sim_ids = list( sim_ids )
+    for id in sim_ids:
+        if not os.path.isdir( os.path.join( setup_dir, id ) ):
+            raise RuntimeError( 'no retrieved results for simulation with ID = {}'.format( id ) )
+
+    # Result directories of other simulations and copies of build contexts are left out.
+    excluded = set( config_data['sim_ids_up'] + config_data['sim_ids_down'] ) - set( sim_ids )
+    excluded.add( MD_ORCH_CONTEXT_DIR_NAME )
+
+    image_name = MD_ORCH_IMAGE_NAME_TEMPLATE.format( setup_id.lower() )
+    image_id = _image_id( image_name, docker_host ) if include_image else None
+    if include_image and image_id is None:
+        raise RuntimeError( 'orchestrator image not found, build the simulation setup first: {}'.format( image_name ) )
+
+    if os.path.exists( archive ):
+        raise FileExistsError( 'archive already exists: {}'.format( archive ) )
+
+    manifest = dict(
+        format = ARCHIVE_FORMAT, version = ARCHIVE_VERSION, created = time.time(),
+        setup_id = setup_id, chunk_size = CHUNK_SIZE, results = sim_ids, dirs = [], files = [], image = None
+    )
+
+    # Neither this archive nor archives exported before are included (e.g., if they are saved in the setup directory).
+    tmp_archive = archive + '.tmp'
+    skipped = { os.path.realpath( tmp_archive ), os.path.realpath( archive ) }
+
+    try:
+        with open( tmp_archive, 'wb' ) as f, tarfile.open( fileobj = f, mode = 'w|', format = tarfile.PAX_FORMAT ) as tar, \
+                _BlobWriter( tar, max_workers ) as writer:
+
+            for root, dirs, files in os.walk( setup_dir ):
+                rel_root = os.path.relpath( root, setup_dir ).replace( os.sep, '/' )
+                if '.' == rel_root:
+                    dirs[:] = [ d for d in dirs if d not in excluded ]
+                    rel_root = ''
+                else:
+                    manifest[ 'dirs' ].append( rel_root )
+                    rel_root += '/'
+                dirs.sort()
+
+                for name in sorted( files ):
+                    path = os.path.join( root, name )
+                    if path in skipped or _is_archive( path ):
+                        continue
+                    try:
+                        stat = os.stat( path )
+                    except OSError:
+                        continue # Broken symbolic link.
+
+                    chunks = []
+                    size = 0
+                    with open( path, 'rb' ) as src:
+                        for data in iter( lambda: src.read( CHUNK_SIZE ), b'' ):
+                            chunks.append( writer.add( data ) )
+                            size += len( data )
+                    manifest[ 'files' ].append( dict(
+                        path = rel_root + name, mode = stat.st_mode & 0o777, mtime = stat.st_mtime, size = size, chunks = chunks
+                    ) )
+
+            if include_image:
+                chunks, size = _save_image( image_name, docker_host, writer )
+                manifest[ 'image' ] = dict( name = image_name, id = image_id, size = size, chunks = chunks )
+
+            writer.flush()
+
+            # Replace the indices of the chunks by their hashes.
+            for entry in manifest[ 'files' ] + ( [ manifest[ 'image' ] ] if manifest[ 'image' ] else [] ):
+                entry[ 'chunks' ] = [ writer.digests[ c ] for c in entry[ 'chunks' ] ]
+
+            data = json.dumps( manifest, indent = 1 ).encode( 'utf-8' )
+            info = tarfile.TarInfo( MANIFEST_NAME )
+            info.size = len( data )
+            info.mtime = int( time.time() )
+            tar.addfile( info, io.BytesIO( data ) )
+
+        os.replace( tmp_archive, archive )
+    finally:
+        if os.path.exists( tmp_archive ):
+            os.remove( tmp_archive )
+
+    return dict(
+        archive = archive, files = len( manifest[ 'files' ] ), results = sim_ids,
+        image = image_name if include_image else None, chunks = writer.chunks, blobs = writer.blobs,
+        size = writer.size, archive_size = os.path.getsize( archive )
+    )
+
+
+def import_sim_setup( archive, setup_dir, docker_host, max_workers = 8, overwrite_image = False ):
+    '''
+    Import a simulation setup from an archive created with `export_sim_setup`.
+
+    The archive is read as a stream, its blobs are decompressed and verified against their hashes
+    in parallel. The simulation setup is restored only if the complete archive is valid, the
+    orchestrator image (if included) is loaded into the Docker daemon, hence the setup does not
+    have to be rebuilt. Simulations of the original setup are not imported (the containers exist
+    only on the original host), but the included results are.
+
+    If the Docker daemon already has a different image with the name of the included orchestrator
+    image (i.e., of a setup with the same ID), the import is refused unless `overwrite_image` is set.
+
+    :param archive: path to the archive (string)
+    :param setup_dir: path to the restored simulation setup, must not exist yet (string)
+    :param docker_host: URL to the daemon socket to connect to when running docker (string)
+    :param max_workers: number of threads for verifying blobs (int)
+    :param overwrite_image: replace an existing image with the name of the included orchestrator image (boolean)
+    :return: summary of the restored contents (dict)
+    '''
+    setup_dir = os.path.realpath( setup_dir )
+    if os.path.exists( setup_dir ):
+        raise FileExistsError( 'directory already exists: {}'.format( setup_dir ) )
+
+    parent_dir = os.path.dirname( setup_dir )
+    os.makedirs( parent_dir, exist_ok = True )
+    staging_dir = tempfile.mkdtemp( prefix = '.import-', dir = parent_dir )
+
+    try:
+        blob_dir = os.path.join( staging_dir, BLOB_DIR_NAME )
+        os.mkdir( blob_dir )
+        manifest = _read_archive( archive, blob_dir, max_workers )
+
+        # Check the manifest before touching anything.
+        blobs = set( os.listdir( blob_dir ) )
+        for entry in manifest[ 'files' ] + ( [ manifest[ 'image' ] ] if manifest.get( 'image' ) else [] ):
+            missing = [ c for c in entry[ 'chunks' ] if c not in blobs ]
+            if missing:
+                raise ValueError( 'invalid archive, missing blob: {}'.format( missing[0] ) )
+            if sum( os.path.getsize( os.path.join( blob_dir, c ) ) for c in entry[ 'chunks' ] ) != entry[ 'size' ]:
+                raise ValueError( 'invalid archive, size mismatch: {}'.format( entry.get( 'path', entry.get( 'name' ) ) ) )
+
+        # Loading the image replaces an existing image with the same name.
+        image = manifest.get( 'image' )
+        if image:
+            existing_id = _image_id( image[ 'name' ], docker_host )
+            if existing_id is not None and existing_id != image[ 'id' ] and not overwrite_image:
+                raise FileExistsError( 'image {} already exists with ID {} (archive contains ID {})'.format(
+                    image[ 'name' ], existing_id, image[ 'id' ] ) )
+
+        # Restore the simulation setup directory.
+        restore_dir = os.path.join( staging_dir, 'setup' )
+        os.mkdir( restore_dir )
+        for dir in manifest[ 'dirs' ]:
+            os.makedirs( _target_path( restore_dir, dir ), exist_ok = True )
+        for entry in manifest[ 'files' ]:
+            path = _target_path( restore_dir, entry[ 'path' ] )
+            os.makedirs( os.path.dirname( path ), exist_ok = True )
+            with open( path, 'wb' ) as dst:
+                for c in entry[ 'chunks' ]:
+                    with open( os.path.join( blob_dir, c ), 'rb' ) as src:
+                        shutil.copyfileobj( src, dst )
+            os.chmod( path, entry[ 'mode' ] )
+            os.utime( path, ( entry[ 'mtime' ], entry[ 'mtime' ] ) )
+
+        # Simulation containers of the original host do not exist here.
+        config_data = MDConfigData( restore_dir )
+        config_data['sim_ids_up'] = []
+        config_data['sim_ids_down'] = []
+        config_data.write()
+
+        if image and existing_id != image[ 'id' ]:
+            _load_image( [ os.path.join( blob_dir, c ) for c in image[ 'chunks' ] ], docker_host )
+            image_id = _image_id( image[ 'name' ], docker_host )
+            if image_id != image[ 'id' ]:
+                raise ValueError( 'invalid archive, loaded image {} has ID {} instead of {}'.format( image[ 'name' ], image_id, image[ 'id' ] ) )
+
+        os.rename( restore_dir, setup_dir )
+    finally:
+        shutil.rmtree( staging_dir, ignore_errors = True )
+
+    return dict(
+        setup_dir = setup_dir, setup_id = manifest[ 'setup_id' ], files = len( manifest[ 'files' ] ),
+        results = manifest[ 'results' ], image = manifest[ 'image' ][ 'name' ] if manifest.get( 'image' ) else None
+    )
+
+
+def format_summary( summary ):
+    '''
+    :return: human-readable summary of an exported archive (string)
+    '''
+    return '{} files{}{} ({} in {} chunks, {} unique) written to {} ({})'.format(
+        summary[ 'files' ],
+        ', results of {} simulations'.format( len( summary[ 'results' ] ) ) if summary[ 'results' ] else '',
+        ', image {}'.format( summary[ 'image' ] ) if summary[ 'image' ] else '',
+        format_size( summary[ 'size' ] ), summary[ 'chunks' ], summary[ 'blobs' ],
+        summary[ 'archive' ], format_size( summary[ 'archive_size' ] )
+    )
+
+
+def _read_archive( archive, blob_dir, max_workers ):
+    '''
+    Read an archive as a stream, verify and store all blobs (decompressed) and return the manifest.
+    '''
+    manifest = None
+    window = 2 * max_workers
+    pending = collections.deque()
+
+    with concurrent.futures.ThreadPoolExecutor( max_workers = max_workers ) as executor:
+        with tarfile.open( archive, mode = 'r|' ) as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+
+                if MANIFEST_NAME == member.name:
+                    manifest = json.loads( tar.extractfile( member ).read().decode( 'utf-8' ) )
+                    continue
+
+                dir, _, name = member.name.partition( '/' )
+                if BLOB_DIR_NAME != dir or not name.endswith( '.gz' ) or not _is_hash( name[:-3] ):
+                    raise ValueError( 'invalid archive, unexpected entry: {}'.format( member.name ) )
+
+                while len( pending ) >= window:
+                    pending.popleft().result()
+                pending.append( executor.submit( _store_blob, tar.extractfile( member ).read(), name[:-3], blob_dir ) )
+
+            while pending:
+                pending.popleft().result()
+
+    if manifest is None:
+        raise ValueError( 'invalid archive, manifest missing' )
+    if ARCHIVE_FORMAT != manifest.get( 'format' ) or ARCHIVE_VERSION != manifest.get( 'version' ):
+        raise ValueError( 'unsupported archive format: {} (version {})'.format( manifest.get( 'format' ), manifest.get( 'version' ) ) )
+
+    return manifest
+
+
+def _store_blob( compressed, digest, blob_dir ):
+    '''
+    Decompress a blob, verify its hash and store it.
+    '''
+    try:
+        data = gzip.decompress( compressed )
+    except ( OSError, EOFError, zlib.error ):
+        data = None
+    if data is None or hashlib.sha256( data ).hexdigest() != digest:
+        raise ValueError( 'invalid archive, corrupted blob: {}'.format( digest ) )
+    with open( os.path.join( blob_dir, digest ), 'wb' ) as f:
+        f.write( data )
+
+
+def _is_archive( path ):
+    '''
+    :return: True if a file is an archive created by `export_sim_setup`
+    '''
+    try:
+        with tarfile.open( path, mode = 'r:' ) as tar:
+            member = tar.next()
+    except ( OSError, tarfile.TarError ):
+        return False
+    return member is not None and ( MANIFEST_NAME == member.name or member.name.startswith( BLOB_DIR_NAME + '/' ) )
+
+
+def _is_hash( name ):
+    return 64 == len( name ) and all( c in '0123456789abcdef' for c in name )
+
+
+def _target_path( root, rel_path ):
+    '''
+    :return: path within the restored setup directory, paths pointing outside of it are rejected
+    '''
+    path = os.path.normpath( os.path.join( root, *rel_path.split( '/' ) ) )
+    if os.path.isabs( rel_path ) or not path.startswith( root + os.sep ):
+        raise ValueError( 'invalid archive, path outside of simulation setup: {}'.format( rel_path ) )
+    return path
+
+
+def _image_id( image, docker_host ):
+    '''
+    :return: ID of an image or None if the image does not exist in the Docker daemon
+    '''
+    res = subprocess.run(
+        [ 'docker', 'image', 'inspect', '--format', '{{.Id}}', image ],
+        env = dict( DOCKER_HOST = docker_host ),
+        capture_output = True
+    )
+    return res.stdout.decode( 'utf-8' ).strip() if 0 == res.returncode else None
+
+
+def _save_image( image, docker_host, writer ):
+    '''
+    Stream an image from `docker save` to the blob writer.
+
+    :return: indices of the chunks and size of the saved image (tuple)
+    '''
+    proc = subprocess.Popen(
+        [ 'docker', 'save', image ],
+        env = dict( DOCKER_HOST = docker_host ),
+        stdout = subprocess.PIPE, stderr = subprocess.PIPE
+    )
+
+    chunks = []
+    size = 0
+    with proc:
+        while True:
+            data = proc.stdout.read( CHUNK_SIZE )
+            if not data:
+                break
+            chunks.append( writer.add( data ) )
+            size += len( data )
+        err = proc.stderr.read()
+
+    if 0 != proc.returncode:
+        raise RuntimeError( 'saving image {} failed: {}'.format( image, err.decode( 'utf-8' ).strip() ) )
+
+    return chunks, size
+
+
+def _load_image( chunk_files, docker_host ):
+    '''
+    Stream an image to `docker load`.
+    '''
+    proc = subprocess.Popen(
+        [ 'docker', 'load', '--quiet' ],
+        env = dict( DOCKER_HOST = docker_host ),
+        stdin = subprocess.PIPE, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE
+    )
+
+    # Read errors concurrently, such that docker cannot block on a full pipe.
+    errors = []
+    reader = threading.Thread( target = lambda: errors.append( proc.stderr.read() ), daemon = True )
+    reader.start()
+
+    try:
+        for file in chunk_files:
+            with open( file, 'rb' ) as src:
+                shutil.copyfileobj( src, proc.stdin )
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+
+    proc.wait()
+    reader.join()
+
+    if 0 != proc.returncode:
+        raise RuntimeError( 'loading image failed: {}'.format( b''.join( errors ).decode( 'utf-8' ).strip() ) )
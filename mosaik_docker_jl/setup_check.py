@@ -0,0 +1,246 @@
+'''
+Module for incrementally checking simulation setups
+'''
+import hashlib
+import json
+import os
+import pathlib
+import threading
+
+from mosaik_docker.util.config_data import ConfigData as MDConfigData
+from mosaik_docker._config import CONFIG_FILE_NAME as MD_CONFIG_FILE_NAME
+
+from .build_context import BuildContext, IGNORE_FILE_NAME, format_size
+
+
+# Items required in the configuration file (checked in this order, like mosaik-docker does).
+_REQUIRED_ITEMS = [ 'id', 'orchestrator', 'sim_ids_up', 'sim_ids_down' ]
+_REQUIRED_ORCH_ITEMS = [ 'scenario_file', 'docker_file', 'extra_files', 'extra_dirs', 'results' ]
+
+
+class SetupChecker:
+    '''
+    Incremental version of command `check_sim_setup` of mosaik-docker.
+
+    A simulation setup is checked item by item: the configuration file, the scenario file,
+    the Dockerfile, each extra file and directory, and the size of the build context. The
+    result of each item is cached together with a signature of its inputs, i.e., the stat
+    information (device, inode, mode, modification time and size) of the paths it refers to.
+    When a setup is checked again, only items whose signature has changed are re-checked.
+
+    The signature of the build context covers the referenced files and all directories within
+    the extra directories, hence adding, removing or renaming files is detected. Files within
+    extra directories that grow or shrink in place are only taken into account the next time
+    the build context is computed for other reasons.
+    '''
+
+    def __init__( self, build_context_warn_size, default_ignore_rules = False ):
+        '''
+        :param build_context_warn_size: build context size above which a warning is issued (int, bytes)
+        :param default_ignore_rules: apply the default ignore rules for caches and version control to the build context (boolean)
+        '''
+        self.build_context_warn_size = build_context_warn_size
+        self.default_ignore_rules = default_ignore_rules
+        self._cache = {}
+        self._lock = threading.Lock()
+
+
+    def check( self, dir ):
+        '''
+        Check a simulation setup.
+
+        :param dir: path to simulation setup (string)
+        :return: dict in the following format:
+            {
+                'valid': flag indicating if the setup is valid (boolean)
+                'status': detailed status message, same as for mosaik-docker (string)
+                'warning': warning about a large build context (string, only if applicable)
+                'items': [ {
+                    'item': 'config', 'scenario_file', 'docker_file', 'extra_file', 'extra_dir' or 'build_context'
+                    'path': path relative to the simulation setup (string)
+                    'valid': flag indicating if the item is valid (boolean)
+                    'status': detailed status message (string)
+                    'cached': flag indicating if the result has been taken from the cache (boolean)
+                } ]
+            }
+        '''
+        setup_dir = pathlib.Path( dir ).resolve( strict = True )
+        key = str( setup_dir )
+
+        with self._lock:
+            cache = self._cache.get( key, {} )
+
+        # Results of this check, items that are not referred to anymore are dropped from the cache.
+        results = {}
+        items = []
+
+        def check_item( item, path, signature, fn ):
+            cached = cache.get( ( item, path ) )
+            hit = cached is not None and cached[0] == signature
+            result = cached[1] if hit else fn()
+            results[ ( item, path ) ] = ( signature, result )
+            items.append( dict( item = item, path = path, valid = result[ 'valid' ], status = result[ 'status' ], cached = hit ) )
+            return result
+
+        try:
+            config = check_item(
+                'config', MD_CONFIG_FILE_NAME,
+                _stat_signature( os.path.join( setup_dir, MD_CONFIG_FILE_NAME ) ),
+                lambda: _check_config( setup_dir )
+            )
+            if not config[ 'valid' ]:
+                return dict( valid = False, status = config[ 'status' ], items = items )
+
+            orch = config[ 'orchestrator' ]
+            checks = [ ( 'scenario_file', orch[ 'scenario_file' ], _check_scenario_file ), ( 'docker_file', orch[ 'docker_file' ], _check_docker_file ) ]
+            checks += [ ( 'extra_file', f, _check_extra_file ) for f in orch[ 'extra_files' ] ]
+            checks += [ ( 'extra_dir', d, _check_extra_dir ) for d in orch[ 'extra_dirs' ] ]
+
+            # All items are checked, the status refers to the first invalid one.
+            invalid = None
+            for item, path, fn in checks:
+                result = check_item(
+                    item, path, _stat_signature( os.path.join( setup_dir, path ) ),
+                    lambda: fn( setup_dir, path )
+                )
+                if not result[ 'valid' ] and invalid is None:
+                    invalid = result
+
+            if invalid is not None:
+                return dict( valid = False, status = invalid[ 'status' ], items = items )
+
+            response = dict( valid = True, status = 'simulation setup is valid: {}'.format( setup_dir ), items = items )
+
+            context = check_item(
+                'build_context', '.', _context_signature( setup_dir, config ),
+                lambda: self._check_build_context( setup_dir )
+            )
+            if not context[ 'valid' ]:
+                return dict( valid = False, status = context[ 'status' ], items = items )
+            if 'warning' in context:
+                response[ 'warning' ] = context[ 'warning' ]
+
+            return response
+
+        finally:
+            with self._lock:
+                self._cache[ key ] = results
+
+
+    def forget( self, dir ):
+        '''
+        Remove the cached results of a simulation setup (e.g., because it has been deleted).
+
+        :param dir: path to simulation setup (string)
+        '''
+        with self._lock:
+            self._cache.pop( os.path.realpath( dir ), None )
+
+
+    def _check_build_context( self, setup_dir ):
+        try:
+            context = BuildContext( setup_dir, self.default_ignore_rules )
+        except Exception as err:
+            return dict( valid = False, status = str( err ) )
+
+        result = dict( valid = True, status = '{} in {} files'.format( format_size( context.size ), len( context.files ) ) )
+
+        # Warn about large build contexts (the setup is still valid).
+        if context.size > self.build_context_warn_size:
+            largest = max( context.entries, key = lambda e: e[ 'size' ] )
+            result[ 'warning' ] = 'large build context: {} in {} files (largest entry: {} with {})'.format(
+                format_size( context.size ), len( context.files ), largest[ 'path' ], format_size( largest[ 'size' ] )
+            )
+
+        return result
+
+
+def _check_config( setup_dir ):
+    '''
+    Check that all required items are present in the configuration file.
+    '''
+    config_data = MDConfigData( setup_dir )
+
+    err = '"{}" is missing in configuration file'
+
+    for item in _REQUIRED_ITEMS:
+        if not item in config_data:
+            return dict( valid = False, status = err.format( item ) )
+
+    config_data_orch = config_data['orchestrator']
+    for item in _REQUIRED_ORCH_ITEMS:
+        if not item in config_data_orch:
+            return dict( valid = False, status = err.format( 'orchestrator.' + item ) )
+
+    return dict(
+        valid = True, status = 'ok',
+        orchestrator = { item: config_data_orch[ item ] for item in _REQUIRED_ORCH_ITEMS },
+        sim_ids = config_data['sim_ids_up'] + config_data['sim_ids_down']
+    )
+
+
+def _check_scenario_file( setup_dir, file ):
+    try:
+        if not os.path.isfile( pathlib.Path( setup_dir, file ).resolve( strict = True ) ):
+            raise Exception( 'not a file: {}'.format( file ) )
+    except Exception as err:
+        return dict( valid = False, status = 'scenario file missing\n{}'.format( err ) )
+    return dict( valid = True, status = 'ok' )
+
+
+def _check_docker_file( setup_dir, file ):
+    try:
+        if not os.path.isfile( pathlib.Path( setup_dir, file ).resolve( strict = True ) ):
+            raise Exception( 'not a file: {}'.format( file ) )
+    except Exception as err:
+        return dict( valid = False, status = 'Dockerfile missing\n{}'.format( err ) )
+    return dict( valid = True, status = 'ok' )
+
+
+def _check_extra_file( setup_dir, file ):
+    try:
+        if not pathlib.Path( setup_dir, file ).resolve( strict = True ).is_file():
+            raise Exception( 'not a file: {}'.format( file ) )
+    except Exception as err:
+        return dict( valid = False, status = 'extra file not found\n{}'.format( err ) )
+    return dict( valid = True, status = 'ok' )
+
+
+def _check_extra_dir( setup_dir, dir ):
+    try:
+        if not pathlib.Path( setup_dir, dir ).resolve( strict = True ).is_dir():
+            raise Exception( 'not a directory: {}'.format( dir ) )
+    except Exception as err:
+        return dict( valid = False, status = 'extra directory not found\n{}'.format( err ) )
+    return dict( valid = True, status = 'ok' )
+
+
+def _stat_signature( path ):
+    '''
+    :return: signature of a path's stat information (tuple) or None if the path does not exist
+    '''
+    try:
+        stat = os.stat( path )
+    except OSError:
+        return None
+    return ( stat.st_dev, stat.st_ino, stat.st_mode, stat.st_mtime_ns, stat.st_size )
+
+
+def _context_signature( setup_dir, config ):
+    '''
+    :return: signature of the inputs of the build context (string)
+    '''
+    orch = config[ 'orchestrator' ]
+    digest = hashlib.sha1( json.dumps( [ orch, sorted( config[ 'sim_ids' ] ) ] ).encode( 'utf-8' ) )
+
+    paths = [ IGNORE_FILE_NAME, orch[ 'scenario_file' ] ] + orch[ 'extra_files' ]
+    for path in paths:
+        digest.update( repr( _stat_signature( os.path.join( setup_dir, path ) ) ).encode( 'utf-8' ) )
+
+    # Like the build context, symbolic links are followed.
+    for dir in orch[ 'extra_dirs' ]:
+        for root, dirs, _ in os.walk( os.path.join( setup_dir, dir ), followlinks = True ):
+            dirs.sort()
+            digest.update( '{}{}'.format( root, _stat_signature( root ) ).encode( 'utf-8' ) )
+
+    return digest.hexdigest()
@@ -0,0 +1,238 @@
+'''
+Module for tracking the progress of running simulations
+'''
+import collections
+import concurrent.futures
+import datetime
+import os
+import re
+import subprocess
+import threading
+import time
+
+from ._module_name import __module_name__
+from .run_history import parse_docker_time
+from .sim_query import format_time
+
+
+# Progress bar printed by mosaik 3 (tqdm), e.g. 'Total:  45%|####5     | 450/1000 [00:02<00:03, 180.00steps/s]'.
+_TQDM_PROGRESS = re.compile( r'(\d+(?:\.\d+)?)/(\d+(?:\.\d+)?)\s*\[' )
+
+# Progress printed by mosaik 2, e.g. 'Progress: 45.00%'.
+_MOSAIK2_PROGRESS = re.compile( r'Progress:\s*(\d+(?:\.\d+)?)%' )
+
+# Number of log lines read when a simulation is polled for the first time.
+INITIAL_LOG_TAIL = 100
+
+
+class ProgressTracker:
+    '''
+    Track the progress of running simulations by parsing the progress output of the mosaik orchestrator.
+
+    The container logs are read incrementally: the first poll of a simulation only reads the tail of
+    its log, subsequent polls only read the log entries written since the previous poll. Polls of the
+    same simulation are rate-limited and run in background threads, such that requests are answered
+    from the progress samples collected so far. Only a bounded number of progress samples is kept per
+    simulation, from which the simulation speed and the estimated time to completion are derived.
+    '''
+
+    def __init__( self, docker_host, min_poll_interval = 5., max_samples = 32, max_workers = 4 ):
+        '''
+        :param docker_host: URL to the daemon socket to connect to when running docker (string)
+        :param min_poll_interval: minimum time between two polls of the same simulation (float, seconds)
+        :param max_samples: maximum number of progress samples kept per simulation (int)
+        :param max_workers: maximum number of simulations polled in parallel (int)
+        '''
+        self.docker_host = docker_host
+        self._min_poll_interval = min_poll_interval
+        self._max_samples = max_samples
+        self._sims = {}
+        self._lock = threading.Lock()
+        self._pollers = concurrent.futures.ThreadPoolExecutor( max_workers = max_workers, thread_name_prefix = __module_name__ + '-progress' )
+
+        # Increases whenever progress information changes (for entity tags of status responses).
+        self.revision = 0
+
+
+    def get_progress( self, dir, sim_ids ):
+        '''
+        Get the progress of running simulations. The logs of simulations that have not been polled
+        recently are read in the background, the result is based on the progress samples collected
+        so far (hence, it is None for simulations that are polled for the first time).
+
+        :param dir: path to the simulation setup of the simulations (string)
+        :param sim_ids: IDs of running simulations (list of strings)
+        :return: dict mapping simulation IDs to progress information (or None if no progress output has been found yet) in the following format:
+            {
+                'progress': fraction of the simulation completed (float, between 0 and 1)
+                'sim_time': current simulation time, if reported by mosaik (float)
+                'until': simulation end time, if reported by mosaik (float)
+                'steps_per_second': simulation time steps per second of wall-clock time (float)
+                'eta': estimated time to completion, counted from now (float, seconds)
+                'updated': time of the latest progress output (ISO 8601 string)
+            }
+        '''
+        now = time.monotonic()
+        key = os.path.realpath( dir )
+
+        with self._lock:
+            for id in sim_ids:
+                sim = self._sims.get( id )
+                if sim is None:
+                    sim = self._sims[ id ] = dict(
+                        dir = key,
+                        since = None,
+                        polled = None,
+                        polling = False,
+                        samples = collections.deque( maxlen = self._max_samples )
+                    )
+                due = sim[ 'polled' ] is None or now - sim[ 'polled' ] >= self._min_poll_interval
+                if due and not sim[ 'polling' ]:
+                    sim[ 'polled' ] = now
+                    sim[ 'polling' ] = True
+                    self._pollers.submit( self._poll, id )
+
+            return { id: _estimate( self._sims[ id ][ 'samples' ], time.time() ) for id in sim_ids }
+
+
+    def close( self ):
+        '''
+        Stop polling the logs of simulations.
+        '''
+        self._pollers.shutdown( wait = True )
+
+
+    def retain( self, dir, sim_ids ):
+        '''
+        Discard the progress information of all simulations of a simulation setup except the given ones
+        (e.g., because the other simulations have finished, or have been cleared while still running).
+
+        :param dir: path to simulation setup (string)
+        :param sim_ids: IDs of the simulations to keep (iterable of strings, e.g. the running simulations)
+        '''
+        key = os.path.realpath( dir )
+        keep = set( sim_ids )
+
+        with self._lock:
+            for id in [ id for id, sim in self._sims.items() if key == sim[ 'dir' ] and id not in keep ]:
+                del self._sims[ id ]
+
+
+    def _poll( self, id ):
+        '''
+        Read the new log entries of a simulation and record the latest progress output.
+        '''
+        try:
+            self._read_logs( id )
+        finally:
+            with self._lock:
+                sim = self._sims.get( id )
+                if sim is not None:
+                    sim[ 'polling' ] = False
+
+
+    def _read_logs( self, id ):
+        '''
+        Read the log entries of a simulation written since the previous poll.
+        '''
+        with self._lock:
+            sim = self._sims.get( id )
+            if sim is None:
+                return # Discarded in the meantime (see method `retain`).
+            since = sim[ 'since' ]
+
+        cmd = [ 'docker', 'logs', '--timestamps' ]
+        cmd.extend( [ '--since', since ] if since else [ '--tail', str( INITIAL_LOG_TAIL ) ] )
+        cmd.append( id )
+
+        latest = None
+        last_timestamp = None
+
+        try:
+            p = subprocess.Popen(
+                cmd,
+                env = dict( DOCKER_HOST = self.docker_host ),
+                stdout = subprocess.PIPE,
+                stderr = subprocess.STDOUT # mosaik prints its progress to stderr.
+            )
+
+            # Process the log stream entry by entry, only the latest progress output is kept.
+            for line in p.stdout:
+                line = line.decode( 'utf-8', errors = 'replace' )
+                timestamp, _, text = line.partition( ' ' )
+                if parse_docker_time( timestamp ) is None:
+                    continue
+                last_timestamp = timestamp
+                sample = _parse_progress( text )
+                if sample is not None:
+                    latest = ( parse_docker_time( timestamp ), *sample )
+
+            p.wait()
+
+        except OSError:
+            return
+
+        with self._lock:
+            sim = self._sims.get( id )
+            if sim is None:
+                return
+
+            if last_timestamp is not None:
+                sim[ 'since' ] = last_timestamp
+
+            # Entries with exactly the timestamp passed via '--since' are returned again.
+            if latest is not None and ( not sim[ 'samples' ] or latest[0] > sim[ 'samples' ][-1][0] ):
+                sim[ 'samples' ].append( latest )
+                self.revision += 1
+
+
+def _parse_progress( text ):
+    '''
+    Parse the latest progress output from a log entry. Progress bars are redrawn with carriage returns,
+    hence a single log entry may contain several updates.
+
+    :return: tuple (progress, sim_time, until) or None if the entry contains no progress output
+    '''
+    for segment in reversed( re.split( r'[\r\n]', text ) ):
+        match = _TQDM_PROGRESS.search( segment )
+        if match is not None:
+            sim_time, until = float( match.group( 1 ) ), float( match.group( 2 ) )
+            if until > 0:
+                return ( min( sim_time / until, 1. ), sim_time, until )
+
+        match = _MOSAIK2_PROGRESS.search( segment )
+        if match is not None:
+            return ( min( float( match.group( 1 ) ) / 100., 1. ), None, None )
+
+    return None
+
+
+def _estimate( samples, now ):
+    '''
+    Derive progress information from progress samples.
+
+    :param samples: progress samples, oldest first (sequence of tuples (timestamp, progress, sim_time, until))
+    :param now: current time (float, seconds since the epoch), the time to completion is counted from it
+    '''
+    if not samples:
+        return None
+
+    t1, progress, sim_time, until = samples[-1]
+    t0, progress0, sim_time0, _ = samples[0]
+
+    steps_per_second = None
+    eta = None
+    if t1 > t0 and progress > progress0:
+        # The estimate refers to the time of the latest sample, which may lie in the past.
+        eta = max( 0., ( 1. - progress ) * ( t1 - t0 ) / ( progress - progress0 ) - max( 0., now - t1 ) )
+        if sim_time is not None and sim_time0 is not None:
+            steps_per_second = ( sim_time - sim_time0 ) / ( t1 - t0 )
+
+    return dict(
+        progress = progress,
+        sim_time = sim_time,
+        until = until,
+        steps_per_second = steps_per_second,
+        eta = eta,
+        updated = format_time( datetime.datetime.fromtimestamp( t1, datetime.timezone.utc ) )
+    )
@@ -0,0 +1,239 @@
+'''
+Module for filtering, sorting and paginating lists of simulations
+'''
+import base64
+import bisect
+import datetime
+import json
+
+
+# Simulation states, in the order in which they are sorted.
+SIM_STATES = ( 'up', 'down' )
+
+# Fields that may be selected for the items of a page. Field 'progress' is only included if
+# selected explicitly, since retrieving it requires reading container logs. Likewise, field
+# 'created' is only included if selected explicitly or required for sorting or filtering,
+# since retrieving it requires querying Docker.
+SIM_FIELDS = ( 'id', 'state', 'status', 'created', 'progress' )
+
+# Keys by which the items of a page may be sorted.
+SIM_SORT_KEYS = ( 'id', 'state', 'created' )
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class SimQuery:
+    '''
+    Filter, sort and paginate a list of simulation records.
+
+    Simulation records are dicts with (at least) the keys 'id' and 'state' (either 'up' or 'down').
+    Depending on the source, they may also provide keys 'status' and 'created' (creation time as
+    ISO 8601 string in UTC).
+
+    Pagination is cursor-based: each page contains an opaque cursor pointing to its last item,
+    which can be passed to the next query to retrieve the following page. In contrast to
+    offset-based pagination, pages remain consistent when simulations are added or removed
+    in between requests.
+    '''
+
+    def __init__( self, states = None, id_prefix = None, created_after = None, created_before = None,
+        sort = 'id', descending = False, limit = DEFAULT_PAGE_SIZE, cursor = None, fields = None ):
+        '''
+        :param states: only include simulations in one of these states (list of strings, default: all states)
+        :param id_prefix: only include simulations whose ID starts with this prefix (string)
+        :param created_after: only include simulations created at or after this time (ISO 8601 string)
+        :param created_before: only include simulations created before this time (ISO 8601 string)
+        :param sort: sort key, one of 'id', 'state' or 'created' (string, default: 'id')
+        :param descending: sort in descending order (boolean, default: False)
+        :param limit: maximum number of items per page (int, default: 100)
+        :param cursor: cursor returned with the previous page (string)
+        :param fields: fields to be included for each item (list of strings, default: all available fields except 'progress' and 'created')
+        '''
+        if states is None:
+            states = list( SIM_STATES )
+        for state in states:
+            if state not in SIM_STATES:
+                raise ValueError( 'invalid simulation state: {}'.format( state ) )
+
+        if sort not in SIM_SORT_KEYS:
+            raise ValueError( 'invalid sort key: {}'.format( sort ) )
+
+        if isinstance( limit, bool ) or not isinstance( limit, int ) or limit < 1 or limit > MAX_PAGE_SIZE:
+            raise ValueError( 'page size must be an integer between 1 and {}'.format( MAX_PAGE_SIZE ) )
+
+        if fields is not None:
+            for field in fields:
+                if field not in SIM_FIELDS:
+                    raise ValueError( 'invalid field: {}'.format( field ) )
+
+        self.states = set( states )
+        self.id_prefix = id_prefix if id_prefix else None
+        self.created_after = parse_time( created_after ) if created_after else None
+        self.created_before = parse_time( created_before ) if created_before else None
+        self.sort = sort
+        self.descending = bool( descending )
+        self.limit = limit
+        self.cursor = decode_cursor( cursor, self.sort, self.descending ) if cursor else None
+        self.fields = fields
+
+
+    @property
+    def needs_progress( self ):
+        '''
+        Flag indicating if the progress of running simulations has been requested.
+        '''
+        return self.fields is not None and 'progress' in self.fields
+
+
+    @property
+    def needs_created( self ):
+        '''
+        Flag indicating if the creation times of the simulations are required to answer this query.
+        '''
+        return ( self.created_after is not None or self.created_before is not None or
+            'created' == self.sort or ( self.fields is not None and 'created' in self.fields ) )
+
+
+    def apply( self, records ):
+        '''
+        Apply this query to a list of simulation records.
+
+        :param records: simulation records (iterable of dicts)
+        :return: dict with the requested page in the following format:
+            {
+                'items': list of simulation records (list of dicts)
+                'total': number of simulations matching the filter criteria (int)
+                'next': cursor for retrieving the next page or None if this is the last page (string)
+            }
+        '''
+        matches = sorted( filter( self._match, records ), key = self._sort_key )
+        keys = [ self._sort_key( r ) for r in matches ]
+
+        try:
+            if self.descending:
+                end = bisect.bisect_left( keys, self.cursor ) if self.cursor else len( matches )
+                start = max( 0, end - self.limit )
+                page = matches[start:end][::-1]
+                has_next = start > 0
+            else:
+                start = bisect.bisect_right( keys, self.cursor ) if self.cursor else 0
+                end = start + self.limit
+                page = matches[start:end]
+                has_next = end < len( matches )
+        except TypeError:
+            raise ValueError( 'invalid cursor for sort key: {}'.format( self.sort ) )
+
+        return dict(
+            items = [ self._select( r ) for r in page ],
+            total = len( matches ),
+            next = encode_cursor( self._sort_key( page[-1] ), self.sort, self.descending ) if has_next and page else None
+        )
+
+
+    def _match( self, record ):
+        '''
+        Check if a simulation record matches the filter criteria.
+        '''
+        if record['state'] not in self.states:
+            return False
+
+        if self.id_prefix and not record['id'].startswith( self.id_prefix ):
+            return False
+
+        if self.created_after or self.created_before:
+            created = record.get( 'created' )
+            if not created:
+                return False
+            created = parse_time( created )
+            if self.created_after and created < self.created_after:
+                return False
+            if self.created_before and created >= self.created_before:
+                return False
+
+        return True
+
+
+    def _sort_key( self, record ):
+        '''
+        Return the sort key of a simulation record. Ties are resolved by the simulation ID.
+        '''
+        if 'state' == self.sort:
+            return [ SIM_STATES.index( record['state'] ), record['id'] ]
+        elif 'created' == self.sort:
+            return [ record.get( 'created' ) or '', record['id'] ]
+        return [ record['id'], record['id'] ]
+
+
+    def _select( self, record ):
+        '''
+        Reduce a simulation record to the selected fields (the ID is always included).
+        '''
+        if self.fields is None:
+            return dict( record )
+        return { k: v for k, v in record.items() if 'id' == k or k in self.fields }
+
+
+def format_time( timestamp ):
+    '''
+    Format a timestamp as ISO 8601 string in UTC.
+
+    :param timestamp: timezone-aware timestamp (datetime.datetime)
+    :return: formatted timestamp (string)
+    '''
+    return timestamp.astimezone( datetime.timezone.utc ).strftime( '%Y-%m-%dT%H:%M:%SZ' )
+
+
+def parse_time( value ):
+    '''
+    Parse an ISO 8601 string. Timestamps without timezone information are interpreted as UTC.
+    '''
+    try:
+        timestamp = datetime.datetime.fromisoformat( value.replace( 'Z', '+00:00' ) )
+    except ( AttributeError, ValueError ):
+        raise ValueError( 'invalid timestamp: {}'.format( value ) )
+
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace( tzinfo = datetime.timezone.utc )
+
+    return timestamp
+
+
+def encode_cursor( key, sort, descending ):
+    '''
+    Encode a sort key as opaque cursor. The cursor also records the sort order, since its key
+    can only be compared with the keys of the same order.
+
+    :param key: sort key of the last item of a page (list)
+    :param sort: sort key name (string)
+    :param descending: sort in descending order (boolean)
+    :return: cursor (string)
+    '''
+    cursor = dict( s = sort, d = bool( descending ), k = key )
+    return base64.urlsafe_b64encode( json.dumps( cursor ).encode( 'utf-8' ) ).decode( 'ascii' )
+
+
+def decode_cursor( cursor, sort, descending ):
+    '''
+    Decode an opaque cursor to a sort key.
+
+    :param cursor: cursor (string)
+    :param sort: sort key name of the query the cursor is used with (string)
+    :param descending: sort order of the query the cursor is used with (boolean)
+    :return: sort key (list)
+    :raises ValueError: if the cursor is invalid or has been returned for another sort order
+    '''
+    try:
+        decoded = json.loads( base64.urlsafe_b64decode( cursor.encode( 'ascii' ) ) )
+        key = decoded[ 'k' ]
+    except Exception:
+        raise ValueError( 'invalid cursor: {}'.format( cursor ) )
+
+    if not isinstance( key, list ) or 2 != len( key ):
+        raise ValueError( 'invalid cursor: {}'.format( cursor ) )
+
+    if decoded.get( 's' ) != sort or decoded.get( 'd' ) is not bool( descending ):
+        raise ValueError( 'cursor does not match sort order: {} ({})'.format(
+            sort, 'descending' if descending else 'ascending' ) )
+
+    return key
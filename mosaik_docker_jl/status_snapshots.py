@@ -0,0 +1,219 @@
+'''
+Module for keeping track of version-stamped simulation status snapshots
+'''
+import collections
+import os
+import re
+import threading
+import time
+
+
+# Maximum number of changes kept per simulation setup for answering delta requests.
+MAX_CHANGE_LOG_LENGTH = 100
+
+# Time during which a snapshot is considered current without querying Docker again (seconds).
+DEFAULT_MAX_AGE = 2.
+
+# Parenthesized parts of Docker status strings, e.g. the exit code in 'Exited (0) 5 minutes ago'.
+_STATUS_DETAILS = re.compile( r'\([^)]*\)' )
+
+
+class StatusSnapshots:
+    '''
+    Keep the latest simulation status of each simulation setup together with a version stamp
+    and a bounded log of changes, such that clients can ask for the changes since the version
+    they have seen last instead of retrieving the complete status again.
+
+    Version stamps are integers that increase with every change. The initial version is derived
+    from the current time, hence version stamps remain monotonic across server restarts and stale
+    versions from a previous server process are never mistaken for current ones.
+
+    Only changes of the normalized status count as changes (see function `normalize_status`),
+    the relative times in Docker's status strings (e.g., "Up 3 minutes") are ignored.
+    '''
+
+    def __init__( self, max_change_log_length = MAX_CHANGE_LOG_LENGTH, max_age = DEFAULT_MAX_AGE ):
+        '''
+        :param max_change_log_length: maximum number of changes kept per simulation setup (int)
+        :param max_age: time during which a snapshot is considered current (float, seconds, see method `current_version`)
+        '''
+        self._max_change_log_length = max_change_log_length
+        self._max_age = max_age
+        self._initial_version = int( time.time() * 1000 )
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+
+    def update( self, dir, status ):
+        '''
+        Update the snapshot of a simulation setup.
+
+        :param dir: path to simulation setup (string)
+        :param status: status of all simulations in the format returned by command `get_sim_status` (dict)
+        :return: version of the snapshot (int)
+        '''
+        return self.update_with_finished( dir, status )[0]
+
+
+    def update_with_finished( self, dir, status ):
+        '''
+        Update the snapshot of a simulation setup and determine which simulations have finished
+        since the previous snapshot. Simulations that were already listed as finished before are
+        not reported again.
+
+        :param dir: path to simulation setup (string)
+        :param status: status of all simulations in the format returned by command `get_sim_status` (dict)
+        :return: version of the snapshot (int) and IDs of newly finished simulations (list of strings);
+            if there has been no snapshot before, all finished simulations are reported
+        '''
+        key = os.path.realpath( dir )
+        normalized = _normalize( status )
+
+        with self._lock:
+            snapshot = self._snapshots.get( key )
+
+            if snapshot is None:
+                snapshot = dict(
+                    version = self._initial_version,
+                    status = normalized,
+                    changes = collections.deque( maxlen = self._max_change_log_length ),
+                    updated = time.monotonic()
+                )
+                self._snapshots[ key ] = snapshot
+                return snapshot[ 'version' ], list( status[ 'down' ] )
+
+            finished = [ id for id in status[ 'down' ] if id not in snapshot[ 'status' ][ 'down' ] ]
+
+            changes = _diff_status( snapshot[ 'status' ], normalized, status )
+            if changes is not None:
+                snapshot[ 'version' ] += 1
+                snapshot[ 'status' ] = normalized
+                snapshot[ 'changes' ].append( ( snapshot[ 'version' ], changes ) )
+            snapshot[ 'updated' ] = time.monotonic()
+
+            return snapshot[ 'version' ], finished
+
+
+    def version( self, dir ):
+        '''
+        Get the current snapshot version of a simulation setup.
+
+        :param dir: path to simulation setup (string)
+        :return: version of the snapshot (int) or None if there is no snapshot yet
+        '''
+        with self._lock:
+            snapshot = self._snapshots.get( os.path.realpath( dir ) )
+            return snapshot[ 'version' ] if snapshot is not None else None
+
+
+    def current_version( self, dir ):
+        '''
+        Get the snapshot version of a simulation setup if the snapshot has been updated recently,
+        such that conditional requests can be answered without querying Docker.
+
+        :param dir: path to simulation setup (string)
+        :return: version of the snapshot (int) or None if there is no snapshot or it is older than the maximum age
+        '''
+        with self._lock:
+            snapshot = self._snapshots.get( os.path.realpath( dir ) )
+            if snapshot is None or time.monotonic() - snapshot[ 'updated' ] > self._max_age:
+                return None
+            return snapshot[ 'version' ]
+
+
+    def changes_since( self, dir, version ):
+        '''
+        Retrieve the accumulated changes of a simulation setup's status since a given version.
+
+        :param dir: path to simulation setup (string)
+        :param version: version known by the client (int)
+        :return: None if the changes are not available anymore (or have never been known), otherwise the changes in the following format:
+            {
+                'up': { string: string } # new or changed running simulation IDs and status
+                'down': { string: string } # new or changed finished simulation IDs and status
+                'removed': [ string ] # IDs of simulations that have been removed
+            }
+            Simulations listed under one state are not listed under the other state anymore.
+        '''
+        key = os.path.realpath( dir )
+
+        with self._lock:
+            snapshot = self._snapshots.get( key )
+            if snapshot is None or version > snapshot[ 'version' ]:
+                return None
+
+            log = [ c for c in snapshot[ 'changes' ] if c[0] > version ]
+            if len( log ) != snapshot[ 'version' ] - version:
+                # Some of the requested changes have already been dropped from the log.
+                return None
+
+        delta = dict( up = {}, down = {}, removed = [] )
+        for _, changes in log:
+            _merge_changes( delta, changes )
+
+        return delta
+
+
+def normalize_status( status ):
+    '''
+    Normalize a Docker status string by removing relative times, e.g. 'Exited (0) 5 minutes ago'
+    becomes 'Exited (0)' and 'Up 3 minutes (Paused)' becomes 'Up (Paused)'.
+
+    :param status: Docker status string (string)
+    :return: state and parenthesized details, such as the exit code (string)
+    '''
+    words = status.split( None, 1 )
+    if not words:
+        return ''
+    return ' '.join( [ words[0], *_STATUS_DETAILS.findall( status ) ] )
+
+
+def _normalize( status ):
+    '''
+    Copy a status dict with normalized status strings (only the parts relevant for computing changes).
+    '''
+    return {
+        state: { id: normalize_status( s ) for id, s in status[ state ].items() }
+        for state in ( 'up', 'down' )
+    }
+
+
+def _diff_status( old, new, status ):
+    '''
+    Compute the changes between two normalized status dicts.
+
+    :param old: previous normalized status (dict)
+    :param new: current normalized status (dict)
+    :param status: current status, from which the reported status strings are taken (dict)
+    :return: changes (see method `StatusSnapshots.changes_since`) or None if there are no changes
+    '''
+    up = { id: status[ 'up' ][ id ] for id, s in new[ 'up' ].items() if old[ 'up' ].get( id ) != s }
+    down = { id: status[ 'down' ][ id ] for id, s in new[ 'down' ].items() if old[ 'down' ].get( id ) != s }
+    removed = [
+        id for id in ( *old[ 'up' ], *old[ 'down' ] )
+        if id not in new[ 'up' ] and id not in new[ 'down' ]
+    ]
+
+    if not ( up or down or removed ):
+        return None
+
+    return dict( up = up, down = down, removed = removed )
+
+
+def _merge_changes( delta, changes ):
+    '''
+    Merge changes into accumulated changes (in place). Simulations that moved from one
+    state to another only appear in the list of their latest state.
+    '''
+    for id in changes[ 'removed' ]:
+        delta[ 'up' ].pop( id, None )
+        delta[ 'down' ].pop( id, None )
+        if id not in delta[ 'removed' ]:
+            delta[ 'removed' ].append( id )
+
+    for state, other in ( ( 'up', 'down' ), ( 'down', 'up' ) ):
+        for id, s in changes[ state ].items():
+            delta[ other ].pop( id, None )
+            delta[ state ][ id ] = s
+            if id in delta[ 'removed' ]:
+                delta[ 'removed' ].remove( id )
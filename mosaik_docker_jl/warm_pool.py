@@ -0,0 +1,287 @@
+'''
+Module for keeping pools of pre-created simulation containers
+'''
+import os
+import subprocess
+import threading
+import time
+import uuid
+
+from mosaik_docker.util.config_data import ConfigData as MDConfigData
+from mosaik_docker.util.create_unique_id import create_unique_id as md_create_unique_id
+from mosaik_docker._config import ORCH_IMAGE_NAME_TEMPLATE as MD_ORCH_IMAGE_NAME_TEMPLATE
+
+
+# Prefix for the names of pooled containers.
+WARM_CONTAINER_PREFIX = 'mdjl-warm'
+
+# Label identifying the server process that has created a pooled container.
+WARM_CONTAINER_OWNER_LABEL = 'mdjl-warm-owner'
+
+
+class WarmPool:
+    '''
+    Keep a pool of created but not yet started orchestrator containers per simulation setup,
+    such that starting a simulation only requires renaming and starting a container.
+
+    Pooled containers are created from the current build of the simulation setup's orchestrator
+    image. Each container is tagged with a fingerprint (image ID and scenario file). Containers
+    whose fingerprint does not match the current one (e.g., after the setup has been rebuilt or
+    reconfigured) are discarded instead of being started. Containers that have been idle for
+    too long are discarded as well.
+
+    Pooled containers are labelled with an ID of the pool instance, such that containers left
+    over from a previous server process can be told apart from those being created concurrently.
+    '''
+
+    def __init__( self, docker_host, size = 1, max_idle = 600. ):
+        '''
+        :param docker_host: URL to the daemon socket to connect to when running docker (string)
+        :param size: number of idle containers kept per simulation setup (int)
+        :param max_idle: maximum time an idle container is kept (float, seconds)
+        '''
+        self.docker_host = docker_host
+        self.size = size
+        self.max_idle = max_idle
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._reaper = None
+        self._owner = uuid.uuid4().hex
+
+
+    def start_sim( self, dir ):
+        '''
+        Start a new simulation with a pooled container.
+        Like command `start_sim`, the new simulation ID is added to the simulation setup configuration.
+
+        :param dir: path to simulation setup (string)
+        :return: ID of the new simulation (string) or None if no matching container is available
+        '''
+        config_data = MDConfigData( dir )
+        fingerprint = self._fingerprint( config_data )
+        if fingerprint is None:
+            return None
+
+        container = self._acquire( dir, fingerprint )
+        if container is None:
+            return None
+
+        sim_ids_up = config_data[ 'sim_ids_up' ]
+        sim_ids_down = config_data[ 'sim_ids_down' ]
+
+        id = md_create_unique_id()
+        while id in sim_ids_up or id in sim_ids_down:
+            id = md_create_unique_id()
+
+        try:
+            # The simulation ID is the container name.
+            self._docker( 'rename', container, id )
+        except Exception:
+            self._remove( [ container ] )
+            return None
+
+        try:
+            self._docker( 'start', id )
+
+            # Update sim setup config.
+            sim_ids_up.append( id )
+            config_data.write()
+        except Exception:
+            self._remove( [ id ] )
+            return None
+
+        return id
+
+
+    def refill( self, dir ):
+        '''
+        Discard stale containers and create new containers until the pool of a simulation setup is full.
+
+        :param dir: path to simulation setup (string)
+        '''
+        config_data = MDConfigData( dir )
+        fingerprint = self._fingerprint( config_data )
+        if fingerprint is None:
+            # The orchestrator image has not been built yet.
+            return self.drain( dir )
+
+        key = os.path.realpath( dir )
+        prefix = '{}-{}-'.format( WARM_CONTAINER_PREFIX, config_data[ 'id' ].strip().lower() )
+
+        with self._lock:
+            if self._reaper is None:
+                self._reaper = threading.Thread( target = self._reap_idle, name = 'mosaik-docker-jl-warm-pool', daemon = True )
+                self._reaper.start()
+
+            pool = self._pools.get( key )
+            if pool is None:
+                pool = self._pools[ key ] = dict( containers = [], pending = 0, adopted = False )
+            adopted = pool[ 'adopted' ]
+            pool[ 'adopted' ] = True
+            stale = self._take_stale( pool, fingerprint )
+
+            # Containers being created by concurrent refills count as part of the pool.
+            missing = max( 0, self.size - len( pool[ 'containers' ] ) - pool[ 'pending' ] )
+            pool[ 'pending' ] += missing
+
+        if not adopted:
+            # Remove containers left over from a previous server process (but not those
+            # created by this process, e.g., by a concurrent refill).
+            stale.extend( n for n, owner in self._list_containers( prefix ) if owner != self._owner )
+        self._remove( stale )
+
+        image_id, scenario_file = fingerprint
+        try:
+            for _ in range( missing ):
+                name = prefix + uuid.uuid4().hex[:8]
+                self._docker(
+                    'create',
+                    '--name', name,
+                    '--label', '{}={}'.format( WARM_CONTAINER_OWNER_LABEL, self._owner ),
+                    '--env', 'SCENARIO_FILE={}'.format( scenario_file ),
+                    image_id
+                )
+
+                with self._lock:
+                    pool[ 'pending' ] -= 1
+                    missing -= 1
+                    # The pool may have been drained in the meantime.
+                    drained = self._pools.get( key ) is not pool
+                    if not drained:
+                        pool[ 'containers' ].append( dict( name = name, fingerprint = fingerprint, created = time.monotonic() ) )
+
+                if drained:
+                    self._remove( [ name ] )
+                    break
+        finally:
+            with self._lock:
+                pool[ 'pending' ] -= missing
+
+
+    def drain( self, dir ):
+        '''
+        Remove all pooled containers of a simulation setup.
+
+        :param dir: path to simulation setup (string)
+        '''
+        with self._lock:
+            pool = self._pools.pop( os.path.realpath( dir ), None )
+
+        if pool is not None:
+            self._remove( [ c[ 'name' ] for c in pool[ 'containers' ] ] )
+
+
+    def close( self ):
+        '''
+        Remove all pooled containers.
+        '''
+        self._closed.set()
+        for dir in list( self._pools ):
+            self.drain( dir )
+
+
+    def _reap_idle( self ):
+        '''
+        Background thread: periodically remove containers that have exceeded the maximum idle time.
+        '''
+        while not self._closed.wait( max( 1., self.max_idle / 4 ) ):
+            now = time.monotonic()
+            with self._lock:
+                expired = []
+                for pool in self._pools.values():
+                    expired.extend( c for c in pool[ 'containers' ] if now - c[ 'created' ] > self.max_idle )
+                    pool[ 'containers' ] = [ c for c in pool[ 'containers' ] if c not in expired ]
+            self._remove( [ c[ 'name' ] for c in expired ] )
+
+
+    def _acquire( self, dir, fingerprint ):
+        '''
+        Take a container with matching fingerprint from the pool of a simulation setup.
+        '''
+        with self._lock:
+            pool = self._pools.get( os.path.realpath( dir ) )
+            if pool is None:
+                return None
+            stale = self._take_stale( pool, fingerprint )
+            container = pool[ 'containers' ].pop( 0 ) if pool[ 'containers' ] else None
+
+        self._remove( stale )
+
+        return container[ 'name' ] if container is not None else None
+
+
+    def _take_stale( self, pool, fingerprint ):
+        '''
+        Remove containers with outdated fingerprint or exceeded idle time from a pool (lock must be held).
+
+        :return: names of the removed containers
+        '''
+        now = time.monotonic()
+        stale = [
+            c for c in pool[ 'containers' ]
+            if c[ 'fingerprint' ] != fingerprint or now - c[ 'created' ] > self.max_idle
+        ]
+        pool[ 'containers' ] = [ c for c in pool[ 'containers' ] if c not in stale ]
+        return [ c[ 'name' ] for c in stale ]
+
+
+    def _fingerprint( self, config_data ):
+        '''
+        Fingerprint of the current build of a simulation setup.
+
+        :return: tuple (image ID, scenario file) or None if the orchestrator image does not exist
+        '''
+        image_name = MD_ORCH_IMAGE_NAME_TEMPLATE.format( config_data[ 'id' ].strip().lower() )
+        res = subprocess.run(
+            [ 'docker', 'image', 'inspect', '--format', '{{.Id}}', image_name ],
+            env = dict( DOCKER_HOST = self.docker_host ),
+            capture_output = True
+        )
+        if 0 != res.returncode:
+            return None
+
+        return ( res.stdout.decode( 'utf-8' ).strip(), config_data[ 'orchestrator' ][ 'scenario_file' ].strip() )
+
+
+    def _list_containers( self, prefix ):
+        '''
+        List all containers whose names start with a given prefix.
+
+        :return: list of tuples (container name, owner label)
+        '''
+        res = subprocess.run(
+            [
+                'docker', 'ps', '--all', '--filter', 'name={}'.format( prefix ),
+                '--format', '{{{{.Names}}}}\t{{{{.Label "{}"}}}}'.format( WARM_CONTAINER_OWNER_LABEL )
+            ],
+            env = dict( DOCKER_HOST = self.docker_host ),
+            capture_output = True
+        )
+        containers = [ l.split( '\t' ) + [ '' ] for l in res.stdout.decode( 'utf-8' ).split( '\n' ) ]
+        return [ ( c[0], c[1] ) for c in containers if c[0].startswith( prefix ) ]
+
+
+    def _remove( self, names ):
+        '''
+        Remove containers (errors are ignored).
+        '''
+        if names:
+            subprocess.run(
+                [ 'docker', 'rm', '--force', '--volumes', *names ],
+                env = dict( DOCKER_HOST = self.docker_host ),
+                capture_output = True
+            )
+
+
+    def _docker( self, *args ):
+        '''
+        Execute a docker command.
+        '''
+        res = subprocess.run(
+            [ 'docker', *args ],
+            env = dict( DOCKER_HOST = self.docker_host ),
+            capture_output = True
+        )
+        if 0 != res.returncode:
+            raise Exception( res.stderr.decode( 'utf-8' ).strip() )
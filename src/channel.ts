@@ -0,0 +1,299 @@
+import { URLExt } from '@jupyterlab/coreutils';
+import { ServerConnection } from '@jupyterlab/services';
+import { PromiseDelegate } from '@lumino/coreutils';
+
+/**
+ * A single persistent websocket connection to the mosaik_docker_jl backend,
+ * carrying the requests and responses of all commands as well as all event
+ * streams (build output, simulation status changes, simulation output).
+ *
+ * Messages are tagged with IDs, such that many requests and subscriptions can
+ * be active at the same time. Each subscription grants the server a limited
+ * credit of events, which is renewed as soon as the events have been handled.
+ */
+export class MosaikDockerChannel {
+  /**
+   * Send a command to the server and wait for its response.
+   *
+   * @param command - command name (same as the corresponding HTTP endpoint)
+   * @param data - command input (same as the corresponding HTTP request body)
+   * @param signal - optional signal for aborting the request, the command is cancelled on the server
+   * @param deadline - optional maximum execution time in seconds (can only shorten the deadline configured on the server)
+   * @returns command response (with code 3 if the deadline has been exceeded)
+   */
+  async request(
+    command: string,
+    data: Record<string, any> = {},
+    signal?: AbortSignal,
+    deadline?: number
+  ): Promise<any> {
+    if (signal?.aborted) {
+      return Promise.reject('aborted');
+    }
+
+    const ws = await this._connect();
+    const id = this._nextId();
+    const reply = new PromiseDelegate<any>();
+    this._requests.set(id, reply);
+    ws.send(JSON.stringify({ type: 'request', id, command, data, deadline }));
+
+    if (signal) {
+      const onAbort = () => {
+        if (this._requests.delete(id)) {
+          this._ws?.send(JSON.stringify({ type: 'cancel', id }));
+          reply.reject('aborted');
+        }
+      };
+      signal.addEventListener('abort', onAbort);
+      reply.promise
+        .catch(() => undefined)
+        .then(() => signal.removeEventListener('abort', onAbort));
+    }
+
+    return reply.promise;
+  }
+
+  /**
+   * Subscribe to an event stream.
+   *
+   * @param stream - stream name ('build', 'status' or 'logs')
+   * @param data - stream input
+   * @param onEvent - callback for each event of the stream
+   * @param onEnd - callback for the final response of the stream
+   * @param credit - number of events the server may send ahead
+   * @returns subscription, which can be used to unsubscribe
+   */
+  async subscribe(
+    stream: string,
+    data: Record<string, any>,
+    onEvent: (event: any) => void | PromiseLike<void>,
+    onEnd: (response: any) => void | PromiseLike<void>,
+    credit = MosaikDockerChannel.DEFAULT_CREDIT
+  ): Promise<MosaikDockerChannel.ISubscription> {
+    const ws = await this._connect();
+    const id = this._nextId();
+    this._subscriptions.set(id, {
+      onEvent,
+      onEnd,
+      credit,
+      handled: 0,
+      queue: Promise.resolve()
+    });
+    ws.send(JSON.stringify({ type: 'subscribe', id, stream, data, credit }));
+    return {
+      unsubscribe: () => {
+        if (this._subscriptions.has(id) && this._ws) {
+          this._ws.send(JSON.stringify({ type: 'unsubscribe', id }));
+        }
+      }
+    };
+  }
+
+  /**
+   * Open the connection (if it is not open yet).
+   * @returns true if the connection is open, false if it could not be opened
+   */
+  async connect(): Promise<boolean> {
+    // Do not retry if the server does not support the channel.
+    if (this._unavailable) {
+      return false;
+    }
+    try {
+      await this._connect();
+      return true;
+    } catch (error) {
+      this._unavailable = true;
+      return false;
+    }
+  }
+
+  /**
+   * Open the connection (if it is not open yet).
+   */
+  private async _connect(): Promise<WebSocket> {
+    if (!this._connecting) {
+      this._connecting = Private.openWebSocket('channel', this._onMessage, this._onClose);
+      this._connecting
+        .then(ws => {
+          this._ws = ws;
+        })
+        .catch(() => {
+          this._connecting = null;
+        });
+    }
+    return this._connecting;
+  }
+
+  private _nextId(): number {
+    return ++this._lastId;
+  }
+
+  /**
+   * Dispatch a message from the server.
+   */
+  private _onMessage = (msg: MessageEvent): void => {
+    const message = JSON.parse(msg.data as string);
+    const id = message.id;
+
+    if ('response' === message.type || 'error' === message.type) {
+      const reply = this._requests.get(id);
+      if (reply) {
+        this._requests.delete(id);
+        if ('response' === message.type) {
+          reply.resolve(message.response);
+        } else {
+          reply.reject(message.error);
+        }
+        return;
+      }
+    }
+
+    const sub = this._subscriptions.get(id);
+    if (!sub) {
+      return;
+    }
+
+    if ('event' === message.type) {
+      // Handle events one after the other and renew the credit once half of it has been used.
+      sub.queue = sub.queue.then(async () => {
+        await sub.onEvent(message.data);
+        sub.handled += 1;
+        if (this._ws && sub.handled >= sub.credit / 2) {
+          this._ws.send(JSON.stringify({ type: 'ack', id, credit: sub.handled }));
+          sub.handled = 0;
+        }
+      });
+    } else if ('end' === message.type || 'error' === message.type) {
+      this._subscriptions.delete(id);
+      sub.queue = sub.queue.then(() =>
+        sub.onEnd(
+          'end' === message.type
+            ? message.response
+            : { code: 2, error: message.error }
+        )
+      );
+    }
+  };
+
+  /**
+   * Fail all pending requests and subscriptions when the connection is closed.
+   * The connection is opened again with the next request.
+   */
+  private _onClose = (): void => {
+    this._ws = null;
+    this._connecting = null;
+
+    this._requests.forEach(reply => reply.reject('connection closed'));
+    this._requests.clear();
+
+    this._subscriptions.forEach(sub => {
+      sub.queue = sub.queue.then(() =>
+        sub.onEnd({ code: 2, error: 'connection closed' })
+      );
+    });
+    this._subscriptions.clear();
+  };
+
+  /// Websocket (null if not connected).
+  private _ws: WebSocket | null = null;
+
+  /// Promise resolving to the websocket once it is open.
+  private _connecting: Promise<WebSocket> | null = null;
+
+  /// Flag indicating that the connection could not be opened.
+  private _unavailable = false;
+
+  /// ID of the latest request or subscription.
+  private _lastId = 0;
+
+  /// Pending requests.
+  private _requests = new Map<number, PromiseDelegate<any>>();
+
+  /// Active subscriptions.
+  private _subscriptions = new Map<number, Private.ISubscriptionState>();
+}
+
+/**
+ * A namespace for MosaikDockerChannel statics.
+ */
+export namespace MosaikDockerChannel {
+  /**
+   * Default number of events the server may send ahead per subscription.
+   */
+  export const DEFAULT_CREDIT = 64;
+
+  /**
+   * Handle of an active subscription.
+   */
+  export interface ISubscription {
+    unsubscribe: () => void;
+  }
+
+  /**
+   * The channel shared by all parts of the frontend.
+   */
+  export const shared = new MosaikDockerChannel();
+}
+
+/**
+ * A namespace for private methods.
+ */
+namespace Private {
+  /**
+   * State of an active subscription.
+   */
+  export interface ISubscriptionState {
+    onEvent: (event: any) => void | PromiseLike<void>;
+    onEnd: (response: any) => void | PromiseLike<void>;
+    credit: number;
+    handled: number;
+    queue: Promise<void>;
+  }
+
+  /**
+   * Open a websocket.
+   *
+   * @param endPoint - websocket endpoint (as defined by the mosaik_docker_jl backend)
+   * @param onMsg - callback for incoming messages
+   * @param onClose - callback executed when the websocket closes
+   * @returns the websocket instance as soon as it opens
+   */
+  export function openWebSocket(
+    endPoint: string,
+    onMsg: (msg: MessageEvent) => void,
+    onClose: (msg: CloseEvent) => void
+  ): Promise<WebSocket> {
+    // Retrieve server connection settings.
+    const settings = ServerConnection.makeSettings();
+
+    let url = URLExt.join(
+      settings.wsUrl,
+      'mosaik_docker_jl', // API Namespace
+      endPoint
+    );
+
+    // If token authentication is in use.
+    const token = settings.token;
+    if (settings.appendToken && token !== '') {
+      url = url + `?token=${encodeURIComponent(token)}`;
+    }
+
+    return new Promise((resolve, reject) => {
+      const ws = new settings.WebSocket(url);
+      let opened = false;
+
+      ws.onmessage = onMsg;
+      ws.onopen = () => {
+        opened = true;
+        resolve(ws);
+      };
+      ws.onclose = (msg: CloseEvent) => {
+        if (opened) {
+          onClose(msg);
+        } else {
+          reject(`websocket connection to ${endPoint} failed`);
+        }
+      };
+    });
+  }
+}
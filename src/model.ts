@@ -212,6 +212,29 @@ export class MosaikDockerExtension implements IMosaikDockerExtension {
     // Create promise delegate for waiting for the callback interface to be closed.
     const check = new PromiseDelegate();
 
+    // Stream the build output via the shared channel, if available.
+    const subscription = await MosaikDockerAPI.subscribe(
+      'build',
+      { dir: simSetupDir },
+      out => {
+        simSetupBuildWidget.updateStatus({ out });
+      },
+      response => {
+        simSetupBuildWidget.updateStatus({
+          out: response.message ?? response.error
+        });
+        simSetupBuildWidget.done({
+          done: `exit code: ${response.code}`
+        });
+        check.resolve(undefined);
+      }
+    );
+
+    if (subscription) {
+      await check.promise;
+      return Promise.resolve();
+    }
+
     try {
       const executeReply = await MosaikDockerAPI.sendRequestWithCallbacks(
         'build_sim_setup',
@@ -271,14 +294,17 @@ export class MosaikDockerExtension implements IMosaikDockerExtension {
     if (0 === code) {
       return Promise.resolve({
         valid: true,
-        status: await response.message
+        status: await response.message,
+        warning: await response.warning,
+        items: await response.items
       });
     }
 
     if (1 === code) {
       return Promise.resolve({
         valid: false,
-        status: await response.message
+        status: await response.message,
+        items: await response.items
       });
     }
 
@@ -506,6 +532,75 @@ export class MosaikDockerExtension implements IMosaikDockerExtension {
     );
   }
 
+  /**
+   * Inquire the status of a filtered, sorted and paginated subset of the
+   * simulations of the currently active simulation setup.
+   * @param query - filter, sort and pagination parameters
+   * @returns requested page of simulations
+   */
+  async getSimStatusPage(
+    query: MosaikDocker.ISimQuery
+  ): Promise<MosaikDocker.ISimStatusPage> {
+    return this._getSimPage('get_sim_status', query);
+  }
+
+  /**
+   * Get the IDs of a filtered, sorted and paginated subset of the
+   * simulations of the currently active simulation setup.
+   * @param query - filter, sort and pagination parameters
+   * @returns requested page of simulations
+   */
+  async getSimIdsPage(
+    query: MosaikDocker.ISimQuery
+  ): Promise<MosaikDocker.ISimStatusPage> {
+    return this._getSimPage('get_sim_ids', query);
+  }
+
+  /**
+   * Compute the build context of the currently active simulation setup
+   * (i.e., the files sent to Docker when building the orchestrator image).
+   * @returns summary of the build context
+   */
+  async getBuildContext(): Promise<MosaikDocker.IBuildContext> {
+    const response = await MosaikDockerAPI.sendRequest(
+      'get_build_context',
+      'POST',
+      {
+        dir: this._simSetupRoot
+      }
+    );
+
+    const code = await response.code;
+
+    if (0 === code) {
+      const message = await response.message;
+      return Promise.resolve({
+        size: message.size,
+        files: message.files,
+        ignoredSize: message.ignored_size,
+        ignoredFiles: message.ignored_files,
+        rules: message.rules,
+        entries: message.entries.map((e: any) => ({
+          type: e.type,
+          path: e.path,
+          size: e.size,
+          files: e.files,
+          ignoredSize: e.ignored_size,
+          ignoredFiles: e.ignored_files,
+          largest: e.largest,
+          ignored: e.ignored
+        })),
+        warnSize: message.warn_size
+      });
+    }
+
+    const error = await response.error;
+
+    return Promise.reject(
+      `[mosaik-docker-jl] getBuildContext() failed!\nerror code: ${code}\nerror: ${error}`
+    );
+  }
+
   /**
    * Get the configuration data of the currently active simulation setup.
    * @returns configuration data
@@ -581,8 +676,9 @@ export class MosaikDockerExtension implements IMosaikDockerExtension {
     // Activate the widget.
     this._app.shell.activateById(this._simStatusWidget.id);
 
-    const status = await this.getSimStatus();
-    await this._simStatusWidget.updateStatus(status);
+    // Only retrieve the page currently displayed by the widget.
+    const page = await this.getSimStatusPage(this._simStatusWidget.query);
+    await this._simStatusWidget.updateStatus(page);
 
     return Promise.resolve();
   }
@@ -718,6 +814,41 @@ export class MosaikDockerExtension implements IMosaikDockerExtension {
     return Promise.resolve();
   }
 
+  /**
+   * Retrieve a page of simulations from the server.
+   * @private
+   * @param endPoint - either 'get_sim_status' or 'get_sim_ids'
+   * @param query - filter, sort and pagination parameters
+   * @returns requested page of simulations
+   */
+  private async _getSimPage(
+    endPoint: string,
+    query: MosaikDocker.ISimQuery
+  ): Promise<MosaikDocker.ISimStatusPage> {
+    const response = await MosaikDockerAPI.sendRequest(endPoint, 'POST', {
+      dir: this._simSetupRoot,
+      query: query
+    });
+
+    const code = await response.code;
+
+    if (0 === code) {
+      const page = await response.message;
+      return Promise.resolve({
+        dir: this.simSetupRoot,
+        items: page.items,
+        total: page.total,
+        next: page.next
+      });
+    }
+
+    const error = await response.error;
+
+    return Promise.reject(
+      `[mosaik-docker-jl] ${endPoint}() failed!\nerror code: ${code}\nerror: ${error}`
+    );
+  }
+
   /**
    * Signal for notifying that the extension state has changed.
    * ALso update the sim status widget if it is active.
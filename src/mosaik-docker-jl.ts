@@ -2,6 +2,7 @@ import { URLExt } from '@jupyterlab/coreutils';
 import { ServerConnection } from '@jupyterlab/services';
 import { JSONObject } from '@lumino/coreutils';
 import { UUID } from '@lumino/coreutils';
+import { MosaikDockerChannel } from './channel';
 
 /**
  * This namespace contains the interface definitions and methods required
@@ -16,6 +17,8 @@ export namespace MosaikDockerAPI {
     code: number;
     message?: any;
     error?: string;
+    warning?: string;
+    items?: any;
   }
 
   /**
@@ -27,19 +30,51 @@ export namespace MosaikDockerAPI {
   }
 
   /**
-   * Send an HTTP request to the server (mosaik_docker_jl backend).
-   * The request will be parsed there and the appropriate API will be called (blocking).
+   * Send a request to the server (mosaik_docker_jl backend).
+   * The request will be parsed there and the appropriate API will be called.
    * The results from this API call are then returned (asynchronously).
+   * Requests are sent via the shared channel (see class `MosaikDockerChannel`),
+   * or as separate HTTP requests if the channel cannot be opened. Polled
+   * requests whose responses can be validated by the server (see
+   * `Private.CACHEABLE_END_POINTS`) are always sent as HTTP requests, such that
+   * unchanged responses are not transferred again.
    * @param endPoint - request endpoints (as defined by the mosaik_docker_jl backend)
    *
    * @param method - HTTP method
    * @param request - payload of HTTP request
+   * @param signal - optional signal for aborting the request (the command is cancelled on the server)
    * @returns Low-level API response
    */
   export async function sendRequest(
     endPoint: string,
     method = 'GET',
-    request: Record<string, any> | null = null
+    request: Record<string, any> | null = null,
+    signal?: AbortSignal
+  ): Promise<IRequestResponse> {
+    if (
+      !Private.CACHEABLE_END_POINTS.has(endPoint) &&
+      (await MosaikDockerChannel.shared.connect())
+    ) {
+      return MosaikDockerChannel.shared.request(endPoint, request ?? {}, signal);
+    }
+
+    return sendHttpRequest(endPoint, method, request, signal);
+  }
+
+  /**
+   * Send an HTTP request to the server (mosaik_docker_jl backend).
+   * @param endPoint - request endpoints (as defined by the mosaik_docker_jl backend)
+   *
+   * @param method - HTTP method
+   * @param request - payload of HTTP request
+   * @param signal - optional signal for aborting the request (the command is cancelled on the server)
+   * @returns Low-level API response
+   */
+  export async function sendHttpRequest(
+    endPoint: string,
+    method = 'GET',
+    request: Record<string, any> | null = null,
+    signal?: AbortSignal
   ): Promise<IRequestResponse> {
     // Construct complete request.
     let fullRequest: RequestInit;
@@ -53,6 +88,9 @@ export namespace MosaikDockerAPI {
         body: JSON.stringify(request)
       };
     }
+    if (signal) {
+      fullRequest.signal = signal;
+    }
 
     // Retrieve server connection settings.
     const settings = ServerConnection.makeSettings();
@@ -64,6 +102,16 @@ export namespace MosaikDockerAPI {
       endPoint
     );
 
+    // If a previous response to the same request is available, ask the
+    // server to only send a new response in case it has changed.
+    const cacheKey = `${method} ${endPoint} ${fullRequest.body ?? ''}`;
+    const cached = Private.responseCache.get(cacheKey);
+    if (cached) {
+      const headers = new Headers(fullRequest.headers);
+      headers.set('If-None-Match', cached.etag);
+      fullRequest.headers = headers;
+    }
+
     // Send request to server.
     let response: Response;
     try {
@@ -76,6 +124,11 @@ export namespace MosaikDockerAPI {
       return Promise.reject(new ServerConnection.NetworkError(TypeError(String(error))));
     }
 
+    // The response has not changed since the last request.
+    if (cached && 304 === response.status) {
+      return Promise.resolve(cached.data);
+    }
+
     // Retrieve low-level API response.
     let data: IRequestResponse;
     try {
@@ -88,9 +141,38 @@ export namespace MosaikDockerAPI {
       return Promise.reject(new ServerConnection.ResponseError(response));
     }
 
+    // Keep successful responses that can be validated by the server.
+    const etag = response.headers.get('ETag');
+    if (etag && 0 === data.code) {
+      Private.cacheResponse(cacheKey, etag, data);
+    } else {
+      Private.responseCache.delete(cacheKey);
+    }
+
     return Promise.resolve(data);
   }
 
+  /**
+   * Subscribe to an event stream of the server (via the shared channel).
+   *
+   * @param stream - stream name ('build', 'status' or 'logs')
+   * @param args - stream input
+   * @param onEvent - callback for each event of the stream
+   * @param onEnd - callback for the final response of the stream
+   * @returns subscription, or null if the channel cannot be opened
+   */
+  export async function subscribe(
+    stream: string,
+    args: Record<string, any>,
+    onEvent: (event: any) => void | PromiseLike<void>,
+    onEnd: (response: IRequestResponse) => void | PromiseLike<void>
+  ): Promise<MosaikDockerChannel.ISubscription | null> {
+    if (!(await MosaikDockerChannel.shared.connect())) {
+      return null;
+    }
+    return MosaikDockerChannel.shared.subscribe(stream, args, onEvent, onEnd);
+  }
+
   /**
    * Make an asynchronous request to the server (using callbacks).
    *
@@ -124,6 +206,53 @@ export namespace MosaikDockerAPI {
  * A namespace for private methods.
  */
 namespace Private {
+  /**
+   * Cached response of a previous request, together with its entity tag.
+   */
+  export interface ICachedResponse {
+    etag: string;
+    data: MosaikDockerAPI.IRequestResponse;
+  }
+
+  /**
+   * Endpoints whose responses carry an entity tag (and are compressed if
+   * large), which are therefore always requested via HTTP.
+   */
+  export const CACHEABLE_END_POINTS = new Set(['get_sim_status', 'get_sim_ids']);
+
+  /**
+   * Maximum number of cached responses.
+   */
+  export const RESPONSE_CACHE_SIZE = 32;
+
+  /**
+   * Responses of previous requests (in order of insertion).
+   */
+  export const responseCache = new Map<string, ICachedResponse>();
+
+  /**
+   * Add a response to the cache. If the cache is full, the oldest
+   * response is removed.
+   *
+   * @param key - cache key identifying the request
+   * @param etag - entity tag of the response
+   * @param data - response
+   */
+  export function cacheResponse(
+    key: string,
+    etag: string,
+    data: MosaikDockerAPI.IRequestResponse
+  ): void {
+    responseCache.delete(key);
+    if (responseCache.size >= RESPONSE_CACHE_SIZE) {
+      const oldest = responseCache.keys().next().value;
+      if (oldest !== undefined) {
+        responseCache.delete(oldest);
+      }
+    }
+    responseCache.set(key, { etag, data });
+  }
+
   /**
    * Create a new websocket.
    *
@@ -103,12 +103,39 @@ export interface IMosaikDockerExtension extends IDisposable {
    */
   getSimStatus(): Promise<MosaikDocker.ISimStatus>;
 
+  /**
+   * Inquire the status of a filtered, sorted and paginated subset of the
+   * simulations of the currently active simulation setup.
+   * @param query - filter, sort and pagination parameters
+   * @returns requested page of simulations
+   */
+  getSimStatusPage(
+    query: MosaikDocker.ISimQuery
+  ): Promise<MosaikDocker.ISimStatusPage>;
+
+  /**
+   * Get the IDs of a filtered, sorted and paginated subset of the
+   * simulations of the currently active simulation setup.
+   * @param query - filter, sort and pagination parameters
+   * @returns requested page of simulations
+   */
+  getSimIdsPage(
+    query: MosaikDocker.ISimQuery
+  ): Promise<MosaikDocker.ISimStatusPage>;
+
   /**
    * Get the configuration data of the currently active simulation setup.
    * @returns configuration data
    */
   getSimSetupConfigData(): Promise<MosaikDocker.IConfigData>;
 
+  /**
+   * Compute the build context of the currently active simulation setup
+   * (i.e., the files sent to Docker when building the orchestrator image).
+   * @returns summary of the build context
+   */
+  getBuildContext(): Promise<MosaikDocker.IBuildContext>;
+
   /**
    * Display the status of all running and finished simulations for the
    * currently active simulation setup in a separate main area widget.
@@ -177,6 +204,20 @@ export namespace MosaikDocker {
   export interface ICheckSimSetupStatus {
     valid: boolean;
     status: string;
+    warning?: string;
+    items?: ICheckSimSetupItem[];
+  }
+
+  /**
+   * Result of checking a single item of a simulation setup (configuration
+   * file, scenario file, Dockerfile, extra file or directory, build context).
+   */
+  export interface ICheckSimSetupItem {
+    item: string;
+    path: string;
+    valid: boolean;
+    status: string;
+    cached: boolean;
   }
 
   /**
@@ -234,6 +275,116 @@ export namespace MosaikDocker {
     down: string[];
   }
 
+  /**
+   * Filter, sort and pagination parameters for retrieving a subset of
+   * a setup's simulations. All parameters are optional.
+   */
+  export interface ISimQuery {
+    /** Only include simulations in one of these states. */
+    states?: Array<'up' | 'down'>;
+
+    /** Only include simulations whose ID starts with this prefix. */
+    idPrefix?: string;
+
+    /** Only include simulations created at or after this time (ISO 8601). */
+    createdAfter?: string;
+
+    /** Only include simulations created before this time (ISO 8601). */
+    createdBefore?: string;
+
+    /** Sort key. */
+    sort?: 'id' | 'state' | 'created';
+
+    /** Sort in descending order. */
+    descending?: boolean;
+
+    /** Maximum number of simulations per page. */
+    limit?: number;
+
+    /** Cursor returned with the previous page. */
+    cursor?: string;
+
+    /**
+     * Fields to include for each simulation (the ID is always included).
+     * Fields 'progress' and 'created' are only included if selected explicitly
+     * ('created' is also included if it is used for sorting or filtering).
+     */
+    fields?: Array<'state' | 'status' | 'created' | 'progress'>;
+  }
+
+  /**
+   * Progress of a running simulation, derived from the output of the
+   * mosaik orchestrator.
+   */
+  export interface ISimProgress {
+    /** Fraction of the simulation completed (between 0 and 1). */
+    progress: number;
+
+    /** Current simulation time (if reported by mosaik). */
+    sim_time: number | null;
+
+    /** Simulation end time (if reported by mosaik). */
+    until: number | null;
+
+    /** Simulation time steps per second of wall-clock time. */
+    steps_per_second: number | null;
+
+    /** Estimated time to completion (in seconds from the time of the response). */
+    eta: number | null;
+
+    /** Time of the latest progress output (ISO 8601). */
+    updated: string;
+  }
+
+  /**
+   * Information about a single simulation. Only the selected fields are set.
+   */
+  export interface ISimItem {
+    id: string;
+    state?: 'up' | 'down';
+    status?: string;
+    created?: string | null;
+    progress?: ISimProgress | null;
+  }
+
+  /**
+   * Return type for retrieving a page of a setup's simulations.
+   */
+  export interface ISimStatusPage {
+    dir: string;
+    items: ISimItem[];
+    total: number;
+    next: string | null;
+  }
+
+  /**
+   * Entry of a build context (scenario file, extra file or extra directory).
+   */
+  export interface IBuildContextEntry {
+    type: 'scenario_file' | 'extra_file' | 'extra_dir';
+    path: string;
+    size: number;
+    files: number;
+    ignoredSize: number;
+    ignoredFiles: number;
+    largest: { path: string; size: number }[];
+    /** Ignored paths (directories end with a slash, at most 20 paths). */
+    ignored: string[];
+  }
+
+  /**
+   * Summary of the build context of a simulation setup.
+   */
+  export interface IBuildContext {
+    size: number;
+    files: number;
+    ignoredSize: number;
+    ignoredFiles: number;
+    rules: string[];
+    entries: IBuildContextEntry[];
+    warnSize: number;
+  }
+
   /**
    * Interface defining the configuration data for the orchestrator
    * container of a simulation setup.
@@ -23,7 +23,16 @@ export namespace SimStatusWidget {
   export interface IComponentProperties {
     /** mosaik-docker extension model. */
     model: IMosaikDockerExtension;
+
+    /** Callback for displaying the previous page. */
+    onPrevious: () => void;
+
+    /** Callback for displaying the next page. */
+    onNext: () => void;
   }
+
+  /** Number of simulations displayed per page. */
+  export const PAGE_SIZE = 50;
 }
 
 /**
@@ -61,19 +70,54 @@ export class SimStatusWidget extends ReactWidget {
    * @returns React element
    */
   render(): React.ReactElement {
-    return <SimStatusComponent model={this._model} />;
+    return (
+      <SimStatusComponent
+        model={this._model}
+        onPrevious={() => this._showPreviousPage()}
+        onNext={() => this._showNextPage()}
+      />
+    );
+  }
+
+  /**
+   * Query for retrieving the page of simulations currently displayed by the
+   * widget. Only the fields actually displayed are requested, running
+   * simulations are listed first.
+   */
+  get query(): MosaikDocker.ISimQuery {
+    const query: MosaikDocker.ISimQuery = {
+      sort: 'state',
+      limit: SimStatusWidget.PAGE_SIZE,
+      fields: ['state', 'status', 'progress']
+    };
+
+    const cursor = this._cursors[this._cursors.length - 1];
+    if (cursor) {
+      query.cursor = cursor;
+    }
+
+    return query;
   }
 
   /**
    * Update the status information to be displayed by the widget.
-   * @param status - status of all simulations of the currently active simulation setup
+   * @param page - status of the currently displayed page of simulations of the active simulation setup
    */
-  async updateStatus(status: MosaikDocker.ISimStatus): Promise<void> {
+  async updateStatus(page: MosaikDocker.ISimStatusPage): Promise<void> {
+    // Start over from the first page if the simulation setup has changed.
+    if (this._simSetupDir !== page.dir) {
+      this._simSetupDir = page.dir;
+      if (this._cursors.length > 1) {
+        this._cursors = [null];
+        return this._model.displaySimStatus();
+      }
+    }
+
     // Retrieve information to be displayed.
-    const simSetupDir = await status.dir;
-    const simStatus = await status.status;
-    const simsUp = await simStatus.up;
-    const simsDown = await simStatus.down;
+    const simSetupDir = page.dir;
+    const simsUp = page.items.filter(item => item.state === 'up');
+    const simsDown = page.items.filter(item => item.state === 'down');
+    this._next = page.next;
 
     // Retrieve HTML element (div) for displaying the status information.
     const elements = this.node.getElementsByClassName('jp-Content');
@@ -96,6 +140,17 @@ export class SimStatusWidget extends ReactWidget {
     statusHeader.className = 'jp-Content-header';
     statusHeader.innerText = `Simulation setup location: ${simSetupDir}`;
 
+    // Create page information.
+    const first = (this._cursors.length - 1) * SimStatusWidget.PAGE_SIZE;
+    const pageInfo = document.createElement('span');
+    pageInfo.className = 'jp-Content-page-info';
+    pageInfo.innerText =
+      0 === page.total
+        ? 'No simulations'
+        : `Simulations ${first + 1}-${first + page.items.length} of ${
+            page.total
+          }`;
+
     // Create heading for list with running simulations.
     const simsUpHeader = document.createElement('span');
     simsUpHeader.className = 'jp-Content-list-header';
@@ -104,9 +159,11 @@ export class SimStatusWidget extends ReactWidget {
     // Create and fill list with running simulations.
     const simsUpList = document.createElement('ul');
     simsUpList.className = 'jp-Content-list';
-    for (const [id, info] of Object.entries(simsUp)) {
+    for (const item of simsUp) {
       const simUpElem = document.createElement('li');
-      simUpElem.innerText = `${id}: ${info}`;
+      simUpElem.innerText = `${item.id}: ${item.status}${Private.formatProgress(
+        item.progress
+      )}`;
       simsUpList.appendChild(simUpElem);
     }
 
@@ -118,22 +175,58 @@ export class SimStatusWidget extends ReactWidget {
     // Create and fill list with finished simulations.
     const simsDownList = document.createElement('ul');
     simsDownList.className = 'jp-Content-list';
-    for (const [id, info] of Object.entries(simsDown)) {
+    for (const item of simsDown) {
       const simsDownElem = document.createElement('li');
-      simsDownElem.innerText = `${id}: ${info}`;
+      simsDownElem.innerText = `${item.id}: ${item.status}`;
       simsDownList.appendChild(simsDownElem);
     }
 
     // Append all elements.
     contentDiv.appendChild(statusHeader);
-    contentDiv.appendChild(simsUpHeader);
-    contentDiv.appendChild(simsUpList);
-    contentDiv.appendChild(simsDownHeader);
-    contentDiv.appendChild(simsDownList);
+    contentDiv.appendChild(pageInfo);
+    if (0 !== simsUp.length || 0 === simsDown.length) {
+      contentDiv.appendChild(simsUpHeader);
+      contentDiv.appendChild(simsUpList);
+    }
+    if (0 !== simsDown.length || 0 === simsUp.length) {
+      contentDiv.appendChild(simsDownHeader);
+      contentDiv.appendChild(simsDownList);
+    }
+  }
+
+  /**
+   * Display the previous page of simulations.
+   * @private
+   */
+  private _showPreviousPage(): void {
+    if (this._cursors.length > 1) {
+      this._cursors.pop();
+      this._model.displaySimStatus();
+    }
+  }
+
+  /**
+   * Display the next page of simulations.
+   * @private
+   */
+  private _showNextPage(): void {
+    if (this._next) {
+      this._cursors.push(this._next);
+      this._model.displaySimStatus();
+    }
   }
 
   /** mosaik-docker extension model. */
   private _model: IMosaikDockerExtension;
+
+  /** Path to the simulation setup currently displayed. */
+  private _simSetupDir: string | undefined = undefined;
+
+  /** Cursors of all pages up to the currently displayed page (the first page has no cursor). */
+  private _cursors: Array<string | null> = [null];
+
+  /** Cursor of the next page (null if the currently displayed page is the last page). */
+  private _next: string | null = null;
 }
 
 /**
@@ -167,14 +260,65 @@ export class SimStatusComponent extends React.Component<
           <div className="jp-SpinnerContent" />
         </div>
         <div className="jp-Dialog-span">
+          <button
+            className="jp-mod-reject jp-mod-styled"
+            onClick={() => this.props.onPrevious()}
+          >
+            PREVIOUS
+          </button>
           <button
             className="jp-mod-reject jp-mod-styled"
             onClick={() => this.props.model.displaySimStatus()}
           >
             REFRESH
           </button>
+          <button
+            className="jp-mod-reject jp-mod-styled"
+            onClick={() => this.props.onNext()}
+          >
+            NEXT
+          </button>
         </div>
       </div>
     );
   }
 }
+
+/**
+ * A namespace for private functions.
+ */
+namespace Private {
+  /**
+   * Format the progress of a running simulation for display.
+   * @param progress - progress information (if available)
+   * @returns formatted progress (empty if not available)
+   */
+  export function formatProgress(
+    progress: MosaikDocker.ISimProgress | null | undefined
+  ): string {
+    if (!progress) {
+      return '';
+    }
+
+    let text = ` - ${(100 * progress.progress).toFixed(1)}% done`;
+
+    if (progress.steps_per_second !== null) {
+      text += `, ${progress.steps_per_second.toFixed(1)} steps/s`;
+    }
+
+    if (progress.eta !== null) {
+      const eta = Math.round(progress.eta);
+      const hours = Math.floor(eta / 3600);
+      const minutes = Math.floor((eta % 3600) / 60);
+      const seconds = eta % 60;
+      text +=
+        hours > 0
+          ? `, ETA ${hours}h ${minutes}m`
+          : minutes > 0
+          ? `, ETA ${minutes}m ${seconds}s`
+          : `, ETA ${seconds}s`;
+    }
+
+    return text;
+  }
+}
@@ -0,0 +1,38 @@
+'''
+Shared fixtures
+'''
+import json
+
+import pytest
+
+
+@pytest.fixture
+def sim_setup( tmp_path ):
+    '''
+    A minimal simulation setup (configuration file, scenario file, Dockerfile and one extra file and directory).
+    '''
+    setup_dir = tmp_path / 'setup'
+    ( setup_dir / 'docker' ).mkdir( parents = True )
+    ( setup_dir / 'data' / 'raw' ).mkdir( parents = True )
+
+    ( setup_dir / 'scenario.py' ).write_text( 'print( "scenario" )\n' )
+    ( setup_dir / 'docker' / 'Dockerfile' ).write_text( 'FROM python:3.9\n' )
+    ( setup_dir / 'params.json' ).write_text( '{}\n' )
+    ( setup_dir / 'data' / 'a.csv' ).write_text( 'a,b\n1,2\n' )
+    ( setup_dir / 'data' / 'raw' / 'b.csv' ).write_text( 'c,d\n3,4\n' )
+
+    config = dict(
+        id = 'abc123',
+        orchestrator = dict(
+            docker_file = 'docker/Dockerfile',
+            scenario_file = 'scenario.py',
+            extra_files = [ 'params.json' ],
+            extra_dirs = [ 'data' ],
+            results = []
+        ),
+        sim_ids_up = [],
+        sim_ids_down = []
+    )
+    ( setup_dir / 'mosaik-docker.json' ).write_text( json.dumps( config ) )
+
+    return setup_dir
@@ -0,0 +1,133 @@
+'''
+Tests for ignore rules and the build context of the orchestrator image
+'''
+import io
+import tarfile
+
+import pytest
+
+from mosaik_docker_jl.build_context import IgnoreRules, BuildContext, DEFAULT_IGNORE_RULES, format_size
+
+
+@pytest.mark.parametrize( 'pattern, path, ignored', [
+    # Patterns match complete paths, not the names of files at any depth.
+    ( '*.log', 'x.log', True ),
+    ( '*.log', 'logs/x.log', False ),
+    ( '__pycache__', 'pkg/__pycache__', False ),
+    # '**' matches any number of directories, including none.
+    ( '**/*.h5', 'c.h5', True ),
+    ( '**/*.h5', 'a/b/c.h5', True ),
+    ( 'a/**/b', 'a/b', True ),
+    ( 'a/**/b', 'a/x/y/b', True ),
+    ( 'a/**', 'a/x/y', True ),
+    ( 'a/**', 'a', False ),
+    # Leading slashes are removed, patterns are cleaned.
+    ( '/results', 'results', True ),
+    ( './data/', 'data', True ),
+    ( 'data//raw', 'data/raw', True ),
+    # Wildcards do not match separators.
+    ( 'a?c', 'abc', True ),
+    ( 'a?c', 'a/c', False ),
+    ( 'a*', 'ab/c', True ), # The parent directory matches.
+    ( '[!a]b', 'cb', True ),
+    ( '[!a]b', 'ab', False ),
+    ( 'a\\*', 'a*', True ),
+    ( 'a\\*', 'ab', False ),
+] )
+def test_pattern( pattern, path, ignored ):
+    assert IgnoreRules( [ pattern ] ).ignored( path ) == ignored
+
+
+def test_parent_directories():
+    rules = IgnoreRules( [ 'data', '**/__pycache__' ] )
+
+    assert rules.ignored( 'data/raw/b.csv' )
+    assert rules.ignored( 'pkg/sub/__pycache__/m.pyc' )
+    assert not rules.ignored( 'database.csv' )
+
+
+def test_last_matching_pattern_wins():
+    rules = IgnoreRules( [ '# comment', '', 'data', '!data/keep', 'data/keep/*.tmp' ] )
+
+    assert rules.has_exceptions
+    assert rules.ignored( 'data/other.csv' )
+    assert not rules.ignored( 'data/keep/a.csv' )
+    assert rules.ignored( 'data/keep/a.tmp' )
+    assert not IgnoreRules( DEFAULT_IGNORE_RULES ).has_exceptions
+
+
+def test_default_rules():
+    rules = IgnoreRules( DEFAULT_IGNORE_RULES )
+
+    assert rules.ignored( 'data/.ipynb_checkpoints/a-checkpoint.csv' )
+    assert rules.ignored( 'data/sub/m.pyc' )
+    assert not rules.ignored( 'data/m.py' )
+
+
+def _members( context, contents = None ):
+    buffer = io.BytesIO()
+    context.write( buffer )
+    buffer.seek( 0 )
+    with tarfile.open( fileobj = buffer ) as tar:
+        members = {}
+        for m in tar:
+            members[ m.name ] = m.type
+            if contents is not None and m.isfile():
+                contents[ m.name ] = tar.extractfile( m ).read()
+        return members
+
+
+def test_build_context( sim_setup ):
+    ( sim_setup / 'data' / 'raw' / '__pycache__' ).mkdir()
+    ( sim_setup / 'data' / 'raw' / '__pycache__' / 'm.pyc' ).write_bytes( b'x' * 10 )
+    ( sim_setup / 'data' / '.git' ).mkdir()
+    ( sim_setup / 'data' / '.git' / 'HEAD' ).write_text( 'ref' )
+    ( sim_setup / 'data' / 'empty' ).mkdir()
+    ( sim_setup / 'data' / 'logs' ).mkdir()
+    ( sim_setup / 'data' / 'logs' / 'a.log' ).write_text( 'a' )
+    ( sim_setup / 'data' / 'logs' / 'keep.log' ).write_text( 'keep' )
+    ( sim_setup / '.dockerignore' ).write_text( 'data/logs\n!data/logs/keep.log\n' )
+
+    context = BuildContext( str( sim_setup ), default_rules = True )
+    contents = {}
+    members = _members( context, contents )
+
+    assert context.ignored_files == 3
+    assert context.ignored_size == 14
+    assert context.ignored_paths() == [ 'data/.git/HEAD', 'data/logs/a.log', 'data/raw/__pycache__/m.pyc' ]
+    assert sorted( name for name, type in members.items() if tarfile.REGTYPE == type ) == [
+        '.dockerignore', '.mosaik-docker-jl.Dockerfile', 'extra/data/a.csv', 'extra/data/logs/keep.log',
+        'extra/data/raw/b.csv', 'extra/params.json', 'scenario.py'
+    ]
+
+    # The generated files are not copied into the image.
+    assert contents[ '.dockerignore' ] == b'.mosaik-docker-jl.Dockerfile\n.dockerignore\n'
+
+    # Empty directories are part of the build context.
+    assert sorted( name for name, type in members.items() if tarfile.DIRTYPE == type ) == [
+        'extra/data', 'extra/data/empty', 'extra/data/raw'
+    ]
+
+    summary = context.summary( max_files = 2 )
+    assert summary[ 'files' ] == 5
+    assert [ e[ 'type' ] for e in summary[ 'entries' ] ] == [ 'scenario_file', 'extra_file', 'extra_dir' ]
+    assert summary[ 'entries' ][ -1 ][ 'ignored' ] == [ 'data/.git/HEAD', 'data/logs/a.log' ]
+
+
+def test_default_rules_are_opt_in( sim_setup ):
+    ( sim_setup / 'data' / '.git' ).mkdir()
+    ( sim_setup / 'data' / '.git' / 'HEAD' ).write_text( 'ref' )
+    ( sim_setup / 'data' / 'm.pyc' ).write_bytes( b'x' )
+
+    context = BuildContext( str( sim_setup ) )
+    assert context.ignored_paths() == []
+    assert 'extra/data/.git/HEAD' in _members( context )
+
+    context = BuildContext( str( sim_setup ), default_rules = True )
+    assert context.ignored_paths() == [ 'data/.git/', 'data/m.pyc' ]
+
+
+def test_format_size():
+    assert format_size( 512 ) == '512 B'
+    assert format_size( 1536 ) == '1.5 KiB'
+    assert format_size( 3 * 1024 ** 4 ) == '3072.0 GiB'
@@ -0,0 +1,266 @@
+'''
+Tests for multiplexing commands and event streams over a single connection
+'''
+import asyncio
+import threading
+
+import pytest
+
+from mosaik_docker_jl import channel as channel_module
+from mosaik_docker_jl.channel import Channel, Subscription
+
+
+class _Exe:
+    deadlines = {}
+    executor = None
+
+
+class _CountStream( Subscription ):
+    '''
+    Stream of the numbers 0 to `count` - 1.
+    '''
+
+    async def produce( self ):
+        self.produced = 0
+        try:
+            for i in range( self.data[ 'count' ] ):
+                if not await self.put( i ):
+                    return dict( code = 0, message = 'cancelled' )
+                self.produced += 1
+            return dict( code = 0, message = 'done' )
+        finally:
+            self.finish()
+
+
+class _LatestStream( Subscription ):
+    '''
+    Stream of which only the latest state matters.
+    '''
+
+    async def produce( self ):
+        try:
+            for i in range( self.data[ 'count' ] ):
+                self.replace( i )
+                await asyncio.sleep( 0 )
+            await asyncio.sleep( 0.1 )
+            return None
+        finally:
+            self.finish()
+
+
+def _echo( exe, data ):
+    return dict( code = 0, message = data )
+
+
+def _wait( exe, data ):
+    data[ 'event' ].wait( 5 )
+    return dict( code = 0, message = 'released' )
+
+
+class _Client:
+    '''
+    Client collecting the messages sent by a channel.
+    '''
+
+    def __init__( self ):
+        self.messages = []
+        self.channel = Channel(
+            _Exe(), dict( echo = ( _echo, None ), wait = ( _wait, None ) ),
+            dict( count = _CountStream, latest = _LatestStream ), self._send
+        )
+
+    async def _send( self, message ):
+        self.messages.append( message )
+
+    def send( self, **message ):
+        self.channel.on_message( message )
+
+    async def until( self, predicate, timeout = 2. ):
+        '''
+        Wait until a message matching a predicate has been received.
+
+        :return: the message (dict)
+        '''
+        expires = asyncio.get_running_loop().time() + timeout
+        while True:
+            for m in self.messages:
+                if predicate( m ):
+                    return m
+            assert asyncio.get_running_loop().time() < expires, 'message not received: {}'.format( self.messages )
+            await asyncio.sleep( 0.01 )
+
+    def events( self, id ):
+        return [ m[ 'data' ] for m in self.messages if 'event' == m[ 'type' ] and id == m[ 'id' ] ]
+
+    async def end( self, id ):
+        return ( await self.until( lambda m: 'end' == m[ 'type' ] and id == m[ 'id' ] ) )[ 'response' ]
+
+
+def _run( test ):
+    async def main():
+        await test( _Client() )
+    asyncio.run( main() )
+
+
+def test_request():
+    async def test( client ):
+        client.send( type = 'request', id = 1, command = 'echo', data = dict( a = 1 ) )
+        client.send( type = 'request', id = 2, command = 'unknown' )
+
+        assert ( await client.until( lambda m: 1 == m[ 'id' ] ) ) == dict( type = 'response', id = 1, response = dict( code = 0, message = dict( a = 1 ) ) )
+        assert ( await client.until( lambda m: 2 == m[ 'id' ] ) ) == dict( type = 'error', id = 2, error = 'unknown command: unknown' )
+
+    _run( test )
+
+
+def test_invalid_messages():
+    async def test( client ):
+        client.channel.on_message( [] )
+        client.send( type = 'request', id = [ 1 ], command = 'echo' )
+        client.send( type = 'other', id = 'x' )
+        await client.until( lambda m: 'x' == m[ 'id' ] )
+
+        assert [ m[ 'error' ] for m in client.messages ] == [
+            'invalid message: expected an object', 'invalid message ID: [1]', 'invalid message type: other'
+        ]
+
+    _run( test )
+
+
+def test_invalid_data():
+    async def test( client ):
+        client.send( type = 'request', id = 1, command = 'echo', data = [] )
+        client.send( type = 'subscribe', id = 2, stream = 'count', data = 'count' )
+        client.send( type = 'request', id = 3, command = 'echo', data = None )
+
+        assert ( await client.until( lambda m: 1 == m[ 'id' ] ) ) == dict( type = 'error', id = 1, error = 'invalid message data: expected an object' )
+        assert ( await client.until( lambda m: 2 == m[ 'id' ] ) ) == dict( type = 'error', id = 2, error = 'invalid message data: expected an object' )
+        assert ( await client.until( lambda m: 3 == m[ 'id' ] ) )[ 'response' ] == dict( code = 0, message = {} )
+        assert client.channel._pending == {}
+        assert client.channel._subscriptions == {}
+
+    _run( test )
+
+
+def test_duplicate_request_id():
+    async def test( client ):
+        event = threading.Event()
+        client.send( type = 'request', id = 1, command = 'wait', data = dict( event = event ) )
+        client.send( type = 'request', id = 1, command = 'echo' )
+
+        assert ( await client.until( lambda m: 'error' == m[ 'type' ] ) ) == dict( type = 'error', id = 1, error = 'duplicate request ID: 1' )
+        event.set()
+        assert ( await client.until( lambda m: 'response' == m[ 'type' ] ) )[ 'response' ][ 'message' ] == 'released'
+
+        # IDs can be reused once the request has been answered.
+        client.send( type = 'request', id = 1, command = 'echo', data = dict( b = 2 ) )
+        await client.until( lambda m: 'response' == m[ 'type' ] and dict( b = 2 ) == m[ 'response' ][ 'message' ] )
+
+    _run( test )
+
+
+def test_cancel_request():
+    async def test( client ):
+        event = threading.Event()
+        client.send( type = 'request', id = 1, command = 'wait', data = dict( event = event ) )
+        client.send( type = 'cancel', id = 1 )
+
+        response = ( await client.until( lambda m: 'response' == m[ 'type' ] ) )[ 'response' ]
+        event.set()
+        assert response == dict( code = 4, error = 'wait cancelled' )
+
+    _run( test )
+
+
+def test_credit():
+    async def test( client ):
+        client.send( type = 'subscribe', id = 1, stream = 'count', data = dict( count = 5 ), credit = 2 )
+        await client.until( lambda m: 'event' == m[ 'type' ] and 1 == m[ 'data' ] )
+        await asyncio.sleep( 0.05 )
+        assert client.events( 1 ) == [ 0, 1 ]
+
+        client.send( type = 'ack', id = 1, credit = 3 )
+        assert ( await client.end( 1 ) ) == dict( code = 0, message = 'done' )
+        assert client.events( 1 ) == [ 0, 1, 2, 3, 4 ]
+
+    _run( test )
+
+
+def test_backpressure( monkeypatch ):
+    monkeypatch.setattr( channel_module, 'MAX_BUFFERED_EVENTS', 3 )
+
+    async def test( client ):
+        client.send( type = 'subscribe', id = 1, stream = 'count', data = dict( count = 10 ), credit = 0 )
+        await asyncio.sleep( 0.05 )
+
+        # The producer is paused while the buffer is full.
+        sub = client.channel._subscriptions[ 1 ]
+        assert 3 == sub.produced
+        assert client.events( 1 ) == []
+
+        client.send( type = 'ack', id = 1, credit = 2 )
+        await asyncio.sleep( 0.05 )
+        assert 5 == sub.produced
+        assert client.events( 1 ) == [ 0, 1 ]
+
+        client.send( type = 'ack', id = 1, credit = 100 )
+        await client.end( 1 )
+        assert client.events( 1 ) == list( range( 10 ) )
+
+    _run( test )
+
+
+def test_replace():
+    async def test( client ):
+        client.send( type = 'subscribe', id = 1, stream = 'latest', data = dict( count = 5 ), credit = 0 )
+        await asyncio.sleep( 0.05 )
+        client.send( type = 'ack', id = 1, credit = 10 )
+
+        assert ( await client.end( 1 ) ) is None
+        assert client.events( 1 ) == [ 4 ]
+
+    _run( test )
+
+
+def test_unsubscribe():
+    async def test( client ):
+        # More events than can be buffered, such that the producer is still running.
+        client.send( type = 'subscribe', id = 1, stream = 'count', data = dict( count = 1000 ), credit = 1 )
+        await client.until( lambda m: 'event' == m[ 'type' ] )
+        client.send( type = 'unsubscribe', id = 1 )
+
+        assert ( await client.end( 1 ) ) == dict( code = 0, message = 'cancelled' )
+        assert client.events( 1 ) == [ 0 ]
+        assert client.channel._subscriptions == {}
+
+    _run( test )
+
+
+@pytest.mark.parametrize( 'credit', [ -1, 'many', None ] )
+def test_invalid_credit( credit ):
+    async def test( client ):
+        client.send( type = 'subscribe', id = 1, stream = 'count', data = dict( count = 1 ), credit = credit )
+        assert ( await client.end( 1 ) ) == dict( code = 1, error = 'invalid credit: {}'.format( credit ) )
+
+        client.send( type = 'subscribe', id = 2, stream = 'count', data = dict( count = 5 ), credit = 1 )
+        await client.until( lambda m: 'event' == m[ 'type' ] )
+        client.send( type = 'ack', id = 2, credit = credit )
+        assert ( await client.end( 2 ) ) == dict( code = 1, error = 'invalid credit: {}'.format( credit ) )
+
+    _run( test )
+
+
+def test_invalid_subscription():
+    async def test( client ):
+        client.send( type = 'subscribe', id = 1, stream = 'count', data = dict( count = 5 ), credit = 0 )
+        client.send( type = 'subscribe', id = 1, stream = 'count', data = dict( count = 5 ) )
+        client.send( type = 'subscribe', id = 2, stream = 'unknown' )
+
+        await client.until( lambda m: 2 == m[ 'id' ] )
+        assert [ ( m[ 'id' ], m[ 'error' ] ) for m in client.messages ] == [
+            ( 1, 'invalid subscription: count' ), ( 2, 'invalid subscription: unknown' )
+        ]
+        client.channel.close()
+        await client.end( 1 )
+
+    _run( test )
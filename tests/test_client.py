@@ -0,0 +1,145 @@
+'''
+Tests for sending messages with the asyncio client (no server is used)
+'''
+import asyncio
+import gc
+import json
+
+import pytest
+from tornado.websocket import WebSocketClosedError
+
+from mosaik_docker_jl.client import MosaikDockerClient
+
+
+class _WebSocket:
+    '''
+    Connection recording the messages written by the client.
+    '''
+
+    def __init__( self, closed = False ):
+        self.messages = []
+        self.closed = closed
+        self.closing = False
+        self.incoming = asyncio.Queue()
+
+    def write_message( self, message ):
+        if self.closed:
+            raise WebSocketClosedError()
+        self.messages.append( json.loads( message ) )
+        future = asyncio.get_running_loop().create_future()
+        if self.closing:
+            # The message is accepted, but writing it fails.
+            future.set_exception( WebSocketClosedError() )
+        else:
+            future.set_result( None )
+        return future
+
+    async def read_message( self ):
+        return await self.incoming.get()
+
+    def close( self ):
+        self.closed = True
+
+
+def _client( ws ):
+    client = MosaikDockerClient( 'http://localhost:8888', token = 'x' )
+    client._ws = ws
+    return client
+
+
+def test_cancel_request():
+    async def main():
+        ws = _WebSocket()
+        client = _client( ws )
+        task = asyncio.ensure_future( client.request( 'start_sim', dir = 'setup' ) )
+        await asyncio.sleep( 0 )
+        task.cancel()
+        with pytest.raises( asyncio.CancelledError ):
+            await task
+
+        assert [ m[ 'type' ] for m in ws.messages ] == [ 'request', 'cancel' ]
+        assert ws.messages[0][ 'id' ] == ws.messages[1][ 'id' ]
+        assert client._requests == {}
+
+    asyncio.run( main() )
+
+
+def test_cancel_request_on_closed_connection():
+    async def main():
+        ws = _WebSocket()
+        client = _client( ws )
+        task = asyncio.ensure_future( client.request( 'start_sim', dir = 'setup' ) )
+        await asyncio.sleep( 0 )
+
+        # The cancel message cannot be sent anymore, this is not an error.
+        errors = []
+        asyncio.get_running_loop().set_exception_handler( lambda loop, context: errors.append( context[ 'message' ] ) )
+        ws.closing = True
+        task.cancel()
+        with pytest.raises( asyncio.CancelledError ):
+            await task
+        await asyncio.sleep( 0 )
+        gc.collect()
+        assert errors == []
+
+        ws.closing = False
+        task = asyncio.ensure_future( client.request( 'start_sim', dir = 'setup' ) )
+        await asyncio.sleep( 0 )
+        ws.closed = True
+        task.cancel()
+        with pytest.raises( asyncio.CancelledError ):
+            await task
+
+        client._ws = None
+        task = asyncio.ensure_future( client.request( 'start_sim', dir = 'setup' ) )
+        await asyncio.sleep( 0 )
+        task.cancel()
+        with pytest.raises( asyncio.CancelledError ):
+            await task
+
+    asyncio.run( main() )
+
+
+def test_closed_connection():
+    async def main():
+        client = _client( _WebSocket( closed = True ) )
+        with pytest.raises( ConnectionError ):
+            await client.request( 'version' )
+        with pytest.raises( ConnectionError ):
+            await client.subscribe( 'status', dir = 'setup' )
+        assert ( client._requests, client._subscriptions ) == ( {}, {} )
+
+        # The connection is closed between connecting and sending the request.
+        client = _client( _WebSocket() )
+        client.connect = lambda: _set_none( client )
+        with pytest.raises( ConnectionError ):
+            await client.request( 'version' )
+
+    asyncio.run( main() )
+
+
+async def _set_none( client ):
+    client._ws = None
+
+
+@pytest.mark.parametrize( 'frame', [ 'not json', '[]', json.dumps( dict( type = 'response', id = 1 ) ) ] )
+def test_unexpected_message( frame ):
+    async def main():
+        ws = _WebSocket()
+        client = _client( ws )
+        client._reader = asyncio.ensure_future( client._read( ws ) )
+        request = asyncio.ensure_future( client.request( 'version' ) )
+        await asyncio.sleep( 0 ) # The request gets ID 1.
+        sub = await client.subscribe( 'status', dir = 'setup' )
+
+        # The reader fails, all pending requests and subscriptions end.
+        ws.incoming.put_nowait( frame )
+        with pytest.raises( Exception ):
+            await client._reader
+        with pytest.raises( ConnectionError ):
+            await request
+        assert [ e async for e in sub ] == []
+        assert sub.response == dict( code = 2, error = 'connection closed' )
+        assert ( client._ws, client._subscriptions, ws.closed ) == ( None, {}, True )
+
+    asyncio.run( main() )
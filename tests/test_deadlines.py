@@ -0,0 +1,227 @@
+'''
+Tests for executing commands with deadlines and cancellation
+'''
+import asyncio
+import concurrent.futures
+import subprocess
+import threading
+import time
+
+import pytest
+
+from mosaik_docker_jl import deadlines
+from mosaik_docker_jl.deadlines import run_command, get_deadline, attach_thread, WorkerThreads, CommandAborted, CODE_DEADLINE_EXCEEDED, CODE_CANCELLED
+
+
+def _sleep( seconds, log = None, label = None ):
+    '''
+    :return: function sleeping for a while and logging when it starts and ends
+    '''
+    def fn():
+        if log is not None:
+            log.append( ( 'start', label ) )
+        time.sleep( seconds )
+        if log is not None:
+            log.append( ( 'end', label ) )
+        return label
+
+    return fn
+
+
+async def _code( coro ):
+    '''
+    :return: code of the command (0 if it was not aborted)
+    '''
+    try:
+        await coro
+        return 0
+    except CommandAborted as err:
+        return err.code
+
+
+def test_result_and_errors():
+    async def main():
+        assert 42 == await run_command( lambda: 42, deadline = 1. )
+        with pytest.raises( ZeroDivisionError ):
+            await run_command( lambda: 1 / 0, deadline = 1. )
+
+    asyncio.run( main() )
+
+
+def test_deadline_exceeded():
+    async def main():
+        started = time.monotonic()
+        with pytest.raises( CommandAborted, match = 'start_sim exceeded its deadline of 0.1 s' ) as err:
+            await run_command( _sleep( 1. ), deadline = 0.1, name = 'start_sim' )
+        assert CODE_DEADLINE_EXCEEDED == err.value.code
+
+        # The caller is released without waiting for the function.
+        assert time.monotonic() - started < 0.5
+
+    asyncio.run( main() )
+
+
+def test_cancelled():
+    async def main():
+        cancelled = asyncio.Event()
+        asyncio.get_running_loop().call_later( 0.1, cancelled.set )
+        assert CODE_CANCELLED == await _code( run_command( _sleep( 1. ), deadline = 10., cancelled = cancelled ) )
+
+        # Commands without deadline can be cancelled as well.
+        cancelled = asyncio.Event()
+        asyncio.get_running_loop().call_later( 0.1, cancelled.set )
+        assert CODE_CANCELLED == await _code( run_command( _sleep( 1. ), cancelled = cancelled ) )
+
+    asyncio.run( main() )
+
+
+def test_serialized_commands( tmp_path ):
+    async def main():
+        log = []
+        await asyncio.gather(
+            run_command( _sleep( 0.1, log, 1 ), deadline = 5., dir = str( tmp_path ), name = 'start_sim' ),
+            run_command( _sleep( 0.1, log, 2 ), deadline = 5., dir = str( tmp_path / '.' ), name = 'cancel_sim' ),
+        )
+        assert log == [ ( 'start', 1 ), ( 'end', 1 ), ( 'start', 2 ), ( 'end', 2 ) ]
+
+        # Commands for other setups are not serialized.
+        log = []
+        await asyncio.gather(
+            run_command( _sleep( 0.1, log, 1 ), deadline = 5., dir = str( tmp_path / 'a' ), name = 'start_sim' ),
+            run_command( _sleep( 0.1, log, 2 ), deadline = 5., dir = str( tmp_path / 'b' ), name = 'start_sim' ),
+        )
+        assert [ e[0] for e in log ] == [ 'start', 'start', 'end', 'end' ]
+
+    asyncio.run( main() )
+
+
+def test_waiting_counts_towards_deadline( tmp_path ):
+    async def main():
+        log = []
+        first = asyncio.ensure_future( run_command( _sleep( 0.5, log, 1 ), deadline = 5., dir = str( tmp_path ), name = 'start_sim' ) )
+        await asyncio.sleep( 0.05 )
+
+        assert CODE_DEADLINE_EXCEEDED == await _code(
+            run_command( _sleep( 0., log, 2 ), deadline = 0.1, dir = str( tmp_path ), name = 'get_sim_status' )
+        )
+        cancelled = asyncio.Event()
+        asyncio.get_running_loop().call_later( 0.1, cancelled.set )
+        assert CODE_CANCELLED == await _code(
+            run_command( _sleep( 0., log, 3 ), deadline = 5., cancelled = cancelled, dir = str( tmp_path ), name = 'clear_sim' )
+        )
+
+        # Aborted commands have not been started and do not hold the lock.
+        await first
+        assert 'ok' == await run_command( lambda: 'ok', deadline = 1., dir = str( tmp_path ), name = 'get_sim_status' )
+        assert log == [ ( 'start', 1 ), ( 'end', 1 ) ]
+
+    asyncio.run( main() )
+
+
+def test_lock_held_until_aborted_command_returns( tmp_path ):
+    async def main():
+        log = []
+        assert CODE_DEADLINE_EXCEEDED == await _code(
+            run_command( _sleep( 0.3, log, 1 ), deadline = 0.05, dir = str( tmp_path ), name = 'start_sim' )
+        )
+        await run_command( _sleep( 0., log, 2 ), deadline = 5., dir = str( tmp_path ), name = 'start_sim' )
+        assert log == [ ( 'start', 1 ), ( 'end', 1 ), ( 'start', 2 ), ( 'end', 2 ) ]
+
+    asyncio.run( main() )
+
+
+def test_long_commands_do_not_block_status( tmp_path ):
+    async def main():
+        build = asyncio.ensure_future( run_command( _sleep( 0.5 ), deadline = 10., dir = str( tmp_path ), name = 'build_sim_setup' ) )
+        await asyncio.sleep( 0.05 )
+
+        assert 'status' == await run_command( lambda: 'status', deadline = 0.2, dir = str( tmp_path ), name = 'get_sim_status' )
+        assert 'check' == await run_command( lambda: 'check', deadline = 0.2, dir = str( tmp_path ), name = 'check_sim_setup' )
+        await build
+
+    asyncio.run( main() )
+
+
+def test_waiting_commands_do_not_exhaust_worker_threads( tmp_path ):
+    # Regression test: many commands waiting for the same setup must not starve commands for other setups.
+    executor = concurrent.futures.ThreadPoolExecutor( max_workers = 4 )
+
+    async def main():
+        cancelled = asyncio.Event()
+        sweep = [
+            asyncio.ensure_future( _code( run_command(
+                _sleep( 0.2 ), deadline = 10., cancelled = cancelled, dir = str( tmp_path / 'a' ), name = 'start_sim', executor = executor
+            ) ) ) for _ in range( 2 * executor._max_workers )
+        ]
+        await asyncio.sleep( 0.05 )
+
+        try:
+            assert 'b' == await run_command( lambda: 'b', deadline = 0.5, dir = str( tmp_path / 'b' ), name = 'get_sim_status', executor = executor )
+        finally:
+            cancelled.set()
+            codes = await asyncio.gather( *sweep )
+        assert codes.count( CODE_CANCELLED ) >= len( sweep ) - 2
+
+    try:
+        asyncio.run( main() )
+    finally:
+        executor.shutdown( wait = True )
+
+
+def test_worker_threads_cancel_pending():
+    executor = WorkerThreads( max_workers = 1 )
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait( 5. )
+        return 'running'
+
+    running = executor.submit( block )
+    assert started.wait( 5. )
+    pending = [ executor.submit( lambda: 'pending' ) for _ in range( 3 ) ]
+
+    executor.cancel_pending()
+    release.set()
+    executor.shutdown( wait = True )
+
+    assert 'running' == running.result()
+    assert all( future.cancelled() for future in pending )
+
+
+@pytest.mark.skipif( not deadlines._CAN_KILL_CHILDREN, reason = 'killing processes of threads is not supported' )
+def test_processes_of_attached_threads_are_killed():
+    processes = []
+
+    def helper():
+        processes.append( subprocess.Popen( [ 'sleep', '10' ] ) )
+        processes[0].wait()
+
+    def fn():
+        thread = threading.Thread( target = attach_thread( helper ) )
+        thread.start()
+        thread.join()
+
+    async def main():
+        assert CODE_DEADLINE_EXCEEDED == await _code( run_command( fn, deadline = 0.3 ) )
+
+    asyncio.run( main() )
+    assert -9 == processes[0].wait( timeout = 5 )
+
+
+def test_attach_thread_outside_of_commands():
+    fn = lambda: None
+    assert attach_thread( fn ) is fn
+
+
+def test_get_deadline():
+    configured = { 'build_sim_setup': 3600., 'follow_sim_logs': None, '*': 30. }
+
+    assert 3600. == get_deadline( configured, 'build_sim_setup' )
+    assert 30. == get_deadline( configured, 'start_sim' )
+    assert 10. == get_deadline( configured, 'build_sim_setup', 10 )
+    assert 30. == get_deadline( configured, 'start_sim', 100 )
+    assert 5. == get_deadline( configured, 'follow_sim_logs', 5 )
+    assert get_deadline( configured, 'follow_sim_logs' ) is None
+    assert 60. == get_deadline( {}, 'start_sim', 0 )
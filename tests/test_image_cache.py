@@ -0,0 +1,119 @@
+'''
+Tests for the on-disk cache of base images (Docker is not used)
+'''
+import pytest
+
+from mosaik_docker_jl.image_cache import ImageCache, get_base_images
+
+
+@pytest.fixture
+def docker_file( tmp_path ):
+    def write( content ):
+        path = tmp_path / 'Dockerfile'
+        path.write_text( content )
+        return str( path )
+    return write
+
+
+def test_single_stage( docker_file ):
+    assert get_base_images( docker_file( 'FROM python:3.9\nRUN pip install mosaik\n' ) ) == [ 'python:3.9' ]
+    assert get_base_images( docker_file( 'from python:3.9-slim\n' ) ) == [ 'python:3.9-slim' ]
+
+
+def test_build_arguments( docker_file ):
+    content = '''ARG PYTHON_VERSION=3.9
+ARG BASE="debian:bullseye"
+ARG UNSET
+FROM python:${PYTHON_VERSION}
+FROM $BASE
+FROM ${UNSET}
+ARG LATE=ignored
+FROM alpine:$LATE
+'''
+    # Unresolved arguments and arguments declared after the first stage are skipped.
+    assert get_base_images( docker_file( content ) ) == [ 'python:3.9', 'debian:bullseye' ]
+
+
+def test_stages( docker_file ):
+    content = '''FROM --platform=linux/amd64 python:3.9 AS build
+RUN pip wheel mosaik
+FROM build as test
+FROM scratch
+FROM python:3.9-slim
+COPY --from=build /wheels /wheels
+FROM python:3.9
+'''
+    # References to previous stages, 'scratch' and duplicates are skipped.
+    assert get_base_images( docker_file( content ) ) == [ 'python:3.9', 'python:3.9-slim' ]
+
+
+def test_continuation_lines( docker_file ):
+    content = '''FROM \\
+    --platform=linux/arm64 \\
+    python:3.10 \\
+    AS base
+RUN apt-get update && \\
+    apt-get install -y git
+FROM base
+'''
+    assert get_base_images( docker_file( content ) ) == [ 'python:3.10' ]
+
+
+class _Cache( ImageCache ):
+    '''
+    Cache recording the docker commands instead of executing them.
+    '''
+
+    def __init__( self, cache_dir ):
+        super().__init__( cache_dir, 'unix:///x', max_size = 1024 )
+        self.images = {}
+        self.loaded = []
+        self.on_load = None
+
+    def _image_id( self, image ):
+        return self.images.get( image )
+
+    def _docker( self, *args, stdin = None ):
+        if 'save' == args[0]:
+            with open( args[2], 'wb' ) as f:
+                f.write( args[3].encode( 'utf-8' ) )
+        elif 'load' == args[0]:
+            if self.on_load is not None:
+                self.on_load()
+            self.loaded.append( stdin.read().decode( 'utf-8' ) )
+
+
+def test_store_and_restore( sim_setup, tmp_path ):
+    cache = _Cache( str( tmp_path / 'cache' ) )
+    cache.images[ 'python:3.9' ] = 'sha256:abc'
+    cache.store( str( sim_setup ) )
+
+    info = cache.get_info()
+    assert [ ( i[ 'image' ], i[ 'image_id' ], i[ 'refs' ] ) for i in info[ 'images' ] ] == [ ( 'python:3.9', 'sha256:abc', 1 ) ]
+
+    # Images present in the Docker daemon are not restored.
+    assert cache.restore( str( sim_setup ) ) == []
+
+    del cache.images[ 'python:3.9' ]
+    messages = []
+    assert cache.restore( str( sim_setup ), messages.append ) == [ 'python:3.9' ]
+    assert cache.loaded == [ 'python:3.9' ]
+    assert messages == [ 'restoring base image python:3.9 from cache\n' ]
+
+
+def test_restore_does_not_hold_lock( sim_setup, tmp_path ):
+    cache = _Cache( str( tmp_path / 'cache' ) )
+    cache.images[ 'python:3.9' ] = 'sha256:abc'
+    cache.store( str( sim_setup ) )
+    del cache.images[ 'python:3.9' ]
+
+    # The cache can be used while an image is loaded, even if the loaded image is evicted.
+    def on_load():
+        assert not cache._lock.locked()
+        cache.max_size = 0
+        cache.release( str( sim_setup ) )
+    cache.on_load = on_load
+
+    assert cache.restore( str( sim_setup ) ) == [ 'python:3.9' ]
+    assert cache.loaded == [ 'python:3.9' ]
+    assert cache.get_info()[ 'images' ] == []
@@ -0,0 +1,138 @@
+'''
+Tests for indexing and querying simulation results
+'''
+import array
+import math
+import os
+
+import pytest
+
+from mosaik_docker_jl import result_index
+from mosaik_docker_jl.result_index import ResultIndex, encode_series, decode_series
+
+
+def _write_results( setup_dir, sim_id, name, text ):
+    path = setup_dir / sim_id / name
+    path.parent.mkdir( parents = True, exist_ok = True )
+    path.write_text( text )
+    return path
+
+
+@pytest.fixture
+def index( sim_setup, tmp_path ):
+    _write_results( sim_setup, 's1', 'results.csv', 'time,Grid-0.n1-P,Grid-0.n1-Q,PV-0-P\n0,1.5,2,3\n60,2.5,x,4\n120,3.5,,5\n' )
+    _write_results( sim_setup, 's2', 'out/results.csv', 'date,Grid-0.n1-P\n2020-01-01T00:00:00Z,7\n2020-01-01T00:15:00Z,8\n' )
+    _write_results( sim_setup, 's2', 'notes.txt', 'not indexed\n' )
+
+    index = ResultIndex( str( tmp_path / 'index' / 'results.sqlite' ) )
+    assert index.update( str( sim_setup ), [ 's1', 's2' ] ) == 2
+    return index
+
+
+def test_info( index, sim_setup ):
+    s1, s2 = index.get_info( str( sim_setup ) )
+
+    assert ( s1[ 'sim_id' ], s1[ 'path' ], s1[ 'rows' ], s1[ 'time_kind' ] ) == ( 's1', 'results.csv', 3, 'number' )
+    assert ( s1[ 'time_start' ], s1[ 'time_end' ] ) == ( 0., 120. )
+    assert s1[ 'entities' ] == { 'Grid-0.n1': [ 'P', 'Q' ], 'PV-0': [ 'P' ] }
+
+    assert ( s2[ 'path' ], s2[ 'time_kind' ], s2[ 'time_start' ] ) == ( 'out/results.csv', 'date', 1577836800. )
+    assert index.get_sim_ids( str( sim_setup ) ) == [ 's1', 's2' ]
+
+
+def test_incremental_update( index, sim_setup ):
+    assert index.update( str( sim_setup ), [ 's1', 's2' ] ) == 0
+
+    path = _write_results( sim_setup, 's1', 'results.csv', 'time,PV-0-P\n0,1\n' )
+    stat = os.stat( path )
+    os.utime( path, ns = ( stat.st_atime_ns, stat.st_mtime_ns + 1000000000 ) )
+    os.remove( sim_setup / 's2' / 'out' / 'results.csv' )
+
+    assert index.update( str( sim_setup ), [ 's1', 's2' ] ) == 1
+    info, = index.get_info( str( sim_setup ) )
+    assert ( info[ 'rows' ], info[ 'entities' ] ) == ( 1, { 'PV-0': [ 'P' ] } )
+
+    index.forget( str( sim_setup ) )
+    assert index.get_info( str( sim_setup ) ) == []
+
+
+def test_files_scanned_without_lock( index, sim_setup, monkeypatch ):
+    scan_file = result_index._scan_file
+
+    def scan( path ):
+        assert not index._lock.locked()
+        return scan_file( path )
+
+    monkeypatch.setattr( result_index, '_scan_file', scan )
+    _write_results( sim_setup, 's3', 'results.csv', 'time,PV-0-P\n0,1\n' )
+    assert index.update( str( sim_setup ), [ 's3' ] ) == 1
+
+
+def test_query( index, sim_setup ):
+    series, next_offset = index.query( str( sim_setup ), entities = [ 'Grid-0.*' ] )
+    assert next_offset is None
+    assert [ ( s[ 'sim_id' ], s[ 'attr' ] ) for s in series ] == [ ( 's1', 'P' ), ( 's1', 'Q' ), ( 's2', 'P' ) ]
+
+    p, q, _ = series
+    assert list( p[ 'times' ] ) == [ 0., 60., 120. ]
+    assert list( p[ 'values' ] ) == [ 1.5, 2.5, 3.5 ]
+
+    # Missing and non-numeric values are NaN.
+    assert q[ 'values' ][0] == 2.
+    assert math.isnan( q[ 'values' ][1] ) and math.isnan( q[ 'values' ][2] )
+
+    series, _ = index.query( str( sim_setup ), sim_ids = [ 's1' ], attrs = [ 'P' ], start = 30, end = 120 )
+    assert [ ( s[ 'entity' ], list( s[ 'values' ] ) ) for s in series ] == [ ( 'Grid-0.n1', [ 2.5, 3.5 ] ), ( 'PV-0', [ 4., 5. ] ) ]
+
+    # Files outside of the time range are not read.
+    series, _ = index.query( str( sim_setup ), start = '2020-01-01T00:10:00Z' )
+    assert [ ( s[ 'sim_id' ], list( s[ 'values' ] ) ) for s in series ] == [ ( 's2', [ 8. ] ) ]
+
+    with pytest.raises( ValueError ):
+        index.query( str( sim_setup ), start = 'yesterday' )
+
+
+def test_query_pages( index, sim_setup, monkeypatch ):
+    monkeypatch.setattr( result_index, 'MAX_QUERY_VALUES', 12 )
+
+    # Each time series of simulation 's1' has 3 rows, i.e., 6 values.
+    pages = []
+    offset = 0
+    while offset is not None:
+        series, offset = index.query( str( sim_setup ), sim_ids = [ 's1' ], offset = offset )
+        pages.append( [ ( s[ 'entity' ], s[ 'attr' ] ) for s in series ] )
+    assert pages == [ [ ( 'Grid-0.n1', 'P' ), ( 'Grid-0.n1', 'Q' ) ], [ ( 'PV-0', 'P' ) ] ]
+
+    # The size of a time series is estimated from the selected time range.
+    monkeypatch.setattr( result_index, 'MAX_QUERY_VALUES', 4 )
+    with pytest.raises( ValueError, match = 'time series too large' ):
+        index.query( str( sim_setup ), sim_ids = [ 's1' ] )
+    series, next_offset = index.query( str( sim_setup ), sim_ids = [ 's1' ], attrs = [ 'Q' ], start = 60 )
+    assert ( list( series[0][ 'times' ] ), next_offset ) == ( [ 60., 120. ], None )
+
+    for offset in ( -1, True, '1' ):
+        with pytest.raises( ValueError, match = 'invalid offset' ):
+            index.query( str( sim_setup ), offset = offset )
+
+
+def test_encode_decode( index, sim_setup ):
+    series, _ = index.query( str( sim_setup ) )
+    decoded, next_offset = decode_series( encode_series( series, 7 ) )
+
+    assert next_offset == 7
+    assert len( decoded ) == len( series ) == 4
+    for s, d in zip( series, decoded ):
+        assert { k: v for k, v in d.items() if k not in ( 'times', 'values' ) } == { k: v for k, v in s.items() if k not in ( 'times', 'values' ) }
+        assert d[ 'times' ] == s[ 'times' ]
+        assert [ v if not math.isnan( v ) else None for v in d[ 'values' ] ] == [ v if not math.isnan( v ) else None for v in s[ 'values' ] ]
+
+    assert decode_series( encode_series( [] ) ) == ( [], None )
+    with pytest.raises( ValueError ):
+        decode_series( b'XXXX' + encode_series( [] )[4:] )
+
+
+def test_encode_long_names():
+    series = [ dict( sim_id = 's1', path = 'results.csv', entity = 'x' * 70000, attr = 'P', time_kind = 'row',
+        times = array.array( 'd', [ 0. ] ), values = array.array( 'd', [ 1. ] ) ) ]
+    decoded, _ = decode_series( encode_series( series ) )
+    assert decoded[0][ 'entity' ] == 'x' * 70000
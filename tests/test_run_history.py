@@ -0,0 +1,122 @@
+'''
+Tests for the persistent index of simulation runs
+'''
+import contextlib
+import sqlite3
+
+import pytest
+
+from mosaik_docker_jl.run_history import RunHistory, parse_docker_time
+
+
+@pytest.fixture
+def history( tmp_path ):
+    history = RunHistory( str( tmp_path / 'history' / 'runs.sqlite' ), batch_wait = 0.01 )
+    yield history
+    history.close()
+
+
+def _runs( history, setup_dir, **query ):
+    history.flush()
+    return history.get_runs( str( setup_dir ), **query )
+
+
+def test_run_life_cycle( history, tmp_path ):
+    history.record( 'start', tmp_path, 's1', timestamp = 100. )
+    history.record( 'fingerprint', tmp_path, 's1', build_fingerprint = 'sha256:abc' )
+    history.record( 'finish', tmp_path, 's1', timestamp = 160., started = 100., exit_status = 0 )
+    history.record( 'result', tmp_path, 's1', result_size = 1234 )
+
+    run, = _runs( history, tmp_path )[ 'items' ]
+    assert run[ 'state' ] == 'down'
+    assert run[ 'started' ] == '1970-01-01T00:01:40Z'
+    assert run[ 'duration' ] == 60.
+    assert run[ 'exit_status' ] == 0
+    assert run[ 'result_size' ] == 1234
+    assert run[ 'build_fingerprint' ] == 'sha256:abc'
+
+    history.record( 'clear', tmp_path, 's1', timestamp = 200. )
+    run, = _runs( history, tmp_path )[ 'items' ]
+    assert run[ 'state' ] == 'cleared'
+    assert run[ 'cleared' ] == '1970-01-01T00:03:20Z'
+
+
+def test_runs_seen_finished_are_added( history, tmp_path ):
+    # Runs started before the index existed.
+    history.record( 'finish', tmp_path, 's1', timestamp = 50., started = 20., exit_status = 1 )
+
+    run, = _runs( history, tmp_path )[ 'items' ]
+    assert ( run[ 'state' ], run[ 'duration' ], run[ 'exit_status' ] ) == ( 'down', 30., 1 )
+
+
+def test_delete_setup_clears_runs( history, tmp_path ):
+    for id in ( 's1', 's2' ):
+        history.record( 'start', tmp_path, id )
+    history.record( 'delete_setup', tmp_path )
+
+    assert [ r[ 'state' ] for r in _runs( history, tmp_path )[ 'items' ] ] == [ 'cleared', 'cleared' ]
+
+
+def test_query_and_paging( history, tmp_path ):
+    for i in range( 7 ):
+        history.record( 'start', tmp_path, 'r{}'.format( i ), timestamp = 1000. - i )
+    history.record( 'start', tmp_path / 'other', 'x', timestamp = 1. )
+    history.record( 'cancel', tmp_path, 'r0', timestamp = 1001. )
+
+    items = []
+    cursor = None
+    while True:
+        page = _runs( history, tmp_path, limit = 3, cursor = cursor )
+        assert 7 == page[ 'total' ]
+        items.extend( r[ 'id' ] for r in page[ 'items' ] )
+        cursor = page[ 'next' ]
+        if cursor is None:
+            break
+    assert items == [ 'r{}'.format( i ) for i in range( 6, -1, -1 ) ]
+
+    page = _runs( history, tmp_path, sort = 'id', descending = True, limit = 2 )
+    assert [ r[ 'id' ] for r in page[ 'items' ] ] == [ 'r6', 'r5' ]
+
+    assert [ r[ 'id' ] for r in _runs( history, tmp_path, states = [ 'down' ] )[ 'items' ] ] == [ 'r0' ]
+    assert _runs( history, tmp_path, started_after = '1970-01-01T00:16:38Z' )[ 'total' ] == 3
+
+    with pytest.raises( ValueError ):
+        _runs( history, tmp_path, states = [ 'running' ] )
+    with pytest.raises( ValueError ):
+        _runs( history, tmp_path, limit = True )
+
+
+def test_cursor_of_other_sort_order( history, tmp_path ):
+    for i in range( 5 ):
+        history.record( 'start', tmp_path, 'r{}'.format( i ), timestamp = 1000. - i )
+
+    cursor = _runs( history, tmp_path, limit = 2 )[ 'next' ]
+    assert [ r[ 'id' ] for r in _runs( history, tmp_path, limit = 2, cursor = cursor )[ 'items' ] ] == [ 'r2', 'r1' ]
+
+    # The cursor holds a start time, it cannot be used for pages sorted by ID or in the other direction.
+    with pytest.raises( ValueError ):
+        _runs( history, tmp_path, sort = 'id', limit = 2, cursor = cursor )
+    with pytest.raises( ValueError ):
+        _runs( history, tmp_path, descending = True, limit = 2, cursor = cursor )
+
+
+def test_event_log_is_bounded( tmp_path ):
+    history = RunHistory( str( tmp_path / 'runs.sqlite' ), batch_wait = 0.01, max_events = 5 )
+    for i in range( 12 ):
+        history.record( 'start', tmp_path, 's{}'.format( i ) )
+    history.close()
+
+    with contextlib.closing( sqlite3.connect( history.path ) ) as conn:
+        events = [ r[0] for r in conn.execute( 'SELECT sim_id FROM events ORDER BY rowid' ) ]
+        runs = conn.execute( 'SELECT COUNT(*) FROM runs' ).fetchone()[0]
+
+    # Only the newest events are kept, the runs are not affected.
+    assert events == [ 's{}'.format( i ) for i in range( 7, 12 ) ]
+    assert 12 == runs
+
+
+def test_parse_docker_time():
+    assert parse_docker_time( '1970-01-01T00:01:40.5Z' ) == 100.5
+    assert parse_docker_time( '1970-01-01T01:01:40+01:00' ) == 100.
+    assert parse_docker_time( '0001-01-01T00:00:00Z' ) is None
+    assert parse_docker_time( '' ) is None
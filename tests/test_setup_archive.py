@@ -0,0 +1,161 @@
+'''
+Tests for exporting and importing simulation setups (without orchestrator images)
+'''
+import gzip
+import io
+import json
+import tarfile
+
+import pytest
+
+from mosaik_docker_jl import setup_archive
+from mosaik_docker_jl.setup_archive import export_sim_setup, import_sim_setup, format_summary, MANIFEST_NAME
+
+DOCKER_HOST = 'unix:///x'
+
+
+@pytest.fixture
+def setup_with_results( sim_setup ):
+    config_file = sim_setup / 'mosaik-docker.json'
+    config = json.loads( config_file.read_text() )
+    config[ 'sim_ids_up' ] = [ 's3' ]
+    config[ 'sim_ids_down' ] = [ 's1', 's2' ]
+    config_file.write_text( json.dumps( config ) )
+
+    for id in ( 's1', 's2' ):
+        ( sim_setup / id ).mkdir()
+        ( sim_setup / id / 'results.csv' ).write_text( 'time,PV-0-P\n0,{}\n'.format( id ) )
+    ( sim_setup / '.orch_context' ).mkdir()
+    ( sim_setup / '.orch_context' / 'scenario.py' ).write_text( 'copy\n' )
+
+    return sim_setup
+
+
+def _export( setup_dir, archive, **kwargs ):
+    return export_sim_setup( str( setup_dir ), str( archive ), DOCKER_HOST, include_image = False, **kwargs )
+
+
+def _rewrite( archive, change ):
+    '''
+    Rewrite an archive, `change` maps the name and content of each entry to new content.
+    '''
+    with tarfile.open( archive ) as tar:
+        entries = [ ( m.name, tar.extractfile( m ).read() ) for m in tar if m.isfile() ]
+    with tarfile.open( archive, 'w' ) as tar:
+        for name, data in entries:
+            data = change( name, data )
+            info = tarfile.TarInfo( name )
+            info.size = len( data )
+            tar.addfile( info, io.BytesIO( data ) )
+
+
+def test_round_trip( setup_with_results, tmp_path ):
+    archive = tmp_path / 'setup.tar'
+    summary = _export( setup_with_results, archive, sim_ids = [ 's1' ] )
+
+    assert ( summary[ 'files' ], summary[ 'results' ], summary[ 'image' ] ) == ( 7, [ 's1' ], None )
+    assert ( summary[ 'chunks' ], summary[ 'blobs' ] ) == ( 7, 7 )
+    assert summary[ 'archive_size' ] == archive.stat().st_size
+    assert format_summary( summary ).startswith( '7 files, results of 1 simulations ({} B in 7 chunks, 7 unique) written to {} ('.format( summary[ 'size' ], archive ) )
+
+    target = tmp_path / 'imported'
+    result = import_sim_setup( str( archive ), str( target ), DOCKER_HOST )
+    assert ( result[ 'setup_id' ], result[ 'files' ], result[ 'results' ], result[ 'image' ] ) == ( 'abc123', 7, [ 's1' ], None )
+
+    # Results of other simulations and copies of the build context are not exported.
+    assert sorted( str( p.relative_to( target ) ) for p in target.rglob( '*' ) if p.is_file() ) == [
+        'data/a.csv', 'data/raw/b.csv', 'docker/Dockerfile', 'mosaik-docker.json', 'params.json', 's1/results.csv', 'scenario.py'
+    ]
+    assert ( target / 's1' / 'results.csv' ).read_text() == 'time,PV-0-P\n0,s1\n'
+
+    # Simulations exist only on the original host.
+    config = json.loads( ( target / 'mosaik-docker.json' ).read_text() )
+    assert ( config[ 'sim_ids_up' ], config[ 'sim_ids_down' ] ) == ( [], [] )
+
+    with pytest.raises( FileExistsError ):
+        import_sim_setup( str( archive ), str( target ), DOCKER_HOST )
+    with pytest.raises( FileExistsError ):
+        _export( setup_with_results, archive )
+
+
+def test_duplicate_chunks_are_stored_once( sim_setup, tmp_path ):
+    ( sim_setup / 'data' / 'copy.csv' ).write_text( ( sim_setup / 'data' / 'a.csv' ).read_text() )
+
+    summary = _export( sim_setup, tmp_path / 'setup.tar' )
+    assert summary[ 'chunks' ] == summary[ 'blobs' ] + 1
+
+
+def test_archives_are_not_exported( sim_setup ):
+    # Archives exported before are not included, even if they have been renamed.
+    _export( sim_setup, sim_setup / 'first.tar' )
+    ( sim_setup / 'first.tar' ).rename( sim_setup / 'backup.bin' )
+
+    summary = _export( sim_setup, sim_setup / 'second.tar' )
+    assert summary[ 'files' ] == 6
+
+
+def test_missing_results( sim_setup, tmp_path ):
+    with pytest.raises( RuntimeError, match = 'no retrieved results' ):
+        _export( sim_setup, tmp_path / 'setup.tar', sim_ids = [ 's1' ] )
+
+
+def test_corrupted_blob( sim_setup, tmp_path ):
+    archive = tmp_path / 'setup.tar'
+    _export( sim_setup, archive )
+    _rewrite( archive, lambda name, data: data if MANIFEST_NAME == name else gzip.compress( b'corrupted' ) )
+
+    target = tmp_path / 'imported'
+    with pytest.raises( ValueError, match = 'corrupted blob' ):
+        import_sim_setup( str( archive ), str( target ), DOCKER_HOST )
+
+    # Nothing is restored from invalid archives and the staging directory is removed.
+    assert sorted( p.name for p in tmp_path.iterdir() ) == [ 'setup', 'setup.tar' ]
+
+
+def test_invalid_manifest( sim_setup, tmp_path ):
+    archive = tmp_path / 'setup.tar'
+    _export( sim_setup, archive )
+
+    def change( name, data ):
+        if MANIFEST_NAME != name:
+            return data
+        manifest = json.loads( data )
+        manifest[ 'files' ][0][ 'path' ] = '../outside.txt'
+        return json.dumps( manifest ).encode( 'utf-8' )
+    _rewrite( archive, change )
+
+    with pytest.raises( ValueError, match = 'path outside of simulation setup' ):
+        import_sim_setup( str( archive ), str( tmp_path / 'imported' ), DOCKER_HOST )
+    assert not ( tmp_path / 'outside.txt' ).exists()
+
+    _rewrite( archive, lambda name, data: data if MANIFEST_NAME != name else b'{"format": "other", "version": 1}' )
+    with pytest.raises( ValueError, match = 'unsupported archive format' ):
+        import_sim_setup( str( archive ), str( tmp_path / 'imported' ), DOCKER_HOST )
+
+
+def test_existing_image_is_not_overwritten( sim_setup, tmp_path, monkeypatch ):
+    archive = tmp_path / 'setup.tar'
+    _export( sim_setup, archive )
+
+    # Pretend that the archive includes an image (its content is one of the file chunks).
+    def change( name, data ):
+        if MANIFEST_NAME != name:
+            return data
+        manifest = json.loads( data )
+        entry = manifest[ 'files' ][0]
+        manifest[ 'image' ] = dict( name = 'abc123_orchestrator', id = 'sha256:new', chunks = entry[ 'chunks' ], size = entry[ 'size' ] )
+        return json.dumps( manifest ).encode( 'utf-8' )
+    _rewrite( archive, change )
+
+    images = { 'abc123_orchestrator': 'sha256:old' }
+    monkeypatch.setattr( setup_archive, '_image_id', lambda image, docker_host: images.get( image ) )
+    monkeypatch.setattr( setup_archive, '_load_image', lambda paths, docker_host: images.update( abc123_orchestrator = 'sha256:new' ) )
+
+    with pytest.raises( FileExistsError, match = 'image abc123_orchestrator already exists' ):
+        import_sim_setup( str( archive ), str( tmp_path / 'imported' ), DOCKER_HOST )
+    assert images[ 'abc123_orchestrator' ] == 'sha256:old'
+    assert not ( tmp_path / 'imported' ).exists()
+
+    result = import_sim_setup( str( archive ), str( tmp_path / 'imported' ), DOCKER_HOST, overwrite_image = True )
+    assert result[ 'image' ] == 'abc123_orchestrator'
+    assert images[ 'abc123_orchestrator' ] == 'sha256:new'
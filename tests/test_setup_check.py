@@ -0,0 +1,104 @@
+'''
+Tests for incrementally checking simulation setups
+'''
+import json
+import os
+
+from mosaik_docker_jl import setup_check
+from mosaik_docker_jl.setup_check import SetupChecker
+
+
+def _touch( path ):
+    '''
+    Change the modification time of a file, such that its signature changes.
+    '''
+    stat = os.stat( path )
+    os.utime( path, ns = ( stat.st_atime_ns, stat.st_mtime_ns + 1000000000 ) )
+
+
+def test_valid_setup( sim_setup ):
+    result = SetupChecker( 100 * 1024 * 1024 ).check( str( sim_setup ) )
+
+    assert result[ 'valid' ]
+    assert 'warning' not in result
+    assert [ ( i[ 'item' ], i[ 'path' ] ) for i in result[ 'items' ] ] == [
+        ( 'config', 'mosaik-docker.json' ), ( 'scenario_file', 'scenario.py' ), ( 'docker_file', 'docker/Dockerfile' ),
+        ( 'extra_file', 'params.json' ), ( 'extra_dir', 'data' ), ( 'build_context', '.' )
+    ]
+    assert not any( i[ 'cached' ] for i in result[ 'items' ] )
+
+
+def test_unchanged_items_are_cached( sim_setup ):
+    checker = SetupChecker( 100 * 1024 * 1024 )
+    checker.check( str( sim_setup ) )
+
+    result = checker.check( str( sim_setup ) )
+    assert all( i[ 'cached' ] for i in result[ 'items' ] )
+
+    _touch( sim_setup / 'params.json' )
+    result = checker.check( str( sim_setup ) )
+    assert { i[ 'item' ]: i[ 'cached' ] for i in result[ 'items' ] } == dict(
+        config = True, scenario_file = True, docker_file = True, extra_file = False, extra_dir = True, build_context = False
+    )
+
+    # New files within extra directories change the build context.
+    ( sim_setup / 'data' / 'raw' / 'c.csv' ).write_text( 'e\n' )
+    result = checker.check( str( sim_setup ) )
+    assert [ i[ 'item' ] for i in result[ 'items' ] if not i[ 'cached' ] ] == [ 'build_context' ]
+
+    checker.forget( str( sim_setup ) )
+    result = checker.check( str( sim_setup ) )
+    assert not any( i[ 'cached' ] for i in result[ 'items' ] )
+
+
+def test_invalid_items( sim_setup ):
+    checker = SetupChecker( 100 * 1024 * 1024 )
+    checker.check( str( sim_setup ) )
+
+    os.remove( sim_setup / 'params.json' )
+    result = checker.check( str( sim_setup ) )
+    assert not result[ 'valid' ]
+    assert result[ 'status' ].startswith( 'extra file not found' )
+    assert 'build_context' not in [ i[ 'item' ] for i in result[ 'items' ] ]
+
+    ( sim_setup / 'params.json' ).write_text( '{}\n' )
+    assert checker.check( str( sim_setup ) )[ 'valid' ]
+
+
+def test_directories_are_not_files( sim_setup ):
+    os.remove( sim_setup / 'scenario.py' )
+    os.mkdir( sim_setup / 'scenario.py' )
+
+    result = SetupChecker( 100 * 1024 * 1024 ).check( str( sim_setup ) )
+    assert not result[ 'valid' ]
+    assert result[ 'status' ] == 'scenario file missing\nnot a file: scenario.py'
+
+
+def test_build_context_failure( sim_setup, monkeypatch ):
+    def fail( *args ):
+        raise PermissionError( 'permission denied: data' )
+    monkeypatch.setattr( setup_check, 'BuildContext', fail )
+
+    result = SetupChecker( 100 * 1024 * 1024 ).check( str( sim_setup ) )
+    assert not result[ 'valid' ]
+    assert result[ 'status' ] == 'permission denied: data'
+    assert result[ 'items' ][ -1 ][ 'item' ] == 'build_context'
+
+
+def test_missing_config_item( sim_setup ):
+    config_file = sim_setup / 'mosaik-docker.json'
+    config = json.loads( config_file.read_text() )
+    del config[ 'orchestrator' ][ 'extra_dirs' ]
+    config_file.write_text( json.dumps( config ) )
+
+    result = SetupChecker( 100 * 1024 * 1024 ).check( str( sim_setup ) )
+    assert not result[ 'valid' ]
+    assert result[ 'status' ] == '"orchestrator.extra_dirs" is missing in configuration file'
+
+
+def test_large_build_context( sim_setup ):
+    ( sim_setup / 'data' / 'big.bin' ).write_bytes( b'x' * 4096 )
+
+    result = SetupChecker( 1024 ).check( str( sim_setup ) )
+    assert result[ 'valid' ]
+    assert result[ 'warning' ].endswith( '(largest entry: data with 4.0 KiB)' )
@@ -0,0 +1,110 @@
+'''
+Tests for parsing the progress output of simulations
+'''
+import collections
+import threading
+import time
+
+import pytest
+
+from mosaik_docker_jl.sim_progress import ProgressTracker, _parse_progress, _estimate
+
+
+def _tqdm( done, total ):
+    return 'Total: {:3.0f}%|#####     | {}/{} [00:02<00:03, 180.00steps/s]'.format( 100. * done / total, done, total )
+
+
+def test_tqdm():
+    assert _parse_progress( _tqdm( 450, 1000 ) + '\n' ) == ( 0.45, 450., 1000. )
+
+    # Progress bars are redrawn with carriage returns, the latest update counts.
+    text = '\r'.join( [ _tqdm( 100, 1000 ), _tqdm( 200, 1000 ), _tqdm( 350, 1000 ) ] ) + '\r\n'
+    assert _parse_progress( text ) == ( 0.35, 350., 1000. )
+
+    # Progress beyond the end time is capped.
+    assert _parse_progress( _tqdm( 1001, 1000 ) ) == ( 1., 1001., 1000. )
+
+
+def test_mosaik2():
+    assert _parse_progress( 'Progress: 45.50%\n' ) == ( 0.455, None, None )
+    assert _parse_progress( 'Progress: 10.00%\rProgress: 12.00%\r' ) == ( 0.12, None, None )
+
+
+def test_no_progress():
+    assert _parse_progress( 'Starting "Grid" as "Grid-0" ...\n' ) is None
+    assert _parse_progress( '' ) is None
+
+    # Without end time, the progress is unknown.
+    assert _parse_progress( 'Total: | 0/0 [00:00<?, ?steps/s]' ) is None
+    assert _parse_progress( _tqdm( 100, 1000 ) + '\r' + 'Total: | 5/0 [00:00<?, ?steps/s]' ) == ( 0.1, 100., 1000. )
+
+
+def test_estimate():
+    assert _estimate( collections.deque(), 100. ) is None
+
+    # With a single sample, speed and time to completion are unknown.
+    assert _estimate( [ ( 100., 0.25, 250., 1000. ) ], 100. ) == dict(
+        progress = 0.25, sim_time = 250., until = 1000., steps_per_second = None, eta = None, updated = '1970-01-01T00:01:40Z'
+    )
+
+    estimate = _estimate( [ ( 100., 0.25, 250., 1000. ), ( 110., 0.5, 500., 1000. ) ], 110. )
+    assert estimate[ 'steps_per_second' ] == pytest.approx( 25. )
+    assert estimate[ 'eta' ] == pytest.approx( 20. )
+    assert estimate[ 'updated' ] == '1970-01-01T00:01:50Z'
+
+    # The time to completion is counted from now, not from the latest sample.
+    samples = [ ( 100., 0.25, 250., 1000. ), ( 110., 0.5, 500., 1000. ) ]
+    assert _estimate( samples, 115. )[ 'eta' ] == pytest.approx( 15. )
+    assert _estimate( samples, 200. )[ 'eta' ] == 0.
+
+    # Progress of mosaik 2 does not include the simulation time.
+    estimate = _estimate( [ ( 100., 0.2, None, None ), ( 104., 0.6, None, None ) ], 104. )
+    assert ( estimate[ 'steps_per_second' ], estimate[ 'eta' ] ) == ( None, pytest.approx( 4. ) )
+
+    # No estimate without progress.
+    estimate = _estimate( [ ( 100., 0.5, 500., 1000. ), ( 110., 0.5, 500., 1000. ) ], 110. )
+    assert ( estimate[ 'steps_per_second' ], estimate[ 'eta' ] ) == ( None, None )
+
+
+def test_retain( tmp_path ):
+    tracker = ProgressTracker( 'unix:///var/run/docker.sock' )
+    tracker._poll = lambda id: None
+
+    tracker.get_progress( str( tmp_path / 'a' ), [ 's1', 's2' ] )
+    tracker.get_progress( str( tmp_path / 'b' ), [ 's3' ] )
+
+    # Simulations of other setups are kept.
+    tracker.retain( str( tmp_path / 'a' ), { 's2' } )
+    assert sorted( tracker._sims ) == [ 's2', 's3' ]
+
+    tracker.retain( str( tmp_path / 'b' ), [] )
+    assert sorted( tracker._sims ) == [ 's2' ]
+    tracker.close()
+
+
+def test_logs_are_polled_in_the_background( tmp_path ):
+    tracker = ProgressTracker( 'unix:///var/run/docker.sock', min_poll_interval = 0. )
+    polled = threading.Event()
+    release = threading.Event()
+
+    def read_logs( id ):
+        polled.set()
+        release.wait( 5. )
+        with tracker._lock:
+            tracker._sims[ id ][ 'samples' ].append( ( time.time(), 0.5, 500., 1000. ) )
+    tracker._read_logs = read_logs
+
+    # The request does not wait for the logs, the first poll has no progress yet.
+    assert tracker.get_progress( str( tmp_path ), [ 's1' ] ) == dict( s1 = None )
+    assert polled.wait( 5. )
+
+    # A simulation is not polled again while a poll is still running.
+    polled.clear()
+    tracker.get_progress( str( tmp_path ), [ 's1' ] )
+    assert not polled.wait( 0.1 )
+
+    release.set()
+    while tracker._sims[ 's1' ][ 'polling' ]:
+        time.sleep( 0.01 )
+    assert tracker.get_progress( str( tmp_path ), [ 's1' ] )[ 's1' ][ 'progress' ] == 0.5
+    tracker.close()
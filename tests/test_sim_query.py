@@ -0,0 +1,122 @@
+'''
+Tests for filtering, sorting and paginating lists of simulations
+'''
+import pytest
+
+from mosaik_docker_jl.sim_query import SimQuery, encode_cursor, decode_cursor, parse_time
+
+
+def _records():
+    return [
+        dict( id = 'a{}'.format( i ), state = 'up' if i % 2 else 'down', created = '2024-01-01T00:00:{:02d}Z'.format( 59 - i ) )
+        for i in range( 10 )
+    ]
+
+
+def _pages( records, **query ):
+    '''
+    Retrieve all pages of a query, following the cursors.
+    '''
+    pages = []
+    cursor = None
+    while True:
+        page = SimQuery( cursor = cursor, **query ).apply( records )
+        pages.append( page )
+        cursor = page[ 'next' ]
+        if cursor is None:
+            return pages
+
+
+def test_paging_ascending():
+    pages = _pages( _records(), limit = 3 )
+
+    assert [ len( p[ 'items' ] ) for p in pages ] == [ 3, 3, 3, 1 ]
+    assert all( 10 == p[ 'total' ] for p in pages )
+    assert [ i[ 'id' ] for p in pages for i in p[ 'items' ] ] == sorted( r[ 'id' ] for r in _records() )
+
+
+def test_paging_descending():
+    pages = _pages( _records(), limit = 4, descending = True )
+
+    assert [ len( p[ 'items' ] ) for p in pages ] == [ 4, 4, 2 ]
+    assert [ i[ 'id' ] for p in pages for i in p[ 'items' ] ] == sorted( ( r[ 'id' ] for r in _records() ), reverse = True )
+
+
+def test_paging_by_created_time():
+    pages = _pages( _records(), limit = 3, sort = 'created' )
+
+    # The records have been created in reverse order of their IDs.
+    assert [ i[ 'id' ] for p in pages for i in p[ 'items' ] ] == [ 'a{}'.format( i ) for i in range( 9, -1, -1 ) ]
+
+
+def test_paging_is_stable_when_records_change():
+    records = _records()
+    first = SimQuery( limit = 3 ).apply( records )
+
+    # Items added before or removed from the current position do not shift the next page.
+    records = [ r for r in records if r[ 'id' ] != 'a1' ] + [ dict( id = 'a00', state = 'up' ) ]
+    second = SimQuery( limit = 3, cursor = first[ 'next' ] ).apply( records )
+
+    assert [ i[ 'id' ] for i in first[ 'items' ] ] == [ 'a0', 'a1', 'a2' ]
+    assert [ i[ 'id' ] for i in second[ 'items' ] ] == [ 'a3', 'a4', 'a5' ]
+
+
+def test_filters():
+    page = SimQuery( states = [ 'up' ], created_after = '2024-01-01T00:00:53Z' ).apply( _records() )
+    assert [ i[ 'id' ] for i in page[ 'items' ] ] == [ 'a1', 'a3', 'a5' ]
+
+    page = SimQuery( id_prefix = 'a1' ).apply( _records() + [ dict( id = 'b1', state = 'up' ) ] )
+    assert [ i[ 'id' ] for i in page[ 'items' ] ] == [ 'a1' ]
+
+
+def test_fields():
+    page = SimQuery( fields = [ 'state' ], limit = 1 ).apply( _records() )
+    assert page[ 'items' ] == [ dict( id = 'a0', state = 'down' ) ]
+
+
+def test_invalid_parameters():
+    with pytest.raises( ValueError ):
+        SimQuery( states = [ 'running' ] )
+    with pytest.raises( ValueError ):
+        SimQuery( sort = 'status' )
+    with pytest.raises( ValueError ):
+        SimQuery( limit = 0 )
+    with pytest.raises( ValueError ):
+        SimQuery( limit = True )
+    with pytest.raises( ValueError ):
+        SimQuery( cursor = 'not a cursor' )
+
+    # A forged cursor whose key cannot be compared with the sort keys of this query.
+    with pytest.raises( ValueError ):
+        SimQuery( sort = 'state', cursor = encode_cursor( [ 'a1', 'a1' ], 'state', False ) ).apply( _records() )
+
+
+def test_cursor_of_other_sort_order():
+    # Regression test: a cursor must not be reused with another sort order, which would silently return wrong pages.
+    cursor = SimQuery( limit = 2 ).apply( _records() )[ 'next' ]
+    assert cursor is not None
+    assert SimQuery( limit = 2, cursor = cursor ).apply( _records() )[ 'items' ]
+
+    with pytest.raises( ValueError ):
+        SimQuery( limit = 2, sort = 'created', cursor = cursor )
+    with pytest.raises( ValueError ):
+        SimQuery( limit = 2, descending = True, cursor = cursor )
+
+
+def test_needs_created():
+    assert not SimQuery().needs_created
+    assert not SimQuery( fields = [ 'state', 'status' ] ).needs_created
+    assert SimQuery( fields = [ 'created' ] ).needs_created
+    assert SimQuery( sort = 'created' ).needs_created
+    assert SimQuery( created_before = '2024-01-01T00:00:00Z' ).needs_created
+
+
+def test_cursor_round_trip():
+    assert decode_cursor( encode_cursor( [ 1, 'a1' ], 'state', True ), 'state', True ) == [ 1, 'a1' ]
+
+
+def test_parse_time():
+    assert parse_time( '2024-01-01T00:00:00Z' ) == parse_time( '2024-01-01T01:00:00+01:00' )
+    assert parse_time( '2024-01-01T00:00:00' ) == parse_time( '2024-01-01T00:00:00Z' )
+    with pytest.raises( ValueError ):
+        parse_time( 'yesterday' )
@@ -0,0 +1,111 @@
+'''
+Tests for version-stamped simulation status snapshots
+'''
+import pytest
+
+from mosaik_docker_jl import status_snapshots as status_snapshots_module
+from mosaik_docker_jl.status_snapshots import StatusSnapshots, normalize_status
+
+
+def _status( up = None, down = None ):
+    return dict( up = up or {}, down = down or {} )
+
+
+def test_version_only_changes_with_status( tmp_path ):
+    snapshots = StatusSnapshots()
+    assert snapshots.version( tmp_path ) is None
+
+    v1 = snapshots.update( tmp_path, _status( up = { 's1': 'Up 1 second' } ) )
+    assert snapshots.update( tmp_path, _status( up = { 's1': 'Up 1 second' } ) ) == v1
+
+    # Relative times in status strings are not considered as changes.
+    assert snapshots.update( tmp_path, _status( up = { 's1': 'Up 2 seconds' } ) ) == v1
+
+    v2 = snapshots.update( tmp_path, _status( up = { 's1': 'Up 3 seconds (Paused)' } ) )
+    assert v2 == v1 + 1
+    assert snapshots.version( tmp_path ) == v2
+
+    v3 = snapshots.update( tmp_path, _status( down = { 's1': 'Exited (0) 1 second ago' } ) )
+    assert snapshots.update( tmp_path, _status( down = { 's1': 'Exited (0) 5 minutes ago' } ) ) == v3
+    assert snapshots.changes_since( tmp_path, v2 ) == dict( up = {}, down = { 's1': 'Exited (0) 1 second ago' }, removed = [] )
+
+
+@pytest.mark.parametrize( 'status, normalized', [
+    ( 'Up 3 minutes', 'Up' ),
+    ( 'Up About an hour (Paused)', 'Up (Paused)' ),
+    ( 'Exited (137) 5 minutes ago', 'Exited (137)' ),
+    ( 'Created', 'Created' ),
+    ( '', '' ),
+] )
+def test_normalize_status( status, normalized ):
+    assert normalize_status( status ) == normalized
+
+
+def test_current_version( monkeypatch ):
+    now = [ 1000. ]
+    monkeypatch.setattr( status_snapshots_module.time, 'monotonic', lambda: now[0] )
+
+    snapshots = StatusSnapshots( max_age = 2. )
+    assert snapshots.current_version( 'setup' ) is None
+
+    v1 = snapshots.update( 'setup', _status( up = { 's1': 'Up' } ) )
+    now[0] += 1.
+    assert snapshots.current_version( 'setup' ) == v1
+
+    # Snapshots older than the maximum age have to be refreshed from Docker.
+    now[0] += 1.5
+    assert snapshots.current_version( 'setup' ) is None
+    snapshots.update( 'setup', _status( up = { 's1': 'Up' } ) )
+    assert snapshots.current_version( 'setup' ) == v1
+
+
+def test_changes_since():
+    snapshots = StatusSnapshots()
+    v1 = snapshots.update( 'setup', _status( up = { 's1': 'Up', 's2': 'Up' } ) )
+    snapshots.update( 'setup', _status( up = { 's2': 'Up' }, down = { 's1': 'Exited (0)' } ) )
+    v3 = snapshots.update( 'setup', _status( up = { 's3': 'Up' }, down = { 's1': 'Exited (0)' } ) )
+
+    assert snapshots.changes_since( 'setup', v3 ) == dict( up = {}, down = {}, removed = [] )
+    assert snapshots.changes_since( 'setup', v1 ) == dict(
+        up = { 's3': 'Up' }, down = { 's1': 'Exited (0)' }, removed = [ 's2' ]
+    )
+
+
+def test_simulations_only_listed_under_latest_state():
+    snapshots = StatusSnapshots()
+    v1 = snapshots.update( 'setup', _status() )
+    snapshots.update( 'setup', _status( up = { 's1': 'Up' } ) )
+    snapshots.update( 'setup', _status( down = { 's1': 'Exited (0)' } ) )
+    snapshots.update( 'setup', _status() )
+    snapshots.update( 'setup', _status( up = { 's1': 'Up' } ) )
+
+    assert snapshots.changes_since( 'setup', v1 ) == dict( up = { 's1': 'Up' }, down = {}, removed = [] )
+
+
+def test_unavailable_changes():
+    snapshots = StatusSnapshots( max_change_log_length = 2 )
+    assert snapshots.changes_since( 'setup', 0 ) is None
+
+    v1 = snapshots.update( 'setup', _status() )
+    for i in range( 3 ):
+        snapshots.update( 'setup', _status( up = { 's{}'.format( i ): 'Up' } ) )
+
+    # Versions from the future (e.g., of another server process) and dropped changes are unknown.
+    assert snapshots.changes_since( 'setup', v1 + 10 ) is None
+    assert snapshots.changes_since( 'setup', v1 ) is None
+    assert snapshots.changes_since( 'setup', v1 + 1 ) is not None
+
+
+def test_newly_finished_simulations():
+    snapshots = StatusSnapshots()
+
+    # Without a previous snapshot, all finished simulations are reported.
+    _, finished = snapshots.update_with_finished( 'setup', _status( up = { 's2': 'Up' }, down = { 's1': 'Exited (0) 5 minutes ago' } ) )
+    assert finished == [ 's1' ]
+
+    _, finished = snapshots.update_with_finished( 'setup', _status( down = { 's1': 'Exited (0) 6 minutes ago', 's2': 'Exited (1)' } ) )
+    assert finished == [ 's2' ]
+
+    # Changed status strings of simulations that have already finished are not reported again.
+    _, finished = snapshots.update_with_finished( 'setup', _status( down = { 's1': 'Exited (0) 7 minutes ago', 's2': 'Exited (1) 1 minute ago' } ) )
+    assert finished == []
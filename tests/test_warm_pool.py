@@ -0,0 +1,168 @@
+'''
+Tests for the bookkeeping of pools of pre-created simulation containers (Docker is not used)
+'''
+import json
+import os
+import time
+
+import pytest
+
+from mosaik_docker_jl.warm_pool import WarmPool
+
+FINGERPRINT = ( 'sha256:abc', 'scenario.py' )
+
+
+class _Pool( WarmPool ):
+    '''
+    Pool recording the docker commands instead of executing them.
+    '''
+
+    def __init__( self, size = 2, max_idle = 600. ):
+        super().__init__( 'unix:///x', size, max_idle )
+        self.fingerprint = FINGERPRINT
+        self.existing = []
+        self.commands = []
+        self.removed = []
+        self.on_create = None
+        self.fail = set()
+
+    def _fingerprint( self, config_data ):
+        return self.fingerprint
+
+    def _list_containers( self, prefix ):
+        return [ c for c in self.existing if c[0].startswith( prefix ) ]
+
+    def _remove( self, names ):
+        self.removed.extend( names )
+
+    def _docker( self, *args ):
+        self.commands.append( args )
+        if args[0] in self.fail:
+            raise Exception( '{} failed'.format( args[0] ) )
+        if 'create' == args[0] and self.on_create is not None:
+            on_create, self.on_create = self.on_create, None
+            on_create()
+
+    def created( self ):
+        return [ c[2] for c in self.commands if 'create' == c[0] ]
+
+    def containers( self, dir ):
+        return [ c[ 'name' ] for c in self._pools[ os.path.realpath( dir ) ][ 'containers' ] ]
+
+
+@pytest.fixture
+def pool():
+    pool = _Pool()
+    yield pool
+    pool.close()
+
+
+def test_refill_and_start( pool, sim_setup ):
+    pool.refill( str( sim_setup ) )
+    created = pool.created()
+    assert 2 == len( created )
+    assert all( name.startswith( 'mdjl-warm-abc123-' ) for name in created )
+    assert pool.containers( sim_setup ) == created
+
+    # The pool is full.
+    pool.refill( str( sim_setup ) )
+    assert pool.created() == created
+
+    id = pool.start_sim( str( sim_setup ) )
+    assert pool.commands[-2:] == [ ( 'rename', created[0], id ), ( 'start', id ) ]
+    assert pool.containers( sim_setup ) == created[1:]
+    assert json.loads( ( sim_setup / 'mosaik-docker.json' ).read_text() )[ 'sim_ids_up' ] == [ id ]
+
+
+def test_no_containers( pool, sim_setup ):
+    assert pool.start_sim( str( sim_setup ) ) is None
+
+    # Without orchestrator image, no containers are created.
+    pool.fingerprint = None
+    pool.refill( str( sim_setup ) )
+    assert pool.created() == []
+    assert pool.start_sim( str( sim_setup ) ) is None
+
+
+def test_take_stale( pool ):
+    now = time.monotonic()
+    entry = dict( containers = [
+        dict( name = 'current', fingerprint = FINGERPRINT, created = now ),
+        dict( name = 'rebuilt', fingerprint = ( 'sha256:old', 'scenario.py' ), created = now ),
+        dict( name = 'reconfigured', fingerprint = ( 'sha256:abc', 'other.py' ), created = now ),
+        dict( name = 'idle', fingerprint = FINGERPRINT, created = now - 601. ),
+    ] )
+
+    assert pool._take_stale( entry, FINGERPRINT ) == [ 'rebuilt', 'reconfigured', 'idle' ]
+    assert [ c[ 'name' ] for c in entry[ 'containers' ] ] == [ 'current' ]
+
+
+def test_stale_containers_are_replaced( pool, sim_setup ):
+    pool.refill( str( sim_setup ) )
+    old = pool.created()
+
+    pool.fingerprint = ( 'sha256:new', 'scenario.py' )
+    pool.refill( str( sim_setup ) )
+    assert pool.removed == old
+    assert 4 == len( pool.created() )
+    assert [ c[-1] for c in pool.commands if 'create' == c[0] ][2:] == [ 'sha256:new', 'sha256:new' ]
+
+    # Stale containers are not started.
+    pool.fingerprint = ( 'sha256:newer', 'scenario.py' )
+    assert pool.start_sim( str( sim_setup ) ) is None
+    assert pool.containers( sim_setup ) == []
+
+
+def test_containers_of_other_processes_are_removed( pool, sim_setup ):
+    pool.existing = [ ( 'mdjl-warm-abc123-1', 'previous' ), ( 'mdjl-warm-abc123-2', pool._owner ), ( 'mdjl-warm-other-3', 'previous' ) ]
+
+    pool.refill( str( sim_setup ) )
+    assert pool.removed == [ 'mdjl-warm-abc123-1' ]
+
+    # Only when the pool is refilled for the first time.
+    pool.existing.append( ( 'mdjl-warm-abc123-4', 'previous' ) )
+    pool.start_sim( str( sim_setup ) )
+    pool.refill( str( sim_setup ) )
+    assert pool.removed == [ 'mdjl-warm-abc123-1' ]
+    assert 3 == len( pool.created() )
+
+
+def test_concurrent_refill( pool, sim_setup ):
+    # Containers being created by another refill count as part of the pool.
+    pool.on_create = lambda: pool.refill( str( sim_setup ) )
+    pool.refill( str( sim_setup ) )
+
+    assert 2 == len( pool.created() )
+    assert 0 == pool._pools[ os.path.realpath( sim_setup ) ][ 'pending' ]
+
+
+def test_drain_during_refill( pool, sim_setup ):
+    pool.on_create = lambda: pool.drain( str( sim_setup ) )
+    pool.refill( str( sim_setup ) )
+
+    # The container created for the drained pool is removed and no further containers are created.
+    assert pool.removed == pool.created()
+    assert 1 == len( pool.created() )
+    assert os.path.realpath( sim_setup ) not in pool._pools
+
+
+def test_failed_create( pool, sim_setup ):
+    pool.fail.add( 'create' )
+    with pytest.raises( Exception, match = 'create failed' ):
+        pool.refill( str( sim_setup ) )
+    assert 0 == pool._pools[ os.path.realpath( sim_setup ) ][ 'pending' ]
+
+    pool.fail.clear()
+    pool.refill( str( sim_setup ) )
+    assert 2 == len( pool.containers( sim_setup ) )
+
+
+@pytest.mark.parametrize( 'command', [ 'rename', 'start' ] )
+def test_failed_start( pool, sim_setup, command ):
+    pool.refill( str( sim_setup ) )
+    container = pool.containers( sim_setup )[0]
+    pool.fail.add( command )
+
+    assert pool.start_sim( str( sim_setup ) ) is None
+    assert pool.removed == [ container if 'rename' == command else pool.commands[-1][1] ]
+    assert json.loads( ( sim_setup / 'mosaik-docker.json' ).read_text() )[ 'sim_ids_up' ] == []